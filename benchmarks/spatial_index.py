@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Micro-benchmark of the radius queries of the spherical grid
+index against the haversine scan of the whole catalogue.
+
+Usage: python benchmarks/spatial_index.py [events] [queries] [radius]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from mtoolkit.scientific.catalogue_utilities import (DerivedColumns,
+                                                        haversine_to_point)
+from mtoolkit.scientific.spatial_index import SphericalGridIndex
+
+
+def random_catalogue(events, seed=0):
+    """
+    Return longitude and latitude of events clustered
+    around random centres, as in a seismic catalogue.
+    """
+
+    rng = np.random.RandomState(seed)
+    centres = rng.randint(0, 200, events)
+    centre_lon = rng.uniform(-180., 180., 200)
+    centre_lat = np.degrees(np.arcsin(rng.uniform(-1., 1., 200)))
+    longitude = (centre_lon[centres] + rng.normal(0., 2., events) + 180.) % \
+        360. - 180.
+    latitude = np.clip(centre_lat[centres] + rng.normal(0., 2., events),
+        -90., 90.)
+    return longitude, latitude
+
+
+def main(events=200000, queries=500, radius=50.):
+    """Run the benchmark and print the timings"""
+
+    longitude, latitude = random_catalogue(events)
+    derived = DerivedColumns.from_locations(longitude, latitude)
+    rows = np.random.RandomState(1).randint(0, events, queries)
+
+    start = time.time()
+    scanned = [np.flatnonzero(haversine_to_point(longitude, latitude,
+        longitude[i], latitude[i]) <= radius) for i in rows]
+    scan_time = time.time() - start
+
+    start = time.time()
+    index = SphericalGridIndex(derived, radius)
+    build_time = time.time() - start
+
+    start = time.time()
+    indexed = index.query_rows(rows, radius)
+    query_time = time.time() - start
+
+    assert all(np.array_equal(expected, result)
+        for expected, result in zip(scanned, indexed))
+    print 'events: %d, queries: %d, radius: %g km' % (events, queries,
+        radius)
+    print 'haversine scan: %.3f s' % scan_time
+    print 'index build: %.3f s, queries: %.3f s (%.1fx)' % (build_time,
+        query_time, scan_time / query_time)
+
+
+if __name__ == '__main__':
+    main(*[float(arg) if i == 2 else int(arg)
+        for i, arg in enumerate(sys.argv[1:])])
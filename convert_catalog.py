@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+from mtoolkit.console import build_convert_cmd_parser
+
+from mtoolkit.catalog_store import convert_catalog
+
+
+if __name__ == '__main__':
+
+    CMD_LINE_ARGS = build_convert_cmd_parser().parse_args()
+
+    STORE = convert_catalog(CMD_LINE_ARGS.eq_catalog_file,
+        CMD_LINE_ARGS.catalog_store, CMD_LINE_ARGS.partition_years,
+        CMD_LINE_ARGS.chunk_size)
+
+    print 'Stored %s eq entries in %s partitions' % (
+        sum(partition['rows'] for partition in STORE.partitions),
+        len(STORE.partitions))
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The purpose of this module is to provide objects
+capable of streaming the events of QuakeML and
+ISF (IMS1.0) bulletins into eq entries, without
+converting them to a csv catalogue first.
+"""
+
+import abc
+import re
+import math
+import hashlib
+import logging
+
+from lxml import etree
+
+from mtoolkit.eqcatalog import (EqEntryReader, EqEntryValidationError,
+                                FIELDNAMES)
+
+LOGGER = logging.getLogger('mt_logger')
+
+# Magnitude types (lower case) stored in each magnitude field
+MAGNITUDE_FIELDS = {'mw': 'Mw', 'mww': 'Mw', 'mwc': 'Mw', 'mwb': 'Mw',
+                    'mwr': 'Mw', 'ms': 'Ms', 'ms_20': 'Ms', 'msz': 'Ms',
+                    'mb': 'mb', 'ml': 'ML'}
+SIGMA_FIELDS = {'Mw': 'sigmaMw', 'Ms': 'sigmaMs', 'mb': 'sigmamb',
+                'ML': 'sigmaML'}
+
+# Confidence level of the epicentre error ellipse
+ERROR_ELLIPSE_CONFIDENCE = 90.
+
+QUAKEML_TIME = re.compile(
+    r'\s*(-?\d+)-(\d+)-(\d+)T(\d+):(\d+):(\d+(?:\.\d*)?)')
+NUMERIC_ID = re.compile(r'(\d+)\s*$')
+# Hexadecimal digits of the hash of a publicID used as eventID,
+# a positive int64 above the usual numeric ids of the agencies
+HASHED_ID_DIGITS = 15
+
+# Fixed columns of the IMS1.0 origin and magnitude lines
+ISF_ORIGIN = re.compile(r'\d{4}/\d\d/\d\d ')
+ISF_ORIGIN_COLUMNS = {'date': (0, 10), 'time': (11, 22),
+                      'timeError': (24, 29), 'latitude': (36, 44),
+                      'longitude': (45, 54), 'SemiMajor90': (55, 60),
+                      'SemiMinor90': (61, 66), 'ErrorStrike': (67, 70),
+                      'depth': (71, 76), 'depthError': (78, 82),
+                      'Agency': (118, 127), 'Identifier': (128, 136)}
+ISF_MAGNITUDE_COLUMNS = {'type': (0, 5), 'value': (6, 10),
+                         'error': (11, 14), 'origin': (30, 38)}
+
+
+class BulletinReader(EqEntryReader):
+    """
+    BulletinReader is the base of the readers of eq
+    bulletins, whose events are streamed as rows of
+    strings ordered as FIELDNAMES and validated as
+    the rows of a csv catalogue. The line number of
+    a validation error is the line where the invalid
+    event starts in the bulletin.
+    """
+    __metaclass__ = abc.ABCMeta
+
+    def __init__(self, eq_entries_source, fields=None, predicates=None):
+        EqEntryReader.__init__(self, eq_entries_source, fields, predicates)
+        # line numbers of the rows streamed but not converted yet
+        self._row_lines = []
+
+    @classmethod
+    def validate_csv_catalog(cls, eq_entries_source):
+        """Bulletins have no csv header to validate"""
+
+    @abc.abstractmethod
+    def events(self):
+        """
+        Return an iterator over the (line number,
+        row) pairs of the events of the bulletin.
+        """
+        return
+
+    def _numbered_lines(self):
+        for line_number, row in self.events():
+            yield line_number, dict(zip(FIELDNAMES, row))
+
+    def _rows(self):
+        for line_number, row in self.events():
+            self._row_lines.append(line_number)
+            yield row
+
+    def _estimated_rows(self, rows):
+        # The size of a bulletin doesn't tell its number of events
+        return 0
+
+    def _convert_block(self, rows, first_line):
+        lines = self._row_lines[:len(rows)]
+        del self._row_lines[:len(rows)]
+        try:
+            return EqEntryReader._convert_block(self, rows, 0)
+        except EqEntryValidationError as exc:
+            raise EqEntryValidationError(exc.field, exc.value,
+                lines[exc.line_number])
+
+
+class QuakeMLReader(BulletinReader):
+    """
+    QuakeMLReader streams the events of a QuakeML
+    bulletin, every parsed event element is cleared,
+    so that the memory used doesn't grow with the
+    size of the bulletin. Each event is mapped to
+    its preferred origin (the first one if not
+    given) and to the first magnitude of each
+    type, preferring the preferred magnitude and
+    the ones of the preferred origin. Events
+    without a publicID, or whose eventID is the
+    one of an event with another publicID, are
+    skipped and reported.
+    """
+
+    def __init__(self, eq_entries_source, fields=None, predicates=None):
+        BulletinReader.__init__(self, eq_entries_source, fields,
+            predicates)
+        # publicID of the event given each eventID
+        self._public_ids = {}
+
+    def events(self):
+        for _, event in etree.iterparse(self.eq_entries_source,
+            events=('end',), tag='{*}event'):
+
+            public_id = (event.get('publicID') or '').strip()
+            row = _quakeml_row(event)
+            event_id = row[FIELDNAMES.index('eventID')]
+            if not public_id:
+                LOGGER.warning("* QuakeML event at line %s skipped: "
+                    "no publicID" % event.sourceline)
+            elif self._public_ids.setdefault(event_id,
+                public_id) != public_id:
+                LOGGER.warning("* QuakeML event %s skipped: eventID %s "
+                    "of event %s" % (public_id, event_id,
+                        self._public_ids[event_id]))
+            else:
+                yield event.sourceline, row
+
+            event.clear()
+            # the parsed events are removed from the tree
+            while event.getprevious() is not None:
+                del event.getparent()[0]
+
+
+class ISFReader(BulletinReader):
+    """
+    ISFReader streams the events of an ISF (IMS1.0)
+    bulletin line by line. Each event is mapped to
+    its prime origin (the last one if not marked)
+    and to the first magnitude of each type,
+    preferring the ones of the prime origin.
+    """
+
+    def events(self):
+        event = None
+        magnitude_block = False
+        for line_number, line in enumerate(self.eq_entries_source, start=1):
+            line = line.rstrip('\r\n')
+            if line.startswith('Event ') or line.startswith('STOP'):
+                if event is not None:
+                    yield event[0], _isf_row(*event[1:])
+                event = None
+                magnitude_block = False
+                if line.startswith('Event '):
+                    # line number, event id, origins, prime origin,
+                    # magnitudes
+                    event = [line_number, line.split()[1], [], None, []]
+            elif event is None:
+                continue
+            elif line.startswith('Magnitude'):
+                magnitude_block = True
+            elif not line.strip():
+                magnitude_block = False
+            elif magnitude_block:
+                event[4].append(line)
+            elif ISF_ORIGIN.match(line):
+                event[2].append(line)
+            elif line.strip() == '(#PRIME)' and event[2]:
+                event[3] = len(event[2]) - 1
+
+        if event is not None:
+            yield event[0], _isf_row(*event[1:])
+
+
+# Readers of the bulletin formats detected by catalog_format
+BULLETIN_READERS = {'quakeml': QuakeMLReader, 'isf': ISFReader}
+
+
+def _quakeml_row(event):
+    """
+    Return the row of strings of a QuakeML event element.
+    The eventID is the numeric id ending the publicID of
+    the event, or the hashed publicID if it doesn't end
+    in digits, so that it doesn't depend on the position
+    of the event in the bulletin.
+    """
+
+    values = dict.fromkeys(FIELDNAMES, '')
+    public_id = (event.get('publicID') or '').strip()
+    values['eventID'] = _numeric_id(public_id) or _hashed_id(public_id)
+
+    origin = _preferred(event.findall('{*}origin'),
+        _text(event, '{*}preferredOriginID'))
+    origin_id = None
+    if origin is not None:
+        origin_id = origin.get('publicID')
+        values['Identifier'] = _numeric_id(origin_id) or values['eventID']
+        values['Agency'] = (origin.findtext('{*}creationInfo/{*}agencyID')
+            or event.findtext('{*}creationInfo/{*}agencyID') or '').strip()
+
+        time = origin.findtext('{*}time/{*}value') or ''
+        match = QUAKEML_TIME.match(time)
+        if match is None:
+            values['year'] = time
+        else:
+            values.update(zip(['year', 'month', 'day', 'hour', 'minute',
+                'second'], match.groups()))
+        values['timeError'] = _text(origin, '{*}time/{*}uncertainty')
+        values['longitude'] = _text(origin, '{*}longitude/{*}value')
+        values['latitude'] = _text(origin, '{*}latitude/{*}value')
+        # QuakeML lengths are in meters
+        values['depth'] = _scaled(_text(origin, '{*}depth/{*}value'), 1e-3)
+        values['depthError'] = _scaled(
+            _text(origin, '{*}depth/{*}uncertainty'), 1e-3)
+
+        uncertainty = origin.find('{*}originUncertainty')
+        if uncertainty is not None:
+            scale = 1e-3 * _ellipse_scale(
+                _text(uncertainty, '{*}confidenceLevel'))
+            values['SemiMajor90'] = _scaled(
+                _text(uncertainty, '{*}maxHorizontalUncertainty'), scale)
+            values['SemiMinor90'] = _scaled(
+                _text(uncertainty, '{*}minHorizontalUncertainty'), scale)
+            values['ErrorStrike'] = _text(uncertainty,
+                '{*}azimuthMaxHorizontalUncertainty')
+
+    magnitudes = event.findall('{*}magnitude')
+    preferred_id = _text(event, '{*}preferredMagnitudeID')
+    # preferred magnitude first, then the ones of the origin
+    magnitudes.sort(key=lambda magnitude: (
+        magnitude.get('publicID') != preferred_id,
+        _text(magnitude, '{*}originID') != origin_id))
+    for magnitude in magnitudes:
+        _set_magnitude(values, magnitude.findtext('{*}type'),
+            _text(magnitude, '{*}mag/{*}value'),
+            _text(magnitude, '{*}mag/{*}uncertainty'))
+
+    return [values[field] for field in FIELDNAMES]
+
+
+def _isf_row(event_id, origins, prime, magnitudes):
+    """
+    Return the row of strings of an ISF event, given its
+    origin lines, the index of the prime origin (None if
+    not marked) and the magnitude lines.
+    """
+
+    values = dict.fromkeys(FIELDNAMES, '')
+    values['eventID'] = event_id
+    origin_id = None
+    if origins:
+        origin = origins[-1 if prime is None else prime]
+        for field, columns in ISF_ORIGIN_COLUMNS.items():
+            values[field] = _isf_value(origin, columns)
+
+        origin_id = values['Identifier']
+        values['Identifier'] = _numeric_id(origin_id) or event_id
+        values['year'], values['month'], values['day'] = \
+            values.pop('date').split('/')
+        time = values.pop('time').split(':')
+        values.update(zip(['hour', 'minute', 'second'], time))
+
+    # magnitudes of the prime origin first
+    magnitudes = sorted(magnitudes, key=lambda magnitude:
+        _isf_value(magnitude, ISF_MAGNITUDE_COLUMNS['origin']) != origin_id)
+    for magnitude in magnitudes:
+        _set_magnitude(values,
+            _isf_value(magnitude, ISF_MAGNITUDE_COLUMNS['type']),
+            _isf_value(magnitude, ISF_MAGNITUDE_COLUMNS['value']),
+            _isf_value(magnitude, ISF_MAGNITUDE_COLUMNS['error']))
+
+    return [values[field] for field in FIELDNAMES]
+
+
+def _set_magnitude(values, magnitude_type, value, sigma):
+    """
+    Set the magnitude field of the given type
+    and its sigma, if not already set.
+    """
+
+    field = MAGNITUDE_FIELDS.get((magnitude_type or '').strip().lower())
+    if field is not None and not values[field]:
+        values[field] = value
+        values[SIGMA_FIELDS[field]] = sigma
+
+
+def _preferred(elements, preferred_id):
+    """
+    Return the element having the preferred
+    publicID, the first one if not found.
+    """
+
+    for element in elements:
+        if element.get('publicID') == preferred_id:
+            return element
+    return elements[0] if elements else None
+
+
+def _numeric_id(public_id):
+    """
+    Return the digits ending an identifier,
+    an empty string if there aren't any.
+    """
+
+    match = NUMERIC_ID.search(public_id or '')
+    return match.group(1) if match else ''
+
+
+def _hashed_id(public_id):
+    """
+    Return the positive numeric id, as a string,
+    derived from the hash of an identifier.
+    """
+
+    digest = hashlib.sha1(public_id.encode('utf-8')).hexdigest()
+    return str(int(digest[:HASHED_ID_DIGITS], 16) + 1)
+
+
+def _text(element, path):
+    """Return the stripped text of a subelement"""
+
+    return (element.findtext(path) or '').strip()
+
+
+def _isf_value(line, columns):
+    """Return the stripped value of the given fixed columns"""
+
+    return line[columns[0]:columns[1]].strip()
+
+
+def _scaled(value, scale):
+    """
+    Return the string of a float value multiplied
+    by scale, values which aren't floats are kept
+    so that their validation fails as usual.
+    """
+
+    try:
+        return repr(float(value) * scale)
+    except ValueError:
+        return value
+
+
+def _ellipse_scale(confidence):
+    """
+    Return the factor scaling the axes of an error
+    ellipse of the given confidence level (percent,
+    90 if not given) to ERROR_ELLIPSE_CONFIDENCE.
+    """
+
+    try:
+        confidence = float(confidence) / 100.
+    except ValueError:
+        return 1.
+    if not 0 < confidence < 1:
+        return 1.
+    # the squared axes scale as the chi-square quantiles
+    # with 2 degrees of freedom, i.e. -2 log(1 - confidence)
+    return math.sqrt(math.log(1 - ERROR_ELLIPSE_CONFIDENCE / 100.) /
+        math.log(1 - confidence))
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The purpose of this module is to provide objects
+to store validated earthquake catalogues in a binary
+format, in order to skip the parsing of unchanged
+csv catalogues. A checkpoint stored with each
+catalogue allows to parse only the rows appended
+to the csv file since the catalogue was stored.
+"""
+
+import os
+import shutil
+import hashlib
+import tempfile
+from datetime import datetime as time
+
+import yaml
+import numpy as np
+
+from mtoolkit.eqcatalog import (EqCatalog, VALIDATION_RULES_VERSION,
+                                catalog_compression, catalog_format)
+
+READ_BLOCK_SIZE = 1 << 20
+CATALOG_FILE = 'catalog.npy'
+CHECKPOINT_FILE = 'checkpoint.yml'
+# Version of the cached catalog format
+CACHE_VERSION = 3
+
+
+class EqCatalogCache(object):
+    """
+    EqCatalogCache stores earthquake catalogues
+    in a directory, every catalogue store (see
+    EqCatalog) is saved as a npy file which is
+    memory mapped when loaded, together with the
+    checkpoint of the parsed csv file (see
+    create_checkpoint). Catalogues are identified
+    by a key computed from the csv filename, the
+    read fields and the version of the validation
+    rules, so that changed rules never hit a stale
+    catalogue.
+    """
+
+    def __init__(self, cache_dir):
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.cache_dir = cache_dir
+
+    def key(self, filename, fields=None, predicates=None):
+        """
+        Return the key identifying the catalogue
+        built from the given csv file, reading
+        the given fields (None means all) of the
+        rows selected by the given predicates.
+        """
+
+        digest = hashlib.sha1()
+        # check_year accepts years up to the current one
+        digest.update('%s-%s-%s' % (CACHE_VERSION,
+            VALIDATION_RULES_VERSION, time.now().year))
+        digest.update('-%s-' % os.path.abspath(filename))
+        if fields is not None:
+            digest.update('-%s-' % ','.join(fields))
+        if predicates is not None:
+            digest.update('-%r-' % predicates)
+        return digest.hexdigest()
+
+    def load(self, key):
+        """
+        Return the cached catalogue identified by key
+        and its checkpoint, None if the catalogue is
+        not in the cache.
+        """
+
+        catalog_dir = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(catalog_dir):
+            return None
+
+        with open(os.path.join(catalog_dir, CHECKPOINT_FILE)) as checkpoint:
+            checkpoint = yaml.safe_load(checkpoint)
+        return (EqCatalog(load_store(os.path.join(catalog_dir,
+            CATALOG_FILE))), checkpoint)
+
+    def store(self, key, eq_catalog, checkpoint):
+        """
+        Store the catalogue and its checkpoint in
+        the cache using the given key, replacing
+        the previously stored catalogue.
+        """
+
+        catalog_dir = os.path.join(self.cache_dir, key)
+
+        # The store is written in a temporary directory renamed
+        # at the end, a partially written catalogue is never loaded
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir)
+        old_dir = tempfile.mkdtemp(dir=self.cache_dir)
+        try:
+            np.save(os.path.join(tmp_dir, CATALOG_FILE), eq_catalog.data)
+            with open(os.path.join(tmp_dir, CHECKPOINT_FILE), 'w') as \
+                checkpoint_file:
+                yaml.safe_dump(checkpoint, checkpoint_file)
+
+            if os.path.isdir(catalog_dir):
+                # Memory mapped stores stay valid after the rename
+                os.rename(catalog_dir, os.path.join(old_dir, key))
+            os.rename(tmp_dir, catalog_dir)
+        except OSError:
+            # Stored by a concurrent run
+            if not os.path.isdir(catalog_dir):
+                raise
+        finally:
+            for directory in [tmp_dir, old_dir]:
+                if os.path.isdir(directory):
+                    shutil.rmtree(directory)
+
+
+def create_checkpoint(filename, offset, line_number):
+    """
+    Return the checkpoint of a csv file parsed up
+    to the given byte offset, line_number is the
+    line number of the next row. The checkpoint
+    stores the hash of the parsed bytes, to detect
+    changes of the parsed rows.
+    """
+
+    with open(filename, 'rb') as catalog_file:
+        prefix_sha1 = _sha1(catalog_file, offset)
+        # Rows can't be appended to compressed files and bulletins
+        complete = (catalog_compression(filename) is None and
+            catalog_format(filename) == 'csv')
+        if offset and complete:
+            catalog_file.seek(offset - 1)
+            complete = catalog_file.read(1) == '\n'
+
+    return {'offset': offset, 'line_number': line_number,
+            'prefix_sha1': prefix_sha1, 'complete': complete}
+
+
+def appended_offset(filename, checkpoint):
+    """
+    Return the byte offset of the rows appended
+    to the csv file after the checkpoint, None
+    if the rows parsed before it have changed.
+    """
+
+    size = os.path.getsize(filename)
+    offset = checkpoint['offset']
+    if size < offset:
+        return None
+    # A partially written last row can't be completed
+    if size > offset and not checkpoint['complete']:
+        return None
+
+    with open(filename, 'rb') as catalog_file:
+        if _sha1(catalog_file, offset) != checkpoint['prefix_sha1']:
+            return None
+    return offset
+
+
+def _sha1(catalog_file, size):
+    """Return the sha1 of the first size bytes of a file"""
+
+    digest = hashlib.sha1()
+    while size > 0:
+        block = catalog_file.read(min(size, READ_BLOCK_SIZE))
+        if not block:
+            break
+        digest.update(block)
+        size -= len(block)
+    return digest.hexdigest()
+
+
+def load_store(filename):
+    """
+    Load a catalog store memory mapping it,
+    empty stores can't be memory mapped.
+    """
+
+    try:
+        return np.load(filename, mmap_mode='r')
+    except ValueError:
+        return np.load(filename)
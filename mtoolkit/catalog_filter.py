@@ -26,6 +26,8 @@ from shapely.geometry import Point, Polygon
 import numpy as np
 import logging
 
+from mtoolkit.scientific.catalogue_utilities import points_in_polygon
+
 LOGGER = logging.getLogger('mt_logger')
 
 
@@ -41,6 +43,16 @@ class CatalogFilter(object):
         if sm_filter is None:
             self.sm_filter = NullCatalogFilter()
 
+    def select_eqs(self, sm_definitions, eq_catalog):
+        """
+        Return an iterator over the (source model, boolean
+        vector) pairs denoting the eq events of the catalog
+        in each source model.
+        """
+
+        for sm in sm_definitions:
+            yield sm, self.sm_filter.select_eqs(sm, eq_catalog)
+
     def filter_eqs(self, sm_definitions, eq_catalog):
         """
         Apply filtering to eq catalog
@@ -60,31 +72,61 @@ class SourceModelCatalogFilter(object):
     POINT_LATITUDE_INDEX = 4
     POINT_LONGITUDE_INDEX = 3
 
-    def filter_eqs(self, source, eq_catalog):
+    def select_eqs(self, source, eq_catalog):
         """
-        Filter eq events contained in
-        the polygon
+        Return a boolean vector denoting the
+        eq events contained in the polygon,
+        the events closer to the boundary than
+        the rounding errors of the vectorized
+        test are checked by shapely.
         """
 
         polygon = _extract_polygon(source)
         _check_polygon(polygon)
-        filtered_eq = []
 
-        for eq in eq_catalog:
-            eq_point = Point(eq[self.POINT_LONGITUDE_INDEX],
-                    eq[self.POINT_LATITUDE_INDEX])
-
-            if polygon.contains(eq_point):
-                filtered_eq.append(eq)
+        eq_catalog = np.asarray(eq_catalog)
+        if not len(eq_catalog):
+            inside = np.zeros(0, dtype=bool)
+        else:
+            longitude = eq_catalog[:, self.POINT_LONGITUDE_INDEX]
+            latitude = eq_catalog[:, self.POINT_LATITUDE_INDEX]
+            vertices = np.array(polygon.exterior.coords)
+            inside, unsure = points_in_polygon(longitude, latitude,
+                vertices[:, 0], vertices[:, 1], margin=True)
+            for row in np.flatnonzero(unsure):
+                inside[row] = polygon.contains(
+                    Point(longitude[row], latitude[row]))
 
         LOGGER.info(''.center(80, '-'))
 
         LOGGER.info("SOURCE MODEL GEOMETRY FILTERING")
 
         LOGGER.debug("Number of events inside the zone %s: %s" %
-            (source.name, len(filtered_eq)))
+            (source.name, np.count_nonzero(inside)))
+
+        return inside
+
+    def filter_eqs(self, source, eq_catalog):
+        """
+        Filter eq events contained in
+        the polygon
+        """
+
+        return np.asarray(eq_catalog)[self.select_eqs(source, eq_catalog)]
 
-        return np.array(filtered_eq)
+
+def source_model_bbox(sm_definitions):
+    """
+    Return the bounding box (min longitude, min latitude,
+    max longitude, max latitude) of the union of the
+    area boundaries of the source models.
+    """
+
+    points = np.array([point for sm in sm_definitions
+        for point in sm.area_boundary.pos_list], dtype=float)
+    min_lon, min_lat = points.min(axis=0).tolist()
+    max_lon, max_lat = points.max(axis=0).tolist()
+    return (min_lon, min_lat, max_lon, max_lat)
 
 
 def _check_polygon(polygon):
@@ -112,5 +154,10 @@ class NullCatalogFilter(object):
     catalogue
     """
 
+    def select_eqs(self, source, eq_catalog):
+        """Return a boolean vector selecting all the eq events"""
+
+        return np.ones(len(eq_catalog), dtype=bool)
+
     def filter_eqs(self, source, eq_catalog):
         return np.array(eq_catalog)
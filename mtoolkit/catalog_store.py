@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The purpose of this module is to provide objects
+to store validated earthquake catalogues on disk
+partitioned by year ranges. The statistics kept
+for every partition allow queries bounded in
+time, space or magnitude to memory map only the
+partitions which may contain selected eq entries.
+"""
+
+import os
+import shutil
+import tempfile
+
+import yaml
+import numpy as np
+
+from mtoolkit.eqcatalog import (EqEntryReader, EqCatalog, open_catalog,
+                                catalog_dtype, catalog_format,
+                                VALIDATION_RULES_VERSION)
+from mtoolkit.bulletin import BULLETIN_READERS
+from mtoolkit.catalog_cache import load_store
+
+INDEX_FILE = 'partitions.yml'
+PARTITION_FILE = 'years_%d_%d.npy'
+# Default number of years stored in a partition
+PARTITION_YEARS = 10
+# Fields whose minimum and maximum are kept for each partition
+STATS_FIELDNAMES = ['year', 'Mw', 'longitude', 'latitude']
+# Version of the stored catalog format
+STORE_VERSION = 1
+
+
+class PartitionedCatalogStore(object):
+    """
+    PartitionedCatalogStore reads an earthquake
+    catalogue stored in a directory, each partition
+    is the npy file of the catalog store (see EqCatalog)
+    of the eq entries of a range of years, sorted by
+    time. The index file lists the partitions with
+    the minimum and maximum values of the
+    STATS_FIELDNAMES of their eq entries.
+    """
+
+    def __init__(self, store_dir):
+        with open(os.path.join(store_dir, INDEX_FILE)) as index_file:
+            index = yaml.safe_load(index_file)
+
+        if (index['version'] != STORE_VERSION or
+            index['validation_rules'] != VALIDATION_RULES_VERSION):
+            raise IOError('Outdated catalog store: %s, convert the '
+                'catalog again' % store_dir)
+
+        self.store_dir = store_dir
+        self.partition_years = index['partition_years']
+        self.agency_size = index['agency_size']
+        self.partitions = index['partitions']
+
+    @classmethod
+    def write(cls, store_dir, eq_catalog, partition_years=PARTITION_YEARS):
+        """
+        Store the catalogue in the given directory,
+        partitioned by ranges of partition_years
+        years, replacing the previously stored one.
+        """
+
+        data = EqCatalog.merge([eq_catalog]).data
+        starts = (data['year'] // partition_years) * partition_years
+        # rows are time sorted, partitions are contiguous
+        bounds = np.flatnonzero(np.diff(starts)) + 1
+        bounds = np.concatenate([[0], bounds, [len(data)]]) if len(data) \
+            else []
+
+        parent_dir = os.path.dirname(os.path.abspath(store_dir))
+        if not os.path.exists(parent_dir):
+            os.makedirs(parent_dir)
+
+        # The store is written in a temporary directory renamed
+        # at the end, a partially written store is never read
+        tmp_dir = tempfile.mkdtemp(dir=parent_dir)
+        old_dir = tempfile.mkdtemp(dir=parent_dir)
+        try:
+            partitions = []
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                first_year = int(starts[start])
+                filename = PARTITION_FILE % (first_year,
+                    first_year + partition_years - 1)
+                partition = data[start:end]
+                np.save(os.path.join(tmp_dir, filename), partition)
+
+                partitions.append({'file': filename, 'rows': int(end - start),
+                    'stats': dict((field, _min_max(partition[field]))
+                        for field in STATS_FIELDNAMES)})
+
+            with open(os.path.join(tmp_dir, INDEX_FILE), 'w') as index_file:
+                yaml.safe_dump({'version': STORE_VERSION,
+                    'validation_rules': VALIDATION_RULES_VERSION,
+                    'partition_years': partition_years,
+                    'agency_size': data.dtype['Agency'].itemsize,
+                    'partitions': partitions}, index_file)
+
+            if os.path.isdir(store_dir):
+                # Memory mapped partitions stay valid after the rename
+                os.rename(store_dir, os.path.join(old_dir, 'store'))
+            os.rename(tmp_dir, store_dir)
+        finally:
+            for directory in [tmp_dir, old_dir]:
+                if os.path.isdir(directory):
+                    shutil.rmtree(directory)
+
+        return cls(store_dir)
+
+    def select_partitions(self, predicates=None):
+        """
+        Return the partitions which may contain eq
+        entries selected by the predicates (see
+        EqRowPredicates), all the partitions if
+        predicates is None.
+        """
+
+        if predicates is None:
+            return list(self.partitions)
+
+        bounds = {}
+        if predicates.years is not None:
+            bounds['year'] = predicates.years
+        if predicates.bbox is not None:
+            min_lon, min_lat, max_lon, max_lat = predicates.bbox
+            bounds['longitude'] = (min_lon, max_lon)
+            bounds['latitude'] = (min_lat, max_lat)
+        if predicates.min_mw is not None:
+            bounds['Mw'] = (predicates.min_mw, None)
+
+        return [partition for partition in self.partitions
+            if all(_overlaps(partition['stats'][field], bound)
+                for field, bound in bounds.items())]
+
+    def read(self, predicates=None):
+        """
+        Return the EqCatalog of the stored eq entries,
+        sorted by time, selected by the predicates (see
+        EqRowPredicates). Only the partitions which may
+        contain selected eq entries are memory mapped,
+        all the eq entries are read if predicates is None.
+        """
+
+        eq_catalogs = []
+        for partition in self.select_partitions(predicates):
+            data = load_store(os.path.join(self.store_dir,
+                partition['file']))
+            if predicates is not None:
+                data = data[predicates.select_store(data)]
+            eq_catalogs.append(EqCatalog(data))
+
+        if not eq_catalogs:
+            return EqCatalog(np.zeros(0, dtype=catalog_dtype(
+                self.agency_size)))
+        if len(eq_catalogs) == 1:
+            return eq_catalogs[0]
+        return EqCatalog.concatenate(eq_catalogs)
+
+
+def convert_catalog(filename, store_dir, partition_years=PARTITION_YEARS,
+    chunk_size=None):
+    """
+    Convert a csv catalogue file (or a QuakeML or
+    ISF bulletin) in a catalogue store partitioned
+    by ranges of partition_years years, chunk_size
+    is the number of rows parsed at once (see
+    EqEntryReader.read_columns).
+    """
+
+    reader_class = BULLETIN_READERS.get(catalog_format(filename),
+        EqEntryReader)
+    with open_catalog(filename) as eq_catalog:
+        eq_catalog = reader_class(eq_catalog).read_catalog(chunk_size)
+    return PartitionedCatalogStore.write(store_dir, eq_catalog,
+        partition_years)
+
+
+def _min_max(column):
+    """
+    Return the minimum and maximum values of
+    a column, None if they are unknown (NaN).
+    """
+
+    bounds = []
+    for value in [np.min(column), np.max(column)]:
+        value = value.item()
+        bounds.append(None if value != value else value)
+    return bounds
+
+
+def _overlaps(stats, bound):
+    """
+    Check if the [minimum, maximum] stats of a
+    partition overlap the (lower, upper) bound,
+    None values are unbounded.
+    """
+
+    minimum, maximum = stats
+    lower, upper = bound
+    if lower is not None and maximum is not None and maximum < lower:
+        return False
+    if upper is not None and minimum is not None and minimum > upper:
+        return False
+    return True
@@ -25,6 +25,8 @@ import sys
 import argparse
 import logging
 
+from mtoolkit.catalog_store import PARTITION_YEARS
+
 
 def build_cmd_parser():
     """
@@ -50,6 +52,36 @@ def build_cmd_parser():
     return parser
 
 
+def build_convert_cmd_parser():
+    """
+    Create the parser for the cmdline converting
+    a csv catalogue in a partitioned catalogue store
+    """
+
+    parser = argparse.ArgumentParser(prog='MToolkit catalog converter')
+    parser.add_argument('eq_catalog_file',
+                        help="""Specify the csv eq catalog
+                        file or bulletin (it can be compressed)""")
+
+    parser.add_argument('catalog_store',
+                        help="""Specify the directory of the
+                        catalog store""")
+
+    parser.add_argument('-y', '--partition-years',
+                        dest='partition_years',
+                        type=int,
+                        default=PARTITION_YEARS,
+                        help="""Number of years stored in
+                        each partition""")
+
+    parser.add_argument('-c', '--chunk-size',
+                        dest='chunk_size',
+                        type=int,
+                        help="""Number of rows of the eq
+                        catalog parsed at once""")
+    return parser
+
+
 def cmd_line():
     """
     Return cmdline input argument
@@ -22,9 +22,26 @@ to read csv files containing eq definitions and
 create eq entries.
 """
 
+import io
+import codecs
 import os
+import bz2
+import gzip
 from datetime import datetime as time
-from csv import DictReader, DictWriter
+from csv import DictReader, DictWriter, reader
+from itertools import ifilter, islice, izip
+
+import numpy as np
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+from mtoolkit.scientific.catalogue_utilities import DerivedColumns
 
 FIELDNAMES = ['eventID', 'Agency', 'Identifier',
               'year', 'month', 'day',
@@ -36,6 +53,42 @@ FIELDNAMES = ['eventID', 'Agency', 'Identifier',
               'mb', 'sigmamb', 'ML',
               'sigmaML']
 
+INT_FIELDNAMES = ['eventID', 'Identifier', 'year', 'month',
+                  'day', 'hour', 'minute']
+
+FLOAT_FIELDNAMES = ['second', 'timeError', 'longitude',
+                    'latitude', 'SemiMajor90', 'SemiMinor90',
+                    'ErrorStrike', 'depth', 'depthError',
+                    'Mw', 'sigmaMw', 'Ms',
+                    'sigmaMs', 'mb', 'sigmamb',
+                    'ML', 'sigmaML']
+
+# Fields of the catalog matrix used by the scientific functions,
+# they are placed first in the catalog store (see EqCatalog)
+MATRIX_FIELDNAMES = ['year', 'month', 'day',
+                     'longitude', 'latitude', 'Mw', 'sigmaMw']
+
+# Fields validated together by the epicentre error location check
+EPICENTRE_ERROR_FIELDNAMES = ['SemiMajor90', 'SemiMinor90', 'ErrorStrike']
+
+TIME_FIELDNAMES = ['year', 'month', 'day', 'hour', 'minute', 'second']
+
+LINE_TERMINATOR = '\r\n'
+WRITE_BLOCK_SIZE = 50000
+WRITE_BUFFER_SIZE = 1 << 20
+
+READ_BUFFER_SIZE = 1 << 20
+
+# Magic bytes at the start of compressed catalogues
+COMPRESSION_MAGIC = [('gzip', '\x1f\x8b'), ('bz2', 'BZh'),
+                     ('xz', '\xfd7zXZ\x00')]
+# Number of bytes read to detect the format of a catalogue
+FORMAT_HEAD_SIZE = 512
+
+# Version of the eq entries validation rules, it should
+# be increased whenever a check or a conversion changes
+VALIDATION_RULES_VERSION = 1
+
 
 class MalformedCatalogError(Exception):
     """
@@ -44,11 +97,17 @@ class MalformedCatalogError(Exception):
     catalogue.
     """
 
-    def __init__(self):
+    def __init__(self, filename=None):
         header = ','.join(FIELDNAMES)
         msg = ('The fieldnames should be placed on top of the catalogue'
             "file, the valid header is '%s' without quotes." % (header))
+        if filename is not None:
+            msg += " File: %s" % filename
         Exception.__init__(self, msg)
+        self.filename = filename
+
+    def __reduce__(self):
+        return (self.__class__, (self.filename,))
 
 
 class EqEntryReader(object):
@@ -69,30 +128,36 @@ class EqEntryReader(object):
 
     EMPTY_STRING = ''
 
-    def __init__(self, eq_entries_source):
+    def __init__(self, eq_entries_source, fields=None, predicates=None):
         """
         to_int   - fields to be converted in integer
         to_float - fields to be converted in float
         check_map - associates each field with its own check
         current_line - denotes the line in use by the read method
+        fields - projection of the fields converted by the
+                 columnar reader, None means all the fields
+        predicates - EqRowPredicates selecting the rows
+                     converted by the columnar reader
+        read_rows, skipped_rows - number of rows read by the
+                                  columnar reader and of rows
+                                  skipped by the predicates
         """
         self.validate_csv_catalog(eq_entries_source)
 
         self.eq_entries_source = eq_entries_source
 
-        self.to_int = ['eventID', 'Identifier', 'year', 'month',
-                'day', 'hour', 'minute']
+        self.to_int = list(INT_FIELDNAMES)
 
-        self.to_float = ['second', 'timeError', 'longitude',
-                'latitude', 'SemiMajor90', 'SemiMinor90',
-                'ErrorStrike', 'depth', 'depthError',
-                'Mw', 'sigmaMw', 'Ms',
-                'sigmaMs',  'mb', 'sigmamb',
-                'ML', 'sigmaML']
+        self.to_float = list(FLOAT_FIELDNAMES)
 
         self.compulsory_fields = self.to_int + [self.to_float[2],
                 self.to_float[3], self.to_float[7], self.to_float[9]]
 
+        self.fields = fields
+        self.predicates = predicates
+        self.read_rows = 0
+        self.skipped_rows = 0
+
         self.check_map = {
                 'eventID': self.check_positive_value,
                 'Agency': self.no_check,
@@ -141,9 +206,7 @@ class EqEntryReader(object):
         entry in a dictionary for every line
         with valid values.
         """
-        eq_reader = DictReader(self.eq_entries_source, fieldnames=FIELDNAMES)
-        # eq definitions start at line 2
-        for self.current_line, eq_line in enumerate(eq_reader, start=2):
+        for self.current_line, eq_line in self._numbered_lines():
             eq_entry = self.convert_values(eq_line)
             for field in eq_entry.keys():
                 if not self.check_map[field](field, eq_entry) and (field in
@@ -165,6 +228,256 @@ class EqEntryReader(object):
             eq_catalog.append(eq_entry)
         return eq_catalog
 
+    def read_columns(self, chunk_size=None, first_line=2):
+        """
+        Return a dictionary associating each fieldname
+        with a numpy column containing the values of the
+        whole earthquake catalogue. The columns are
+        validated with the same rules applied by the read
+        method, but all the rows are checked at once.
+        Blank values of non compulsory float fields are
+        stored as NaN, as well as the values of the fields
+        out of the reader projection.
+        If chunk_size is given the catalogue is streamed
+        in blocks of chunk_size rows, each one appended
+        to a growable buffer, so that the memory used
+        by the csv rows doesn't exceed a single block.
+        first_line denotes the line number of the first
+        row read from the current position of the source.
+        """
+
+        if chunk_size is None:
+            return self._convert_block(list(self._rows()), first_line)
+
+        data = self._read_chunks(chunk_size, first_line)
+        return dict((field, data[field]) for field in FIELDNAMES)
+
+    def read_catalog(self, chunk_size=None, first_line=2):
+        """
+        Return the earthquake catalogue as an EqCatalog,
+        chunk_size and first_line have the same meaning
+        as in read_columns.
+        """
+
+        if chunk_size is None:
+            return EqCatalog.from_columns(
+                self.read_columns(first_line=first_line))
+        return EqCatalog(self._read_chunks(chunk_size, first_line))
+
+    def select_range(self, start, end):
+        """
+        Restrict the rows read by read_columns and
+        read_catalog to the lines of a seekable source
+        starting between the byte offsets start and end,
+        both offsets must be at the beginning of a line.
+        """
+
+        self.eq_entries_source.seek(start)
+        self.eq_entries_source = _range_lines(self.eq_entries_source,
+            start, end)
+
+    def _numbered_lines(self):
+        """
+        Return an iterator over the (line number,
+        eq line dictionary) pairs of the eq definitions.
+        """
+
+        eq_reader = DictReader(self.eq_entries_source, fieldnames=FIELDNAMES)
+        # eq definitions start at line 2
+        return enumerate(eq_reader, start=2)
+
+    def _rows(self):
+        """
+        Return an iterator over the csv rows
+        of the eq definitions.
+        """
+
+        # eq definitions start at line 2, empty lines are skipped
+        # as the DictReader used by the read method does
+        return ifilter(None, reader(self.eq_entries_source))
+
+    def _read_chunks(self, chunk_size, first_line=2):
+        """
+        Return the catalog store built by
+        reading blocks of chunk_size rows.
+        """
+
+        rows = self._rows()
+        buf = None
+        block = list(islice(rows, chunk_size))
+        while block:
+            columns = self._convert_block(block, first_line)
+            if buf is None:
+                buf = ColumnsBuffer(max(chunk_size,
+                    self._estimated_rows(block)))
+            buf.append(columns)
+            first_line += len(block)
+            block = list(islice(rows, chunk_size))
+
+        if buf is None:
+            buf = ColumnsBuffer(0)
+            buf.append(self.convert_columns([], first_line))
+        return buf.trim()
+
+    def _estimated_rows(self, rows):
+        """
+        Return the number of rows of the catalogue
+        estimated from the given ones, 0 if unknown.
+        """
+
+        return _estimate_rows(self.eq_entries_source, rows)
+
+    def _convert_block(self, rows, first_line):
+        """
+        Return the validated columns of the rows of
+        a block selected by the predicates, counting
+        the read and the skipped rows.
+        """
+
+        self.read_rows += len(rows)
+        if self.predicates is None or not rows:
+            return self.convert_columns(rows, first_line)
+
+        lines = np.flatnonzero(self.predicates.select(rows))
+        self.skipped_rows += len(rows) - len(lines)
+        return self.convert_columns([rows[line] for line in lines],
+            first_line, lines)
+
+    def convert_columns(self, rows, first_line, lines=None):
+        """
+        Return a dictionary of validated numpy columns
+        built from a block of csv rows (lists of strings),
+        first_line denotes the line number of the first row.
+        lines is the vector of the line offsets of the rows
+        from the first line, if rows have been skipped.
+        """
+
+        # (row index, field, value) of compulsory fields failing
+        # a conversion or a check
+        errors = []
+
+        num_fields = len(FIELDNAMES)
+        if rows and set(map(len, rows)) != set([num_fields]):
+            for index, row in enumerate(rows):
+                if len(row) < num_fields:
+                    errors.append((index, FIELDNAMES[len(row)], None))
+                elif len(row) > num_fields:
+                    # as csv.DictReader, the values beyond the
+                    # header have no field
+                    errors.append((index, None, row[num_fields:]))
+                rows[index] = (row + [self.EMPTY_STRING] * num_fields)[
+                    :num_fields]
+
+        raw_columns = dict(zip(FIELDNAMES, zip(*rows)))
+        if not rows:
+            raw_columns = dict((field, ()) for field in FIELDNAMES)
+
+        converted_fields = self.converted_fields()
+
+        if 'Agency' in converted_fields:
+            columns = {'Agency': np.array(raw_columns['Agency'], dtype=str)}
+        else:
+            columns = {'Agency': np.zeros(len(rows), dtype='S1')}
+
+        for field in self.to_int:
+            columns[field], invalid = _convert_column(
+                raw_columns[field], np.int64)
+            _append_errors(errors, field, invalid, raw_columns[field])
+
+        for field in self.to_float:
+            # Fields out of the projection are left blank
+            if field not in converted_fields:
+                columns[field] = np.empty(len(rows))
+                columns[field].fill(np.nan)
+                continue
+
+            columns[field], invalid = _convert_column(
+                raw_columns[field], np.float64)
+            if field in self.compulsory_fields:
+                _append_errors(errors, field, invalid, raw_columns[field])
+
+        # NaN values (blank or invalid) don't pass any comparison
+        with np.errstate(invalid='ignore'):
+            self.check_columns(columns, errors)
+
+        if errors:
+            index, field, value = min(errors, key=_error_order)
+            if lines is not None:
+                index = lines[index]
+            raise EqEntryValidationError(field, value, first_line + index)
+
+        return columns
+
+    def converted_fields(self):
+        """
+        Return the set of fields converted by the columnar
+        reader: the fields of the projection, the compulsory
+        fields, always validated, and the fields checked
+        together with a projected one.
+        """
+
+        if self.fields is None:
+            return set(FIELDNAMES)
+
+        fields = set(self.fields) | set(self.compulsory_fields)
+        if fields & set(EPICENTRE_ERROR_FIELDNAMES):
+            fields.update(EPICENTRE_ERROR_FIELDNAMES)
+        return fields
+
+    def check_columns(self, columns, errors):
+        """
+        Apply to whole columns the checks defined for
+        single eq entries, blanking (NaN) non compulsory
+        values that don't pass their check and appending
+        to errors the compulsory values that don't pass it.
+        """
+
+        month = columns['month']
+        compulsory_checks = [
+            ('eventID', columns['eventID'] > 0),
+            ('Identifier', columns['Identifier'] > 0),
+            ('year', (-10000 <= columns['year']) &
+                (columns['year'] <= time.now().year)),
+            ('month', (1 <= month) & (month <= 12)),
+            ('day', ((month == 2) & (columns['day'] <= 29)) |
+                ((month != 2) & (1 <= columns['day']) &
+                    (columns['day'] <= 31))),
+            ('hour', (0 <= columns['hour']) & (columns['hour'] <= 23)),
+            ('minute', (0 <= columns['minute']) &
+                (columns['minute'] <= 59)),
+            ('longitude', (-180 <= columns['longitude']) &
+                (columns['longitude'] <= 180)),
+            ('latitude', (-90 <= columns['latitude']) &
+                (columns['latitude'] <= 90)),
+            ('depth', columns['depth'] > 0)]
+
+        for field, valid in compulsory_checks:
+            _append_errors(errors, field, ~valid, columns[field])
+
+        second = columns['second']
+        second[~((0 <= second) & (second <= 59))] = np.nan
+
+        # Eq entry checks are applied following the dict order of the
+        # eq entry keys: SemiMajor90 is blanked before ErrorStrike is
+        # checked, SemiMinor90 afterwards
+        _blank_negative(columns['SemiMajor90'])
+
+        semi_minor = columns['SemiMinor90']
+        semi_major = columns['SemiMajor90']
+        error_strike = columns['ErrorStrike']
+        invalid_location = ~((0 <= error_strike) & (error_strike <= 360) &
+            (semi_minor <= semi_major))
+        semi_minor[invalid_location] = np.nan
+        semi_major[invalid_location] = np.nan
+        error_strike[invalid_location] = np.nan
+
+        for field in ['SemiMinor90', 'depthError', 'sigmaMs',
+                      'sigmamb', 'sigmaML']:
+            _blank_negative(columns[field])
+
+        sigma_mw = columns['sigmaMw']
+        sigma_mw[np.isnan(sigma_mw) | (sigma_mw < 0)] = 0.0
+
     def convert_values(self, dict_fields_values):
         """
         Return an eq dictionary with all fields
@@ -312,6 +625,257 @@ class EqEntryReader(object):
         return True
 
 
+class EqRowPredicates(object):
+    """
+    EqRowPredicates selects the csv rows of the eq
+    entries inside a bounding box, a year range and
+    above a minimum Mw, before the conversion of the
+    other fields. Rows whose checked values can't be
+    converted are selected, so that their validation
+    fails as usual.
+    """
+
+    def __init__(self, bbox=None, years=None, min_mw=None):
+        """
+        bbox - (min longitude, min latitude, max longitude,
+                max latitude) of the selected epicentres
+        years - (first year, last year) of the selected eq entries
+        min_mw - minimum Mw of the selected eq entries
+        """
+
+        self.bbox = bbox
+        self.years = years
+        self.min_mw = min_mw
+
+    def __repr__(self):
+        return 'EqRowPredicates(bbox=%r, years=%r, min_mw=%r)' % (
+            self.bbox, self.years, self.min_mw)
+
+    def select(self, rows):
+        """
+        Return a boolean vector selecting
+        the rows satisfying the predicates.
+        """
+
+        return self._select(lambda field: _row_values(rows, field),
+            len(rows))
+
+    def select_store(self, data):
+        """
+        Return a boolean vector selecting the rows of
+        a catalog store satisfying the predicates.
+        """
+
+        return self._select(lambda field: data[field], len(data))
+
+    def _select(self, values, size):
+        """
+        Return a boolean vector selecting the rows
+        satisfying the predicates, values returns
+        the float column of a field.
+        """
+
+        rejected = np.zeros(size, dtype=bool)
+
+        # Comparisons with NaN (invalid values) are False
+        with np.errstate(invalid='ignore'):
+            if self.bbox is not None:
+                min_lon, min_lat, max_lon, max_lat = self.bbox
+                longitude = values('longitude')
+                latitude = values('latitude')
+                rejected |= (longitude < min_lon) | (longitude > max_lon)
+                rejected |= (latitude < min_lat) | (latitude > max_lat)
+
+            if self.years is not None:
+                year = values('year')
+                rejected |= (year < self.years[0]) | (year > self.years[1])
+
+            if self.min_mw is not None:
+                rejected |= values('Mw') < self.min_mw
+
+        return ~rejected
+
+
+def _row_values(rows, field):
+    """
+    Return the float values of a field of
+    csv rows, NaN for invalid values.
+    """
+
+    index = FIELDNAMES.index(field)
+    values, _ = _convert_column([row[index] if index < len(row)
+        else '' for row in rows], np.float64)
+    return values
+
+
+class ColumnsBuffer(object):
+    """
+    ColumnsBuffer allows to concatenate blocks of
+    catalogue columns into a preallocated catalog
+    store (see EqCatalog), which is enlarged in
+    place when its capacity is exceeded.
+    """
+
+    GROWTH_FACTOR = 1.5
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.size = 0
+        self.data = None
+
+    def append(self, columns):
+        """Append a block of columns to the buffer"""
+
+        block_size = len(columns['eventID'])
+        dtype = catalog_dtype(columns['Agency'].itemsize)
+        if self.data is None:
+            self.capacity = max(self.capacity, block_size)
+            self.data = np.zeros(self.capacity, dtype=dtype)
+        elif dtype.itemsize > self.data.dtype.itemsize:
+            # The Agency field is as wide as its longest value
+            self.data = self.data.astype(dtype)
+
+        if self.size + block_size > self.capacity:
+            self.capacity = max(self.size + block_size,
+                int(self.capacity * self.GROWTH_FACTOR))
+            self.data.resize(self.capacity, refcheck=False)
+
+        block = self.data[self.size:self.size + block_size]
+        for field in FIELDNAMES:
+            block[field] = columns[field]
+        self.size += block_size
+
+    def trim(self):
+        """
+        Release the unused capacity and
+        return the catalog store.
+        """
+
+        self.data.resize(self.size, refcheck=False)
+        self.capacity = self.size
+        return self.data
+
+
+def catalog_byte_ranges(filename, start, end, parts):
+    """
+    Split the bytes of an uncompressed catalogue file
+    between the offsets start and end in at most parts
+    ranges of similar size, each range is a (start, end)
+    tuple aligned to the beginning of a line. A start
+    offset of 0 denotes the line following the header.
+    Quoted fields spanning several lines are not
+    supported, as by the columnar reader.
+    """
+
+    with open(filename, 'rb') as catalog_file:
+        if not start:
+            start = len(catalog_file.readline())
+
+        boundaries = [start]
+        step = max((end - start) // parts, 1)
+        for offset in xrange(start + step, end, step):
+            if offset <= boundaries[-1]:
+                continue
+            # the boundary is moved to the beginning
+            # of the line following the offset
+            catalog_file.seek(offset - 1)
+            catalog_file.readline()
+            boundary = min(catalog_file.tell(), end)
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+        if end > boundaries[-1]:
+            boundaries.append(end)
+
+    return zip(boundaries[:-1], boundaries[1:])
+
+
+def _range_lines(source, start, end):
+    """
+    Return a generator over the lines of source,
+    positioned at the byte offset start, which
+    begin before the byte offset end.
+    """
+
+    position = start
+    for line in iter(source.readline, ''):
+        if position >= end:
+            break
+        position += len(line)
+        yield line
+
+
+def _estimate_rows(source, rows):
+    """
+    Estimate the number of rows of a csv file
+    using the average length of the given rows,
+    return 0 if the size of source is unknown.
+    """
+
+    try:
+        size = os.fstat(source.fileno()).st_size
+    except (AttributeError, OSError):
+        return 0
+
+    # fields, separators and line terminator
+    row_length = sum(len(field) + 1 for row in rows for field in row)
+    return int(size * len(rows) / max(row_length, 1))
+
+
+def _convert_column(values, dtype):
+    """
+    Return a numpy column converting the given values
+    to dtype and a boolean vector denoting values which
+    can't be converted, or overflow an int dtype. Float
+    values which can't be converted are set to NaN.
+    """
+
+    strings = np.char.strip(np.array(values, dtype=str))
+    valid = strings != EqEntryReader.EMPTY_STRING
+    column = np.zeros(len(strings), dtype=dtype)
+    if dtype == np.float64:
+        column[:] = np.nan
+
+    try:
+        column[valid] = strings[valid].astype(dtype)
+    except (ValueError, OverflowError):
+        for index in np.flatnonzero(valid):
+            try:
+                column[index] = dtype(strings[index])
+            except (ValueError, OverflowError):
+                valid[index] = False
+
+    return column, ~valid
+
+
+def _append_errors(errors, field, invalid, values):
+    """
+    Append to errors the first value of the given
+    field marked as invalid.
+    """
+
+    if invalid.any():
+        index = np.flatnonzero(invalid)[0]
+        errors.append((index, field, values[index]))
+
+
+def _error_order(error):
+    """
+    Return the sort key of a (row index, field, value)
+    error, rows first then fields in FIELDNAMES order,
+    the values beyond the fields (field None) last.
+    """
+
+    index, field = error[:2]
+    return (index, FIELDNAMES.index(field) if field is not None
+        else len(FIELDNAMES))
+
+
+def _blank_negative(column):
+    """Blank (NaN) the negative values of a float column"""
+
+    column[column < 0] = np.nan
+
+
 class EqEntryValidationError(Exception):
     """
     EqEntry validation error could be raised
@@ -319,14 +883,272 @@ class EqEntryValidationError(Exception):
     of an eq entry compulsory field.
     """
 
-    def __init__(self, field, value, line_number):
+    def __init__(self, field, value, line_number, filename=None):
         """Constructs a new validation exception
         for the given eq entry field"""
 
         msg = "Validation error with the field: %s, having value: %s "\
         "at line number: %s" % (field, value, line_number)
+        if filename is not None:
+            msg += " of file: %s" % filename
         Exception.__init__(self, msg)
         self.args = (field, msg)
+        self.field = field
+        self.value = value
+        self.line_number = line_number
+        self.filename = filename
+
+    def __reduce__(self):
+        # Errors raised while parsing in a process pool
+        # are pickled back to the parent process
+        return (self.__class__,
+            (self.field, self.value, self.line_number, self.filename))
+
+
+def catalog_compression(filename):
+    """
+    Return the compression of a catalogue file ('gzip',
+    'bz2' or 'xz') detected from its magic bytes, None
+    if the file is not compressed.
+    """
+
+    with open(filename, 'rb') as catalog_file:
+        magic = catalog_file.read(6)
+
+    for compression, compression_magic in COMPRESSION_MAGIC:
+        if magic.startswith(compression_magic):
+            return compression
+    return None
+
+
+def catalog_format(filename):
+    """
+    Return the format of a catalogue file ('csv', 'quakeml'
+    or 'isf') detected from its first decompressed bytes.
+    """
+
+    catalog_file = open_catalog(filename)
+    try:
+        head = catalog_file.read(FORMAT_HEAD_SIZE)
+    finally:
+        catalog_file.close()
+
+    head = head.lstrip(codecs.BOM_UTF8).lstrip()
+    if head.startswith('<'):
+        return 'quakeml'
+    if head.startswith('DATA_TYPE') or head.startswith('Event '):
+        return 'isf'
+    return 'csv'
+
+
+def open_catalog(filename):
+    """
+    Open a csv catalogue file, compressed files are
+    decompressed while they are read.
+    """
+
+    compression = catalog_compression(filename)
+    if compression == 'gzip':
+        return io.BufferedReader(gzip.GzipFile(filename), READ_BUFFER_SIZE)
+    if compression == 'bz2':
+        return bz2.BZ2File(filename, buffering=READ_BUFFER_SIZE)
+    if compression == 'xz':
+        if lzma is None:
+            raise IOError('The lzma module is needed to read the xz '
+                'compressed catalogue: %s' % filename)
+        return io.BufferedReader(lzma.LZMAFile(filename), READ_BUFFER_SIZE)
+    return open(filename)
+
+
+def catalog_dtype(agency_size):
+    """
+    Return the numpy dtype of the catalog store, the
+    fields of the catalog matrix come first as float
+    values, followed by the other fields in the csv
+    order. agency_size is the length of the Agency field.
+    """
+
+    fields = [(field, np.float64) for field in MATRIX_FIELDNAMES]
+    for field in FIELDNAMES:
+        if field == 'Agency':
+            fields.append((field, 'S%d' % max(agency_size, 1)))
+        elif field in INT_FIELDNAMES and field not in MATRIX_FIELDNAMES:
+            fields.append((field, np.int64))
+        elif field not in MATRIX_FIELDNAMES:
+            fields.append((field, np.float64))
+    return np.dtype(fields)
+
+
+class EqCatalog(object):
+    """
+    EqCatalog stores an earthquake catalogue in a
+    numpy structured array (the catalog store) having
+    the dtype returned by catalog_dtype, blank values
+    of non compulsory fields are stored as NaN.
+    Columns and the catalog matrix are views over
+    the store, jobs select eq entries through boolean
+    masks or index vectors instead of copying them.
+    Indexing the catalogue returns the eq entry
+    dictionary of the corresponding row, where
+    blank values are represented by empty strings.
+    Eq entries are looked up by eventID through a
+    hash index built on the first lookup.
+    The columns derived by the scientific jobs are
+    computed once and shared through `derived`.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self._event_index = None
+        self._derived = None
+
+    @classmethod
+    def from_columns(cls, columns):
+        """
+        Create an EqCatalog from a dictionary of
+        columns as returned by EqEntryReader.read_columns.
+        """
+
+        data = np.zeros(len(columns['eventID']),
+            dtype=catalog_dtype(columns['Agency'].itemsize))
+        for field in FIELDNAMES:
+            data[field] = columns[field]
+        return cls(data)
+
+    @classmethod
+    def concatenate(cls, eq_catalogs):
+        """
+        Create an EqCatalog concatenating the eq
+        entries of the given catalogues.
+        """
+
+        agency_size = max(eq_catalog.data.dtype['Agency'].itemsize
+            for eq_catalog in eq_catalogs)
+        data = np.zeros(sum(len(eq_catalog) for eq_catalog in eq_catalogs),
+            dtype=catalog_dtype(agency_size))
+
+        start = 0
+        for eq_catalog in eq_catalogs:
+            for field in FIELDNAMES:
+                data[field][start:start + len(eq_catalog)] = \
+                    eq_catalog.data[field]
+            start += len(eq_catalog)
+        return cls(data)
+
+    @classmethod
+    def merge(cls, eq_catalogs):
+        """
+        Create an EqCatalog merging the given catalogues,
+        eq entries are sorted by time, entries having the
+        same time keep the order of the given catalogues.
+        """
+
+        data = cls.concatenate(eq_catalogs).data
+        # lexsort is stable and sorts by the last key first
+        order = np.lexsort([data[field] for field in TIME_FIELDNAMES[::-1]])
+        return cls(data[order])
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        """Return the eq entry at the given row"""
+
+        row = self.data[index]
+        eq_entry = {}
+        for field in FIELDNAMES:
+            value = row[field].item()
+            if field in INT_FIELDNAMES:
+                value = int(value)
+            elif isinstance(value, float) and np.isnan(value):
+                value = EqEntryReader.EMPTY_STRING
+            eq_entry[field] = value
+        return eq_entry
+
+    def column(self, field):
+        """Return the numpy column of the given field"""
+
+        return self.data[field]
+
+    @property
+    def matrix(self):
+        """
+        Return the catalog matrix, whose columns are
+        the MATRIX_FIELDNAMES, as a view over the store.
+        """
+
+        year = self.data['year']
+        return np.lib.stride_tricks.as_strided(year,
+            shape=(len(self.data), len(MATRIX_FIELDNAMES)),
+            strides=(self.data.strides[0], year.itemsize))
+
+    def entries(self, rows):
+        """
+        Return a generator providing the eq entries
+        of the given rows (index vector).
+        """
+
+        for row in rows:
+            yield self[row]
+
+    @property
+    def derived(self):
+        """
+        Return the DerivedColumns of the catalogue rows,
+        created on first use.
+        """
+
+        if self._derived is None:
+            self._derived = DerivedColumns(*[self.data[field] for field in
+                ['year', 'month', 'day', 'longitude', 'latitude', 'hour',
+                'minute', 'second']])
+        return self._derived
+
+    @property
+    def event_index(self):
+        """
+        Return the dictionary associating each eventID
+        with its row, an eventID appearing in several
+        rows is associated with the first one.
+        """
+
+        if self._event_index is None:
+            event_ids = self.data['eventID']
+            # rows are inserted backwards, so that the
+            # first row of a duplicated eventID is kept
+            self._event_index = dict(izip(event_ids[::-1].tolist(),
+                xrange(len(event_ids) - 1, -1, -1)))
+        return self._event_index
+
+    def event(self, event_id):
+        """
+        Return the eq entry having the given eventID,
+        raise KeyError if the eventID is unknown.
+        """
+
+        return self[self.event_index[event_id]]
+
+    def rows(self, event_ids):
+        """
+        Return the index vector of the rows having
+        the given eventIDs, raise KeyError if an
+        eventID is unknown.
+        """
+
+        event_index = self.event_index
+        return np.fromiter((event_index[event_id]
+            for event_id in np.asarray(event_ids).tolist()),
+            dtype=np.intp, count=len(event_ids))
+
+    def duplicate_event_ids(self):
+        """
+        Return the sorted vector of the eventIDs
+        appearing in several rows of the catalogue.
+        """
+
+        event_ids = np.sort(self.data['eventID'])
+        duplicated = event_ids[1:] == event_ids[:-1]
+        return np.unique(event_ids[1:][duplicated])
 
 
 class EqEntryWriter(object):
@@ -348,3 +1170,61 @@ class EqEntryWriter(object):
             writer = DictWriter(output_file, FIELDNAMES)
             writer.writeheader()
             writer.writerows(entries)
+
+    def write_catalog(self, eq_catalog, rows=None, extra_columns=None):
+        """
+        Write in the csv file the given rows (index vector,
+        all the rows if None) of an EqCatalog. Values are
+        formatted a whole column at a time and written in
+        blocks of rows, producing the same csv of write_rows.
+        extra_columns is a list of (fieldname, column) pairs,
+        with one value for each written row, appended after
+        the catalogue fields.
+        """
+
+        if rows is None:
+            rows = np.arange(len(eq_catalog))
+        if extra_columns is None:
+            extra_columns = []
+
+        header = FIELDNAMES + [name for name, _ in extra_columns]
+        with open(self.output_filename, 'wb', WRITE_BUFFER_SIZE) as \
+            output_file:
+
+            output_file.write(','.join(header) + LINE_TERMINATOR)
+            for start in xrange(0, len(rows), WRITE_BLOCK_SIZE):
+                block = eq_catalog.data[rows[start:start + WRITE_BLOCK_SIZE]]
+                formatted_columns = [_format_column(field, block[field])
+                    for field in FIELDNAMES]
+                formatted_columns.extend(_format_column(name,
+                    np.asarray(column)[start:start + WRITE_BLOCK_SIZE])
+                    for name, column in extra_columns)
+
+                output_file.write(LINE_TERMINATOR.join(
+                    map(','.join, zip(*formatted_columns))) + LINE_TERMINATOR)
+
+
+def _format_column(field, column):
+    """
+    Return the list of csv values of a column, formatted
+    as the csv module does: repr for floats, blank values
+    as empty strings and strings quoted when needed.
+    """
+
+    if column.dtype.kind == 'S':
+        return [_quote(value) for value in column.tolist()]
+
+    if field in INT_FIELDNAMES or column.dtype.kind in 'iub':
+        return map(str, column.astype(np.int64).tolist())
+
+    values = np.array(map(repr, column.tolist()), dtype=object)
+    values[np.isnan(column)] = EqEntryReader.EMPTY_STRING
+    return values.tolist()
+
+
+def _quote(value):
+    """Quote a csv string value as csv.QUOTE_MINIMAL does"""
+
+    if any(char in value for char in ',"\r\n'):
+        return '"%s"' % value.replace('"', '""')
+    return value
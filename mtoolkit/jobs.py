@@ -21,22 +21,45 @@ The purpose of this module is to provide functions which tackle specific job,
 some of them wrap scientific functions defined in the scientific module.
 """
 
+import os
+import glob
 import logging
+from multiprocessing import Pool, cpu_count
+
 import numpy as np
 
-from mtoolkit.eqcatalog import EqEntryReader, EqEntryWriter
+from mtoolkit.eqcatalog import (EqEntryReader, EqEntryWriter, EqCatalog,
+                                MalformedCatalogError, EqEntryValidationError,
+                                EqRowPredicates, open_catalog,
+                                catalog_compression, catalog_byte_ranges,
+                                catalog_format, FIELDNAMES,
+                                MATRIX_FIELDNAMES, TIME_FIELDNAMES)
+from mtoolkit.catalog_cache import (EqCatalogCache, create_checkpoint,
+                                    appended_offset)
+from mtoolkit.catalog_store import PartitionedCatalogStore
+from mtoolkit.bulletin import BULLETIN_READERS
+from mtoolkit.scientific.catalogue_utilities import seconds_to_epoch
+from mtoolkit.catalog_filter import source_model_bbox
 from nrml.reader import NRMLReader
 from nrml.nrml_xml import get_data_path, SCHEMA_DIR
 from mtoolkit.source_model import default_area_source
 
 
 NRML_SCHEMA_PATH = get_data_path('nrml.xsd', SCHEMA_DIR)
-CATALOG_COMPLETENESS_MATRIX_YEAR_INDEX = 0
-CATALOG_MATRIX_MW_INDEX = 5
-CATALOG_MATRIX_FIXED_COLOUMNS = ['year', 'month', 'day',
-                                'longitude', 'latitude', 'Mw', 'sigmaMw']
+CATALOG_MATRIX_FIXED_COLOUMNS = MATRIX_FIELDNAMES
+CATALOG_COMPLETENESS_MATRIX_YEAR_INDEX = MATRIX_FIELDNAMES.index('year')
+CATALOG_MATRIX_MW_INDEX = MATRIX_FIELDNAMES.index('Mw')
 COMPLETENESS_TABLE_MW_INDEX = 1
-SIGMA_MW_INDEX = 6
+SIGMA_MW_INDEX = MATRIX_FIELDNAMES.index('sigmaMw')
+
+# Eq catalog fields used by the jobs besides
+# the catalog matrix ones
+JOB_FIELDNAMES = {'Deduplication': TIME_FIELDNAMES + ['Agency'],
+                  'Reasenberg': TIME_FIELDNAMES}
+
+# Minimum size in bytes of the ranges of a
+# catalog file parsed by different processes
+MIN_RANGE_SIZE = 16 << 20
 
 LOGGER = logging.getLogger('mt_logger')
 
@@ -60,16 +83,374 @@ def logged_job(job):
 @logged_job
 def read_eq_catalog(context):
     """
-    Create eq entries by reading an e] catalog.
+    Create eq entries by reading an eq catalog,
+    several catalog files are parsed concurrently
+    and merged in a time sorted catalog. A catalog
+    store partitioned by years is read in place
+    of the catalog files, if configured.
     :param context: shared datastore across different jobs
         in a pipeline
     """
 
-    with open(context.config['eq_catalog_file']) as eq_catalog:
-        reader = EqEntryReader(eq_catalog)
-        context.eq_catalog = reader.read_eq_catalog()
+    predicates = catalog_predicates(context)
+
+    if context.config.get('catalog_store'):
+        context.eq_catalog = _read_catalog_store(
+            context.config['catalog_store'], predicates)
+    else:
+        context.eq_catalog = _read_eq_catalog_files(context.config,
+            predicates)
 
     LOGGER.debug("* Eq catalog length: %s" % len(context.eq_catalog))
+    duplicate_ids = context.eq_catalog.duplicate_event_ids()
+    if len(duplicate_ids):
+        LOGGER.warning("* Eq catalog duplicate eventIDs: %s" %
+            ', '.join(str(event_id) for event_id in duplicate_ids))
+
+
+def _read_eq_catalog_files(config, predicates=None):
+    """
+    Create an eq catalog by parsing the eq catalog
+    files, or reading their cached catalogs.
+    :param config: configuration dictionary
+    :param predicates: EqRowPredicates selecting the
+        parsed rows, if None all the rows are parsed
+    """
+
+    filenames = catalog_filenames(config['eq_catalog_file'])
+    chunk_size = config.get('catalog_chunk_size')
+    fields = catalog_projection(config)
+    workers = config.get('catalog_workers')
+
+    if config.get('cache_dir'):
+        return _read_cached_eq_catalogs(EqCatalogCache(config['cache_dir']),
+            filenames, chunk_size, fields, predicates, workers)
+    return _parse_eq_catalogs(filenames, chunk_size, fields, predicates,
+        workers)
+
+
+def _read_catalog_store(store_dir, predicates=None):
+    """
+    Create an eq catalog reading the partitions
+    of a catalog store which may contain the eq
+    entries selected by the predicates.
+    :param store_dir: directory of the catalog store
+    :param predicates: EqRowPredicates selecting the
+        eq entries, if None all the eq entries are read
+    """
+
+    store = PartitionedCatalogStore(store_dir)
+    LOGGER.info("* Eq catalog store partitions read: %s of %s" %
+        (len(store.select_partitions(predicates)), len(store.partitions)))
+    return store.read(predicates)
+
+
+def catalog_filenames(eq_catalog_file):
+    """
+    Return the list of eq catalog csv filenames.
+    :param eq_catalog_file: a filename or a glob pattern,
+        or a list of them
+    """
+
+    if isinstance(eq_catalog_file, basestring):
+        eq_catalog_file = [eq_catalog_file]
+
+    filenames = []
+    for pattern in eq_catalog_file:
+        # An unmatched filename is kept, parsing it raises IOError
+        filenames.extend(sorted(glob.glob(pattern)) or [pattern])
+    return filenames
+
+
+def catalog_projection(config):
+    """
+    Return the eq catalog fields used by the configured
+    jobs, None if all the fields are needed (i.e. the
+    preprocessed eq catalog is stored).
+    :param config: configuration dictionary
+    """
+
+    if config.get('pprocessing_result_file'):
+        return None
+
+    fields = set(MATRIX_FIELDNAMES)
+    for job in ((config.get('preprocessing_jobs') or []) +
+        (config.get('processing_jobs') or [])):
+        fields.update(JOB_FIELDNAMES.get(job, []))
+    return [field for field in FIELDNAMES if field in fields]
+
+
+def catalog_predicates(context):
+    """
+    Return the predicates selecting the eq entries
+    read from the eq catalog, None if all the eq
+    entries are read. The bounding box of the source
+    models is used only if they have been read.
+    :param context: shared datastore across different jobs
+        in a pipeline
+    """
+
+    bbox = None
+    if (context.config.get('catalog_source_model_bbox') and
+        context.config.get('source_model_file') and context.sm_definitions):
+        bbox = source_model_bbox(context.sm_definitions)
+    years = context.config.get('catalog_year_range')
+    min_mw = context.config.get('catalog_min_mw')
+
+    if bbox is None and years is None and min_mw is None:
+        return None
+    return EqRowPredicates(bbox, years, min_mw)
+
+
+def _parse_eq_catalogs(filenames, chunk_size=None, fields=None,
+    predicates=None, workers=None):
+    """
+    Create an eq catalog by parsing the csv files
+    in a process pool, the parsed catalogs are
+    merged in a time sorted catalog.
+    :param filenames: eq catalog csv filenames
+    :param chunk_size: number of rows parsed at once,
+        if None the whole file is parsed at once
+    :param fields: fields converted by the reader,
+        if None all the fields are converted
+    :param predicates: EqRowPredicates selecting the
+        parsed rows, if None all the rows are parsed
+    :param workers: number of processes of the pool,
+        if None the number of cpus is used
+    """
+
+    parsed = _parse_in_pool([(filename, chunk_size, fields, predicates,
+        0, 2) for filename in filenames], workers)
+    _log_skipped_rows(parsed)
+    return _merge_eq_catalogs(filenames,
+        [eq_catalog for eq_catalog, _, _, _ in parsed])
+
+
+def _read_cached_eq_catalogs(cache, filenames, chunk_size=None,
+    fields=None, predicates=None, workers=None):
+    """
+    Create an eq catalog from the cached catalogs of the
+    csv files, only the rows appended to a file after its
+    checkpoint are parsed, files whose parsed rows have
+    changed are parsed again.
+    :param cache: EqCatalogCache storing the parsed catalogs
+    :param filenames: eq catalog csv filenames
+    :param chunk_size: number of rows parsed at once,
+        if None the whole file is parsed at once
+    :param fields: fields converted by the reader,
+        if None all the fields are converted
+    :param predicates: EqRowPredicates selecting the
+        parsed rows, if None all the rows are parsed
+    :param workers: number of processes of the pool,
+        if None the number of cpus is used
+    """
+
+    keys = [cache.key(filename, fields, predicates)
+        for filename in filenames]
+    eq_catalogs = []
+    tasks = []
+    for index, (filename, key) in enumerate(zip(filenames, keys)):
+        eq_catalog, checkpoint = cache.load(key) or (None, None)
+        offset = None
+        if checkpoint is not None:
+            offset = appended_offset(filename, checkpoint)
+
+        if offset is None:
+            LOGGER.info("* Eq catalog cache miss: %s" % filename)
+            eq_catalog = None
+            tasks.append((index, (filename, chunk_size, fields, predicates,
+                0, 2)))
+        elif offset < os.path.getsize(filename):
+            LOGGER.info("* Eq catalog cache refresh: %s" % filename)
+            tasks.append((index, (filename, chunk_size, fields, predicates,
+                offset, checkpoint['line_number'])))
+        else:
+            LOGGER.info("* Eq catalog cache hit: %s" % filename)
+        eq_catalogs.append(eq_catalog)
+
+    parsed = _parse_in_pool([task for _, task in tasks], workers)
+    _log_skipped_rows(parsed)
+    for (index, task), (parsed_catalog, end_offset, read_rows, _) in zip(
+        tasks, parsed):
+
+        filename, first_line = task[0], task[-1]
+        if eq_catalogs[index] is not None:
+            parsed_catalog = EqCatalog.concatenate(
+                [eq_catalogs[index], parsed_catalog])
+        eq_catalogs[index] = parsed_catalog
+        cache.store(keys[index], parsed_catalog,
+            create_checkpoint(filename, end_offset, first_line + read_rows))
+
+    return _merge_eq_catalogs(filenames, eq_catalogs)
+
+
+def _parse_in_pool(tasks, workers=None):
+    """
+    Parse eq catalogs in a process pool, a task is the
+    tuple of the filename, chunk_size, fields, predicates,
+    byte offset and line number of the first parsed row.
+    Large uncompressed files are split in newline aligned
+    byte ranges parsed by different processes, the ranges
+    are joined in file order.
+    """
+
+    workers = workers or cpu_count()
+    task_ranges = [_task_ranges(task, workers) for task in tasks]
+    ranges = [range_task for range_tasks in task_ranges
+        for range_task in range_tasks]
+
+    if len(ranges) < 2 or workers < 2:
+        results = [_parse_eq_catalog(*range_task) for range_task in ranges]
+    else:
+        pool = Pool(min(len(ranges), workers))
+        try:
+            results = pool.map(_parse_eq_catalog_worker, ranges)
+        finally:
+            pool.terminate()
+
+    parsed = []
+    for task, range_tasks in zip(tasks, task_ranges):
+        parsed.append(_join_ranges(task, results[:len(range_tasks)]))
+        results = results[len(range_tasks):]
+    return parsed
+
+
+def _task_ranges(task, workers):
+    """
+    Return the _parse_eq_catalog arguments parsing
+    the byte ranges of the file of a task, large
+    uncompressed files are split in at most
+    workers ranges.
+    """
+
+    filename, chunk_size, fields, predicates, offset, _ = task
+    # Compressed files and bulletins are always parsed as a whole
+    if (catalog_compression(filename) is None and
+        catalog_format(filename) == 'csv'):
+        size = os.path.getsize(filename)
+        parts = min(workers, (size - offset) // MIN_RANGE_SIZE)
+        if parts > 1:
+            return [(filename, chunk_size, fields, predicates, start, end)
+                for start, end in catalog_byte_ranges(filename, offset,
+                    size, parts)]
+    return [(filename, chunk_size, fields, predicates, offset, None)]
+
+
+def _join_ranges(task, results):
+    """
+    Join the results of the byte ranges parsed
+    for a task, the first validation error in file
+    order is raised with its exact line number.
+    """
+
+    filename, first_line = task[0], task[-1]
+    line_number = first_line
+    for _, _, read_rows, _, error in results:
+        if error is not None:
+            field, value, range_line = error
+            raise EqEntryValidationError(field, value,
+                line_number + range_line, filename)
+        line_number += read_rows
+
+    eq_catalogs = [eq_catalog for eq_catalog, _, _, _, _ in results]
+    if len(eq_catalogs) > 1:
+        eq_catalogs = [EqCatalog.concatenate(eq_catalogs)]
+    return (eq_catalogs[0], results[-1][1], line_number - first_line,
+        sum(skipped for _, _, _, skipped, _ in results))
+
+
+def _parse_eq_catalog_worker(args):
+    """Parse an eq catalog in a process of the pool"""
+
+    return _parse_eq_catalog(*args)
+
+
+def _log_skipped_rows(parsed):
+    """Log the number of rows skipped by the predicates"""
+
+    skipped_rows = sum(skipped for _, _, _, skipped in parsed)
+    if skipped_rows:
+        LOGGER.info("* Eq entries skipped by the catalog predicates: %s" %
+            skipped_rows)
+
+
+def _merge_eq_catalogs(filenames, eq_catalogs):
+    """
+    Merge the eq catalogs parsed from
+    several files in a time sorted catalog.
+    """
+
+    if len(eq_catalogs) == 1:
+        return eq_catalogs[0]
+
+    for filename, eq_catalog in zip(filenames, eq_catalogs):
+        LOGGER.debug("* Eq catalog %s length: %s" %
+            (filename, len(eq_catalog)))
+
+    return EqCatalog.merge(eq_catalogs)
+
+
+def _parse_eq_catalog(filename, chunk_size=None, fields=None,
+    predicates=None, offset=0, end=None):
+    """
+    Create an eq catalog by parsing a csv file,
+    raised errors report the parsed filename.
+    Return the eq catalog, the byte offset of the
+    end of the parsed rows, the number of parsed
+    rows, of rows skipped by the predicates, and the
+    (field, value, row index) tuple of the validation
+    error of the parsed rows, None if they are valid.
+    Compressed files are decompressed while parsed.
+    QuakeML and ISF bulletins are parsed as a whole,
+    their validation errors are raised with the line
+    number of the invalid event.
+    :param filename: eq catalog csv or bulletin filename
+    :param chunk_size: number of rows parsed at once,
+        if None the whole file is parsed at once
+    :param fields: fields converted by the reader,
+        if None all the fields are converted
+    :param predicates: EqRowPredicates selecting the
+        parsed rows, if None all the rows are parsed
+    :param offset: byte offset of the first parsed row,
+        0 means the row following the header
+    :param end: byte offset of the end of the parsed
+        rows, if None the rows are parsed up to the end
+        of the file
+    """
+
+    # Compressed files are always parsed as a whole
+    compressed = catalog_compression(filename) is not None
+    size = os.path.getsize(filename)
+    reader_class = BULLETIN_READERS.get(catalog_format(filename))
+
+    with open_catalog(filename) as eq_catalog:
+        try:
+            if reader_class is not None:
+                reader = reader_class(eq_catalog, fields, predicates)
+                return (reader.read_catalog(chunk_size), size,
+                    reader.read_rows, reader.skipped_rows, None)
+
+            reader = EqEntryReader(eq_catalog, fields, predicates)
+            if end is not None:
+                reader.select_range(offset, end)
+            elif offset:
+                eq_catalog.seek(offset)
+            # line numbers are relative to the first parsed row,
+            # rows parsed before it are known only to the caller
+            parsed_catalog = reader.read_catalog(chunk_size, 0)
+        except MalformedCatalogError:
+            raise MalformedCatalogError(filename)
+        except EqEntryValidationError as exc:
+            if reader_class is not None:
+                raise EqEntryValidationError(exc.field, exc.value,
+                    exc.line_number, filename)
+            return (None, None, None, None,
+                (exc.field, exc.value, exc.line_number))
+
+        if end is None:
+            end = size if compressed else eq_catalog.tell()
+        return (parsed_catalog, end, reader.read_rows,
+            reader.skipped_rows, None)
 
 
 @logged_job
@@ -107,18 +488,16 @@ def create_default_source_model(context):
 @logged_job
 def create_catalog_matrix(context):
     """
-    Create a numpy matrix according to fixed attributes.
+    Create a numpy matrix according to fixed attributes,
+    the working catalog initially contains all its rows.
     :param context: shared datastore across different jobs
         in a pipeline
     """
 
-    matrix = []
-    for eq_entry in context.eq_catalog:
-        matrix.append([eq_entry[coloumn] for coloumn in
-                        CATALOG_MATRIX_FIXED_COLOUMNS])
-
-    context.catalog_matrix = np.array(matrix)
-    context.working_catalog = np.array(matrix)
+    # The matrix is a view over the catalog store, jobs never
+    # modify it in place
+    context.catalog_matrix = context.eq_catalog.matrix
+    context.working_index = None
 
 
 @logged_job
@@ -130,13 +509,83 @@ def create_default_values(context):
         in a pipeline
     """
 
-    context.flag_vector = np.zeros(len(context.working_catalog))
-    min_year = context.working_catalog[:,
-        CATALOG_COMPLETENESS_MATRIX_YEAR_INDEX].min()
-    min_magnitude = context.working_catalog[:, CATALOG_MATRIX_MW_INDEX].min()
+    magnitude = context.working_column(CATALOG_MATRIX_MW_INDEX)
+    context.flag_vector = np.zeros(len(magnitude))
+    min_year = context.working_column(
+        CATALOG_COMPLETENESS_MATRIX_YEAR_INDEX).min()
+    min_magnitude = magnitude.min()
     context.completeness_table = np.array([[min_year, min_magnitude]])
 
 
+@logged_job
+def deduplication(context):
+    """
+    Remove from the working catalog the events reported
+    by several agencies, keeping the preferred solution.
+    :param context: shared datastore across different jobs
+        in a pipeline
+    """
+
+    rows = context.working_index
+    if rows is None:
+        rows = np.arange(len(context.catalog_matrix))
+    data = context.eq_catalog.data[rows]
+    derived = context.working_derived
+    if derived is None:
+        derived = context.eq_catalog.derived.subset(rows)
+
+    # Origin times are compared as integer epoch microseconds
+    config = context.config['Deduplication']
+    vgroup, flag_vector = context.map_sc['deduplication'](
+            derived.epoch_time, data['longitude'], data['latitude'],
+            data['Mw'], data['Agency'], config['agency_priority'],
+            seconds_to_epoch(config['time_window']),
+            config['distance_window'], config['magnitude_window'],
+            unit_xyz=derived.unit_xyz)
+
+    context.flag_working_rows(flag_vector)
+
+    LOGGER.debug(
+        "* Number of duplicated events removed: %s" %
+        (np.sum(flag_vector != 0)))
+
+    LOGGER.debug(
+        "* Number of duplicates groups identified: %s" % np.max(vgroup))
+
+
+def _declustering_derived(context, section):
+    """
+    Return the DerivedColumns of the working catalog for
+    a declustering job, whose distance checks are planar
+    when the config section sets a projection_tolerance
+    (km) above the error of the planar distances.
+    """
+
+    derived = context.working_derived
+    tolerance = context.config[section].get('projection_tolerance')
+    if derived is None or tolerance is None:
+        return derived
+
+    derived = derived.projected(tolerance)
+    if derived.projection is None:
+        LOGGER.debug("* Planar distances error above %s km" % tolerance)
+    else:
+        LOGGER.debug("* Planar distances, maximum error: %.3f km" %
+            derived.distance_error)
+    return derived
+
+
+def _tiling(config):
+    """
+    Return the keyword arguments of the tiled parallel
+    window search (tiles and workers) set in the config
+    section of a declustering job.
+    """
+
+    return dict((key, config[key]) for key in ('tiles', 'workers')
+        if key in config)
+
+
 @logged_job
 def gardner_knopoff(context):
     """
@@ -148,11 +597,11 @@ def gardner_knopoff(context):
     vcl, vmain_shock, flag_vector = context.map_sc['gardner_knopoff'](
             context.working_catalog,
             context.config['GardnerKnopoff']['time_dist_windows'],
-            context.config['GardnerKnopoff']['foreshock_time_window'])
+            context.config['GardnerKnopoff']['foreshock_time_window'],
+            _declustering_derived(context, 'GardnerKnopoff'),
+            **_tiling(context.config['GardnerKnopoff']))
 
-    context.vcl = vcl
-    context.working_catalog = vmain_shock
-    context.flag_vector = flag_vector
+    context.flag_working_rows(flag_vector, vcl)
 
     LOGGER.debug(
         "* Number of events after declustering: %s" % len(vmain_shock))
@@ -175,13 +624,41 @@ def afteran(context):
     """
 
     vcl, vmain_shock, flag_vector = context.map_sc['afteran'](
-            context.catalog_matrix,
+            context.working_catalog,
             context.config['Afteran']['time_dist_windows'],
-            context.config['Afteran']['time_window'])
+            context.config['Afteran']['time_window'],
+            _declustering_derived(context, 'Afteran'),
+            **_tiling(context.config['Afteran']))
 
-    context.vcl = vcl
-    context.working_catalog = vmain_shock
-    context.flag_vector = flag_vector
+    context.flag_working_rows(flag_vector, vcl)
+
+    LOGGER.debug(
+        "* Number of events after declustering: %s" % len(vmain_shock))
+
+    LOGGER.debug(
+        "* Number of events removed during declustering: %s" %
+        (np.sum(flag_vector != 0)))
+
+    LOGGER.debug(
+        "* Number of clusters identified: %s" %
+        (np.size(np.unique(vcl), 0) - 1))
+
+
+@logged_job
+def reasenberg(context):
+    """
+    Apply reasenberg declustering algorithm to the eq catalog.
+    :param context: shared datastore across different jobs
+        in a pipeline
+    """
+
+    config = context.config['Reasenberg']
+    vcl, vmain_shock, flag_vector = context.map_sc['reasenberg'](
+            context.working_catalog, config['rfact'], config['xmeff'],
+            config['xk'], config['taumin'], config['taumax'],
+            config['plev'], _declustering_derived(context, 'Reasenberg'))
+
+    context.flag_working_rows(flag_vector, vcl)
 
     LOGGER.debug(
         "* Number of events after declustering: %s" % len(vmain_shock))
@@ -203,9 +680,10 @@ def stepp(context):
         in a pipeline
     """
 
+    magnitude = context.working_column(CATALOG_MATRIX_MW_INDEX)
     context.completeness_table = context.map_sc['stepp'](
-        context.working_catalog[:, CATALOG_COMPLETENESS_MATRIX_YEAR_INDEX],
-        context.working_catalog[:, CATALOG_MATRIX_MW_INDEX],
+        context.working_column(CATALOG_COMPLETENESS_MATRIX_YEAR_INDEX),
+        magnitude,
         context.config['Stepp']['magnitude_windows'],
         context.config['Stepp']['time_window'],
         context.config['Stepp']['sensitivity'],
@@ -213,7 +691,7 @@ def stepp(context):
 
     LOGGER.debug(
         "* Number of events into completeness algorithm: %s"
-            % len(context.working_catalog))
+            % len(magnitude))
 
     LOGGER.debug(
         "* Completeness table: ")
@@ -243,7 +721,8 @@ def store_preprocessed_catalog(context):
     """
     Write in a csv file the earthquake
     catalog after preprocessing jobs (i.e.
-    gardner_knopoff, stepp)
+    gardner_knopoff, stepp), optionally with
+    the cluster index and flag of each event
     :param context: shared datastore across different jobs
         in a pipeline
     """
@@ -253,11 +732,17 @@ def store_preprocessed_catalog(context):
     indexes_entries_to_store = np.where(context.selected_eq_vector == 0)[0]
     number_written_eq = len(indexes_entries_to_store)
 
-    entries = []
-    for index in indexes_entries_to_store:
-        entries.append(context.eq_catalog[index])
+    extra_columns = None
+    if context.config.get('pprocessing_result_clusters'):
+        vcl = context.vcl
+        if vcl is None:
+            vcl = np.zeros(len(context.catalog_matrix), dtype=int)
+        extra_columns = [
+            ('vcl', vcl[indexes_entries_to_store]),
+            ('flag_vector', context.flag_vector[indexes_entries_to_store])]
 
-    writer.write_rows(entries)
+    writer.write_catalog(context.eq_catalog, indexes_entries_to_store,
+        extra_columns)
 
     LOGGER.debug("* Stored Eq entries: %d" % number_written_eq)
 
@@ -307,9 +792,8 @@ def recurrence(context):
     """
 
     bval, sigb, a_m, siga_m = context.map_sc['recurrence'](
-            context.current_filtered_eq[:,
-                CATALOG_COMPLETENESS_MATRIX_YEAR_INDEX],
-            context.current_filtered_eq[:, CATALOG_MATRIX_MW_INDEX],
+            context.current_column(CATALOG_COMPLETENESS_MATRIX_YEAR_INDEX),
+            context.current_column(CATALOG_MATRIX_MW_INDEX),
             context.completeness_table,
             context.config['Recurrence']['magnitude_window'],
             context.config['Recurrence']['recurrence_algorithm'],
@@ -342,10 +826,9 @@ def maximum_magnitude(context):
         in a pipeline
     """
     max_mag, max_mag_sigma = context.map_sc['maximum_magnitude'](
-        context.current_filtered_eq[:,
-            CATALOG_COMPLETENESS_MATRIX_YEAR_INDEX],
-        context.current_filtered_eq[:, CATALOG_MATRIX_MW_INDEX],
-        context.current_filtered_eq[:, SIGMA_MW_INDEX],
+        context.current_column(CATALOG_COMPLETENESS_MATRIX_YEAR_INDEX),
+        context.current_column(CATALOG_MATRIX_MW_INDEX),
+        context.current_column(SIGMA_MW_INDEX),
         context.config['MaximumMagnitude']['maxim_mag_algorithm'],
         context.config['MaximumMagnitude']['iteration_tolerance'],
         context.config['MaximumMagnitude']['maximum_iterations'],
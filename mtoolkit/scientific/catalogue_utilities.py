@@ -21,11 +21,53 @@ A set of utility functions for performing
 calculations on features in an eq catalogue:
 
 * decimal_year
+* epoch_time
+* seconds_to_epoch, days_to_epoch
+* time_window_rows
 * haversine
+* haversine_blocks
+* haversine_to_point
+* unit_sphere_xyz
+* chord_threshold
+* within_distance
+* hypocentre_xyz
+* within_hypocentral_distance
+* points_in_polygon
+* LocalProjection
+* DerivedColumns
 """
 
 import numpy as np
 
+DEGREES_TO_RADIANS = np.pi / 180.
+
+EARTH_RADIUS = 6371.227
+
+# Units of the epoch time axis
+MICROSECONDS_PER_SECOND = 1000000
+MICROSECONDS_PER_MINUTE = 60 * MICROSECONDS_PER_SECOND
+MICROSECONDS_PER_HOUR = 60 * MICROSECONDS_PER_MINUTE
+MICROSECONDS_PER_DAY = 24 * MICROSECONDS_PER_HOUR
+SECONDS_PER_DAY = 86400.
+
+# Band of dot products around a chord threshold where
+# rounding errors may disagree with haversine
+CHORD_MARGIN = 1e-9
+
+# Distance from a polygon edge where points are
+# inside or outside up to rounding
+POLYGON_MARGIN = 1e-9
+
+# Maximum number of distances in a block of haversine_blocks
+HAVERSINE_BLOCK_SIZE = 1 << 20
+
+# Bound (km) of the absolute error of the float32 haversine
+FLOAT32_DISTANCE_ERROR = 0.01
+# Distance (km) beyond which float32 haversine distances are
+# computed again in float64, as their rounding error grows
+# up to about 3 km for nearly antipodal locations
+FLOAT32_REFINED_DISTANCE = 17500.
+
 
 def decimal_year(year, month, day):
     """
@@ -50,10 +92,91 @@ def decimal_year(year, month, day):
     return dec_year
 
 
-def haversine(lon1, lat1, lon2, lat2, radians=False, earth_rad=6371.227):
+def epoch_time(year, month, day, hour=None, minute=None, second=None):
+    """
+    Allows to calculate the origin time of the events as
+    int64 microseconds since 1970-01-01T00:00:00, leap
+    years included. Missing time columns (None) and
+    blank seconds (NaN) count as zero.
+
+    :param year: year column from catalogue matrix
+    :type year: numpy.ndarray
+    :param month: month column from catalogue matrix
+    :type month: numpy.ndarray
+    :param day: day column from catalogue matrix
+    :type day: numpy.ndarray
+    :keyword hour: hour column
+    :type hour: numpy.ndarray
+    :keyword minute: minute column
+    :type minute: numpy.ndarray
+    :keyword second: second column
+    :type second: numpy.ndarray
+    :returns: origin time column
+    :rtype: numpy.ndarray
+    """
+
+    months = (np.asarray(year, dtype=np.int64) - 1970) * 12 + \
+        np.asarray(month, dtype=np.int64) - 1
+    days = months.astype('datetime64[M]').astype('datetime64[D]').astype(
+        np.int64) + np.asarray(day, dtype=np.int64) - 1
+
+    time = days * MICROSECONDS_PER_DAY
+    if hour is not None:
+        time += np.asarray(hour, dtype=np.int64) * MICROSECONDS_PER_HOUR
+    if minute is not None:
+        time += np.asarray(minute, dtype=np.int64) * MICROSECONDS_PER_MINUTE
+    if second is not None:
+        time += seconds_to_epoch(np.nan_to_num(second))
+    return time
+
+
+def seconds_to_epoch(seconds):
+    """
+    Allows to convert a length of time in seconds to the
+    microseconds of the epoch time axis, rounded to the
+    nearest microsecond.
+    """
+
+    return np.round(np.asarray(seconds, dtype=float) *
+        MICROSECONDS_PER_SECOND).astype(np.int64)
+
+
+def days_to_epoch(days):
+    """
+    Allows to convert a length of time in days to the
+    microseconds of the epoch time axis.
+    """
+
+    return seconds_to_epoch(np.asarray(days, dtype=float) * SECONDS_PER_DAY)
+
+
+def time_window_rows(sorted_time, start, end):
+    """
+    Allows to find the events within time windows
+    through binary searches on a sorted time axis.
+
+    :param sorted_time: epoch time of the events in ascending order
+    :type sorted_time: numpy.ndarray
+    :param start: first time of the windows
+    :type start: int or numpy.ndarray
+    :param end: last time of the windows, included
+    :type end: int or numpy.ndarray
+    :returns: first and past the last index of the events
+              in each window
+    :rtype: tuple
+    """
+
+    return (np.searchsorted(sorted_time, start, side='left'),
+        np.searchsorted(sorted_time, end, side='right'))
+
+
+def haversine(lon1, lat1, lon2, lat2, radians=False, earth_rad=EARTH_RADIUS,
+    cos_lat1=None, cos_lat2=None, out=None, dtype=np.float64):
     """
     Allows to calculate geographical distance
-    using the haversine formula.
+    using the haversine formula, between each
+    location of the first set (rows) and each
+    location of the second set (columns).
 
     :param lon1: longitude of the first set of locations
     :type lon1: numpy.ndarray
@@ -67,43 +190,465 @@ def haversine(lon1, lat1, lon2, lat2, radians=False, earth_rad=6371.227):
     :type radians: bool
     :keyword earth_rad: radius of the earth in km
     :type earth_rad: float
+    :keyword cos_lat1: precomputed cosine of lat1
+    :type cos_lat1: numpy.ndarray
+    :keyword cos_lat2: precomputed cosine of lat2
+    :type cos_lat2: numpy.float64
+    :keyword out: array of shape (nlocs1, nlocs2) where
+                  distances are stored, allocated if not given
+    :type out: numpy.ndarray
+    :keyword dtype: float type of the calculation, float32
+                    halves the memory, the absolute error is then
+                    below FLOAT32_DISTANCE_ERROR km, distances
+                    longer than FLOAT32_REFINED_DISTANCE km are
+                    computed in float64
+    :type dtype: numpy.dtype
     :returns: geographical distance in km
     :rtype: numpy.ndarray
     """
 
+    double1 = _haversine_locations(lon1, lat1, cos_lat1, radians)
+    double2 = _haversine_locations(lon2, lat2, cos_lat2, radians)
+    lon1, lat1, cos_lat1 = _cast_locations(double1, dtype)
+    lon2, lat2, cos_lat2 = _cast_locations(double2, dtype)
+
+    if out is None:
+        out = np.empty((len(lon1), len(lon2)), dtype=dtype)
+    _haversine_distance(lon1[:, np.newaxis], lat1[:, np.newaxis],
+        cos_lat1[:, np.newaxis], lon2, lat2, cos_lat2, earth_rad, out,
+        np.empty_like(out))
+    _refine_distances(out, earth_rad, *([location[:, np.newaxis]
+        for location in double1] + list(double2)))
+    return out
+
+
+def haversine_blocks(lon1, lat1, lon2, lat2, radians=False,
+    earth_rad=EARTH_RADIUS, cos_lat1=None, cos_lat2=None, dtype=np.float64,
+    block_size=HAVERSINE_BLOCK_SIZE):
+    """
+    Allows to calculate the haversine distances of
+    large sets of locations, keeping in memory only
+    a block of rows of the distance matrix at once.
+    The block array is reused, it must be copied to
+    be kept after the next block is generated.
+    Parameters are the ones of haversine.
+
+    :keyword block_size: maximum number of distances in a block
+    :type block_size: positive int
+    :returns: iterator over (first row, distance block) pairs
+    """
+
+    double1 = _haversine_locations(lon1, lat1, cos_lat1, radians)
+    double2 = _haversine_locations(lon2, lat2, cos_lat2, radians)
+    lon1, lat1, cos_lat1 = _cast_locations(double1, dtype)
+    lon2, lat2, cos_lat2 = _cast_locations(double2, dtype)
+
+    rows = max(1, block_size // max(len(lon2), 1))
+    out = np.empty((min(rows, len(lon1)), len(lon2)), dtype=dtype)
+    work = np.empty_like(out)
+    for start in xrange(0, len(lon1), rows):
+        stop = min(start + rows, len(lon1))
+        block, block_work = out[:stop - start], work[:stop - start]
+        _haversine_distance(lon1[start:stop, np.newaxis],
+            lat1[start:stop, np.newaxis], cos_lat1[start:stop, np.newaxis],
+            lon2, lat2, cos_lat2, earth_rad, block, block_work)
+        _refine_distances(block, earth_rad, *([location[start:stop,
+            np.newaxis] for location in double1] + list(double2)))
+        yield start, block
+
+
+def haversine_to_point(lon, lat, lon0, lat0, radians=False,
+    earth_rad=EARTH_RADIUS, cos_lat=None, cos_lat0=None, out=None,
+    dtype=np.float64):
+    """
+    Allows to calculate the haversine distances of a
+    set of locations from a single location, as a
+    vector instead of a one column matrix.
+
+    :param lon: longitude of the locations
+    :type lon: numpy.ndarray
+    :param lat: latitude of the locations
+    :type lat: numpy.ndarray
+    :param lon0: longitude of the single location
+    :type lon0: float
+    :param lat0: latitude of the single location
+    :type lat0: float
+    :keyword out: vector where distances are stored
+    :type out: numpy.ndarray
+    :returns: geographical distance in km
+    :rtype: numpy.ndarray
+
+    The other keywords are the ones of haversine.
+    """
+
+    double = _haversine_locations(lon, lat, cos_lat, radians)
+    double0 = _haversine_locations(lon0, lat0, cos_lat0, radians)
+    lon, lat, cos_lat = _cast_locations(double, dtype)
+    lon0, lat0, cos_lat0 = _cast_locations(double0, dtype)
+
+    if out is None:
+        out = np.empty(len(lon), dtype=dtype)
+    _haversine_distance(lon, lat, cos_lat, lon0[0], lat0[0], cos_lat0[0],
+        earth_rad, out, np.empty_like(out))
+    _refine_distances(out, earth_rad, *(list(double) +
+        [location[0] for location in double0]))
+    return out
+
+
+def _haversine_locations(lon, lat, cos_lat, radians):
+    """
+    Return longitude, latitude (radians) and cosine of the
+    latitude of the locations as vectors, conversions are
+    done in double precision.
+    """
+
+    lon = np.atleast_1d(lon)
+    lat = np.atleast_1d(lat)
     if radians == False:
-        cfact = np.pi / 180.
-        lon1 = cfact * lon1
-        lat1 = cfact * lat1
-        lon2 = cfact * lon2
-        lat2 = cfact * lat2
-
-    # Number of locations in each set of points
-    if not np.shape(lon1):
-        nlocs1 = 1
-        lon1 = np.array([lon1])
-        lat1 = np.array([lat1])
-    else:
-        nlocs1 = np.max(np.shape(lon1))
-    if not np.shape(lon2):
-        nlocs2 = 1
-        lon2 = np.array([lon2])
-        lat2 = np.array([lat2])
-    else:
-        nlocs2 = np.max(np.shape(lon2))
-    # Pre-allocate array
-    distance = np.zeros((nlocs1, nlocs2))
-    i = 0
-    while i < nlocs2:
-        # Perform distance calculation
-        dlat = lat1 - lat2[i]
-        dlon = lon1 - lon2[i]
-        aval = (np.sin(dlat / 2.) ** 2.) + (np.cos(lat1) * np.cos(lat2[i]) *
-             (np.sin(dlon / 2.) ** 2.))
-        distance[:, i] = (2. * earth_rad * np.arctan2(np.sqrt(aval),
-                                                    np.sqrt(1 - aval))).T
-        i += 1
-    return distance
+        lon = DEGREES_TO_RADIANS * lon
+        lat = DEGREES_TO_RADIANS * lat
+    if cos_lat is None:
+        cos_lat = np.cos(lat)
+
+    return lon, lat, np.atleast_1d(cos_lat)
+
+
+def _cast_locations(locations, dtype):
+    """Return the location vectors converted to dtype"""
+
+    return [location.astype(dtype, copy=False) for location in locations]
+
+
+def _refine_distances(out, earth_rad, *locations):
+    """
+    Compute again in float64 the float32 distances of out
+    longer than FLOAT32_REFINED_DISTANCE, from the double
+    precision locations broadcast to the shape of out,
+    as the haversine formula is ill conditioned near the
+    antipodes.
+    """
+
+    if out.dtype != np.float32:
+        return
+    refined = np.nonzero(out > FLOAT32_REFINED_DISTANCE)
+    if len(refined[0]):
+        locations = [np.broadcast_to(location, out.shape)[refined]
+            for location in locations]
+        distance = np.empty(len(refined[0]))
+        _haversine_distance(*(locations + [earth_rad, distance,
+            np.empty_like(distance)]))
+        out[refined] = distance
+
+
+def _haversine_distance(lon1, lat1, cos_lat1, lon2, lat2, cos_lat2,
+    earth_rad, out, work):
+    """
+    Store in out the haversine distances of the locations
+    broadcast to its shape, work is a scratch array of the
+    same shape. The operations are done in place, in the
+    order of the textbook formula.
+    """
+
+    np.multiply(cos_lat1, cos_lat2, out=out)
+    np.subtract(lon1, lon2, out=work)
+    work *= 0.5
+    np.sin(work, out=work)
+    np.square(work, out=work)
+    out *= work
+    np.subtract(lat1, lat2, out=work)
+    work *= 0.5
+    np.sin(work, out=work)
+    np.square(work, out=work)
+    out += work
+
+    np.subtract(1, out, out=work)
+    np.sqrt(work, out=work)
+    np.sqrt(out, out=out)
+    np.arctan2(out, work, out=out)
+    out *= 2. * earth_rad
+
+
+
+def unit_sphere_xyz(lon, lat, cos_lat=None):
+    """
+    Allows to calculate the positions of locations
+    on the unit sphere.
+
+    :param lon: longitude of the locations in radians
+    :type lon: numpy.ndarray
+    :param lat: latitude of the locations in radians
+    :type lat: numpy.ndarray
+    :keyword cos_lat: precomputed cosine of lat
+    :type cos_lat: numpy.ndarray
+    :returns: matrix of the (x, y, z) positions
+    :rtype: numpy.ndarray
+    """
+
+    if cos_lat is None:
+        cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon),
+        np.sin(lat)))
+
+
+def chord_threshold(distance, earth_rad=EARTH_RADIUS):
+    """
+    Allows to turn great circle distances into the minimum
+    dot product of the unit sphere positions of two
+    locations within that distance.
+
+    :param distance: great circle distance in km
+    :type distance: float or numpy.ndarray
+    :keyword earth_rad: radius of the earth in km
+    :type earth_rad: float
+    :returns: cosine of the angular distance, -inf when
+              every location is within the distance
+    :rtype: numpy.ndarray
+    """
+
+    angle = np.asarray(distance, dtype=float) / earth_rad
+    return np.where(angle < np.pi, np.cos(np.minimum(angle, np.pi)),
+        -np.inf)
+
+
+def within_distance(xyz, xyz0, distance, earth_rad=EARTH_RADIUS,
+    margin=False):
+    """
+    Allows to select the locations within a great circle
+    distance from a location, comparing the dot products
+    of their unit sphere positions with the chord threshold,
+    without trigonometric functions.
+
+    :param xyz: unit sphere positions of the locations
+    :type xyz: numpy.ndarray
+    :param xyz0: unit sphere position of the single location
+    :type xyz0: numpy.ndarray
+    :param distance: great circle distance in km, a single
+                     one or one for each location
+    :type distance: float or numpy.ndarray
+    :keyword earth_rad: radius of the earth in km
+    :type earth_rad: float
+    :keyword margin: states if the mask of the locations whose
+                     dot product is within CHORD_MARGIN from the
+                     threshold, where rounding may disagree with
+                     haversine, is returned too
+    :type margin: bool
+    :returns: boolean mask of the locations within the distance
+    :rtype: numpy.ndarray
+    """
+
+    dot = np.dot(xyz, xyz0)
+    threshold = chord_threshold(distance, earth_rad)
+    within = dot >= threshold
+    if not margin:
+        return within
+    return within, np.abs(dot - threshold) < CHORD_MARGIN
+
+
+def hypocentre_xyz(xyz, depth, earth_rad=EARTH_RADIUS):
+    """
+    Allows to calculate the earth centred positions of
+    hypocentres, locations without depth get NaN positions
+    and are never within a distance.
+
+    :param xyz: unit sphere positions of the epicentres
+    :type xyz: numpy.ndarray
+    :param depth: depth of the hypocentres in km
+    :type depth: numpy.ndarray
+    :keyword earth_rad: radius of the earth in km
+    :type earth_rad: float
+    :returns: matrix of the (x, y, z) positions in km
+    :rtype: numpy.ndarray
+    """
+
+    return xyz * (earth_rad - np.asarray(depth, dtype=float))[:, np.newaxis]
+
+
+def within_hypocentral_distance(hxyz, hxyz0, distance):
+    """
+    Allows to select the hypocentres within a straight
+    line (3-D) distance from a hypocentre.
+
+    :param hxyz: positions of the hypocentres
+                 as returned by hypocentre_xyz
+    :type hxyz: numpy.ndarray
+    :param hxyz0: position of the single hypocentre
+    :type hxyz0: numpy.ndarray
+    :param distance: distance in km, a single one
+                     or one for each hypocentre
+    :type distance: float or numpy.ndarray
+    :returns: boolean mask of the hypocentres within the distance
+    :rtype: numpy.ndarray
+    """
+
+    difference = hxyz - hxyz0
+    return np.einsum('ij,ij->i', difference, difference) <= \
+        np.square(distance)
+
+
+def points_in_polygon(x, y, polygon_x, polygon_y, margin=False):
+    """
+    Allows to select the points inside a polygon through
+    the even-odd rule, vectorized over the points. Points
+    on the boundary are outside, as for shapely.
+
+    :param x: x coordinate of the points
+    :type x: numpy.ndarray
+    :param y: y coordinate of the points
+    :type y: numpy.ndarray
+    :param polygon_x: x coordinate of the polygon vertices
+    :type polygon_x: numpy.ndarray
+    :param polygon_y: y coordinate of the polygon vertices
+    :type polygon_y: numpy.ndarray
+    :keyword margin: states if the mask of the points closer
+                     than POLYGON_MARGIN to an edge, where
+                     rounding may decide, is returned too
+    :type margin: bool
+    :returns: boolean mask of the points inside the polygon
+    :rtype: numpy.ndarray
+    """
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    inside = np.zeros(np.shape(x), dtype=bool)
+    boundary = np.zeros(np.shape(x), dtype=bool)
+    near = np.zeros(np.shape(x), dtype=bool)
+
+    polygon_x = np.asarray(polygon_x, dtype=float)
+    polygon_y = np.asarray(polygon_y, dtype=float)
+    for xi, yi, xj, yj in zip(polygon_x, polygon_y, np.roll(polygon_x, 1),
+        np.roll(polygon_y, 1)):
+        # Edges crossed by the horizontal ray from the points
+        crossing = (yi > y) != (yj > y)
+        if yj != yi:
+            crossing &= x < (xj - xi) * (y - yi) / (yj - yi) + xi
+        inside ^= crossing
+
+        # Distance of the points from the edge
+        length = (xj - xi) ** 2 + (yj - yi) ** 2
+        along = 0. if not length else np.clip(
+            ((x - xi) * (xj - xi) + (y - yi) * (yj - yi)) / length, 0., 1.)
+        distance = np.hypot(x - xi - along * (xj - xi),
+            y - yi - along * (yj - yi))
+        boundary |= distance == 0.
+        near |= distance < POLYGON_MARGIN
+
+    inside &= ~boundary
+    if not margin:
+        return inside
+    return inside, near
+
+
+class LocalProjection(object):
+    """
+    LocalProjection projects locations into a local
+    Lambert azimuthal equal-area frame (km) centred
+    on a region, where distances and polygon tests
+    are planar. The distance error grows with the
+    extent of the region, max_distance_error bounds
+    it to tell if it is below the tolerance of a
+    calculation.
+    """
+
+    def __init__(self, lon0, lat0, earth_rad=EARTH_RADIUS):
+        """
+        Constructor
+        :param lon0: longitude of the centre of the projection
+        :type lon0: float
+        :param lat0: latitude of the centre of the projection
+        :type lat0: float
+        :keyword earth_rad: radius of the earth in km
+        :type earth_rad: float
+        """
+
+        self.lon0 = lon0
+        self.lat0 = lat0
+        self.earth_rad = earth_rad
+        self._sin_lat0 = np.sin(DEGREES_TO_RADIANS * lat0)
+        self._cos_lat0 = np.cos(DEGREES_TO_RADIANS * lat0)
+
+    @classmethod
+    def from_points(cls, lon, lat, earth_rad=EARTH_RADIUS):
+        """
+        Create the projection centred on the centroid of
+        the given locations (e.g. a source polygon).
+        """
+
+        xyz = unit_sphere_xyz(DEGREES_TO_RADIANS * np.asarray(lon, float),
+            DEGREES_TO_RADIANS * np.asarray(lat, float)).mean(axis=0)
+        return cls(np.degrees(np.arctan2(xyz[1], xyz[0])),
+            np.degrees(np.arctan2(xyz[2], np.hypot(xyz[0], xyz[1]))),
+            earth_rad)
+
+    def project(self, lon, lat):
+        """
+        Return the x (east) and y (north) coordinates
+        in km of the locations given in degrees.
+        """
+
+        dlon = DEGREES_TO_RADIANS * (np.asarray(lon, dtype=float) -
+            self.lon0)
+        lat = DEGREES_TO_RADIANS * np.asarray(lat, dtype=float)
+        cos_lat, cos_dlon = np.cos(lat), np.cos(dlon)
+        dot = self._sin_lat0 * np.sin(lat) + \
+            self._cos_lat0 * cos_lat * cos_dlon
+        # the antipode of the centre can't be projected
+        scale = self.earth_rad * np.sqrt(2. / np.maximum(1. + dot, 1e-300))
+        return (scale * cos_lat * np.sin(dlon),
+            scale * (self._cos_lat0 * np.sin(lat) -
+                self._sin_lat0 * cos_lat * cos_dlon))
+
+    def max_distance_error(self, lon, lat):
+        """
+        Return an upper bound (km) of the difference between
+        the planar and the haversine distances of the locations
+        in the spherical cap, centred on the projection centre,
+        holding the given locations. The scale factors of the
+        projection in a cap of angular radius c are between
+        cos(c / 2) and 1 / cos(c / 2), both the geodesic and
+        the planar segment between two locations of the cap
+        stay in it, so that the relative error of the distances
+        is below 1 / cos(c / 2) - 1, and the distances are
+        below the diameter of the cap. The bound is infinite
+        for caps wider than a hemisphere.
+        """
+
+        xyz = unit_sphere_xyz(DEGREES_TO_RADIANS * np.asarray(lon, float),
+            DEGREES_TO_RADIANS * np.asarray(lat, float))
+        centre = unit_sphere_xyz(DEGREES_TO_RADIANS * self.lon0,
+            DEGREES_TO_RADIANS * self.lat0)
+        radius = np.arccos(np.clip(np.min(np.dot(xyz, centre.ravel())),
+            -1., 1.))
+        if radius >= np.pi / 2.:
+            return np.inf
+        return 2. * self.earth_rad * radius * (1. / np.cos(radius / 2.) - 1.)
+
+    @staticmethod
+    def distance(x, y, x0, y0):
+        """
+        Return the planar distances of the projected
+        locations from a projected location.
+        """
+
+        return np.hypot(x - x0, y - y0)
+
+    @staticmethod
+    def within_distance(x, y, x0, y0, distance):
+        """
+        Return the mask of the projected locations within
+        distance km from a projected location.
+        """
+
+        return (x - x0) ** 2 + (y - y0) ** 2 <= np.square(distance)
+
+    def contains(self, lon, lat, polygon_lon, polygon_lat):
+        """
+        Return the mask of the locations inside a polygon
+        whose edges are straight lines of the projection.
+        """
+
+        x, y = self.project(lon, lat)
+        polygon_x, polygon_y = self.project(polygon_lon, polygon_lat)
+        return points_in_polygon(x, y, polygon_x, polygon_y)
 
 
 def greg2julian(year, month, day, hour, minute, second):
@@ -115,3 +660,199 @@ def greg2julian(year, month, day, hour, minute, second):
              4.0) + np.floor((275.0 * month) / 9.0) + day +\
              1721028.5 + (timeut / 24.0)
     return jd
+
+
+class DerivedColumns(object):
+    """
+    DerivedColumns computes on first use, and caches,
+    the columns derived from the catalogue by the
+    scientific functions: decimal year, epoch time,
+    longitude and latitude in radians, cosine of the
+    latitude and position of the epicentre on the
+    unit sphere. The distance checks of projected
+    derived columns are planar, in a LocalProjection
+    of the epicentres.
+    """
+
+    def __init__(self, year, month, day, longitude, latitude, hour=None,
+        minute=None, second=None):
+        """
+        Constructor
+        :param year: year column from catalogue matrix
+        :type year: numpy.ndarray
+        :param month: month column from catalogue matrix
+        :type month: numpy.ndarray
+        :param day: day column from catalogue matrix
+        :type day: numpy.ndarray
+        :param longitude: longitude column from catalogue matrix
+        :type longitude: numpy.ndarray
+        :param latitude: latitude column from catalogue matrix
+        :type latitude: numpy.ndarray
+        :keyword hour: hour column, zero if not given
+        :type hour: numpy.ndarray
+        :keyword minute: minute column, zero if not given
+        :type minute: numpy.ndarray
+        :keyword second: second column, zero if not given
+        :type second: numpy.ndarray
+        """
+
+        self.year = year
+        self.month = month
+        self.day = day
+        self.longitude = longitude
+        self.latitude = latitude
+        self.hour = hour
+        self.minute = minute
+        self.second = second
+        self._columns = {}
+        # local projection of planar distance checks, and the
+        # maximum error (km) of the planar distances
+        self.projection = None
+        self.distance_error = 0.
+
+    @classmethod
+    def from_matrix(cls, catalog_matrix):
+        """
+        Create the derived columns of a catalogue matrix,
+        whose first columns are `year`, `month`, `day`,
+        `longitude`, `latitude`.
+        """
+
+        return cls(*[catalog_matrix[:, index] for index in range(5)])
+
+    def subset(self, rows):
+        """
+        Return the derived columns of the given rows
+        (index or boolean vector), the columns already
+        computed are selected instead of computed again.
+        """
+
+        subset = DerivedColumns(*[None if column is None else column[rows]
+            for column in (self.year, self.month, self.day, self.longitude,
+                self.latitude, self.hour, self.minute, self.second)])
+        subset._columns = dict((name, column[rows])
+            for name, column in self._columns.items())
+        subset.projection = self.projection
+        subset.distance_error = self.distance_error
+        return subset
+
+    def projected(self, tolerance):
+        """
+        Return the derived columns whose distance checks are
+        planar in the LocalProjection centred on the epicentres,
+        if the bound of the distance error over their extent
+        (max_distance_error) is below tolerance km, these
+        derived columns otherwise.
+        """
+
+        if self.projection is not None or not len(self.longitude):
+            return self
+
+        projection = LocalProjection.from_points(self.longitude,
+            self.latitude)
+        error = projection.max_distance_error(self.longitude, self.latitude)
+        if error > tolerance:
+            return self
+
+        projected = self.subset(slice(None))
+        projected._columns['projected_xy'] = np.column_stack(
+            projection.project(self.longitude, self.latitude))
+        projected.projection = projection
+        projected.distance_error = error
+        return projected
+
+    def _column(self, name, compute):
+        """Return the cached column, computing it if needed"""
+
+        if name not in self._columns:
+            self._columns[name] = compute()
+        return self._columns[name]
+
+    @property
+    def decimal_year(self):
+        """Decimal year column"""
+
+        return self._column('decimal_year',
+            lambda: decimal_year(self.year, self.month, self.day))
+
+    @property
+    def epoch_time(self):
+        """Origin time column as int64 epoch microseconds"""
+
+        return self._column('epoch_time',
+            lambda: epoch_time(self.year, self.month, self.day, self.hour,
+                self.minute, self.second))
+
+    @property
+    def longitude_radians(self):
+        """Longitude column in radians"""
+
+        return self._column('longitude_radians',
+            lambda: DEGREES_TO_RADIANS * self.longitude)
+
+    @property
+    def latitude_radians(self):
+        """Latitude column in radians"""
+
+        return self._column('latitude_radians',
+            lambda: DEGREES_TO_RADIANS * self.latitude)
+
+    @property
+    def cos_latitude(self):
+        """Cosine of the latitude column"""
+
+        return self._column('cos_latitude',
+            lambda: np.cos(self.latitude_radians))
+
+    @classmethod
+    def from_locations(cls, longitude, latitude):
+        """
+        Create the derived columns of locations
+        given only by longitude and latitude.
+        """
+
+        return cls(None, None, None, np.atleast_1d(longitude),
+            np.atleast_1d(latitude))
+
+    def within_distance(self, rows, i, distance, other=None):
+        """
+        Return the mask of the locations in rows (boolean mask,
+        index vector or slice) within distance km from the
+        location i of other (self if not given). The dot
+        products of the unit sphere positions decide, haversine
+        decides only the locations at the threshold up to
+        rounding, so that the mask equals the haversine
+        comparison. Projected derived columns compare the
+        planar distances of their own locations instead,
+        within distance_error of the haversine ones, as the
+        error is bounded only in the extent of the locations.
+        """
+
+        if self.projection is not None and other is None:
+            xy = self._columns['projected_xy']
+            return LocalProjection.within_distance(xy[rows, 0],
+                xy[rows, 1], xy[i, 0], xy[i, 1], distance)
+
+        if other is None:
+            other = self
+        within, unsure = within_distance(self.unit_xyz[rows],
+            other.unit_xyz[i], distance, margin=True)
+        if unsure.any():
+            within[unsure] = haversine_to_point(
+                self.longitude_radians[rows][unsure],
+                self.latitude_radians[rows][unsure],
+                other.longitude_radians[i], other.latitude_radians[i],
+                radians=True, cos_lat=self.cos_latitude[rows][unsure],
+                cos_lat0=other.cos_latitude[i]) <= distance
+        return within
+
+    @property
+    def unit_xyz(self):
+        """
+        Matrix of the (x, y, z) positions of
+        the epicentres on the unit sphere.
+        """
+
+        return self._column('unit_xyz', lambda: unit_sphere_xyz(
+            self.longitude_radians, self.latitude_radians,
+            self.cos_latitude))
@@ -23,14 +23,21 @@ algorithms are:
 
 * GardnerKnopoff
 * Afteran
+* Reasenberg
 """
 
 import abc
 import numpy as np
 import logging
 
-from mtoolkit.scientific.catalogue_utilities import (decimal_year,
-                                                        haversine)
+from multiprocessing import Pool, cpu_count
+
+from mtoolkit.scientific.catalogue_utilities import (DerivedColumns,
+                                                        MICROSECONDS_PER_DAY,
+                                                        days_to_epoch,
+                                                        time_window_rows)
+from mtoolkit.scientific.spatial_index import (SphericalGridIndex,
+                                               SpaceTimeIndex, slab_tiles)
 
 
 LOGGER = logging.getLogger('mt_logger')
@@ -39,6 +46,15 @@ TDW_GARDNERKNOPOFF = 'GardnerKnopoff'
 TDW_GRUENTHAL = 'Gruenthal'
 TDW_UHRHAMMER = 'Uhrhammer'
 
+# Widening (decimal years) of the time windows searched in
+# the time ordered catalogue, larger than the rounding errors
+TIME_WINDOW_SLACK = 1e-9
+
+# Crack radius (km) of a magnitude 0 event, the crack radius
+# of an event of magnitude M is CRACK_RADIUS * 10 ** (0.4 * M)
+# (Kanamori and Anderson, 1975)
+CRACK_RADIUS = 0.011
+
 
 # Time dist window objects
 
@@ -151,8 +167,112 @@ time_dist_windows = {TDW_GARDNERKNOPOFF: GardnerKnopoffWindow(),
                      TDW_UHRHAMMER: UhrhammerWindow()}
 
 
+def _time_bounds(year_dec, sw_time, fs_time_prop):
+    """
+    Return the events in time order and the bounds of the
+    slices of the time ordered events searched for the time
+    windows of each event, found by binary search and widened
+    by TIME_WINDOW_SLACK so that the rounding of the bounds
+    can't miss an event.
+    """
+
+    time_order = np.argsort(year_dec, kind='mergesort')
+    sorted_year = year_dec[time_order]
+    lower = np.searchsorted(sorted_year,
+        year_dec - sw_time * fs_time_prop - TIME_WINDOW_SLACK, side='left')
+    upper = np.searchsorted(sorted_year,
+        year_dec + sw_time + TIME_WINDOW_SLACK, side='right')
+    return time_order, lower, upper
+
+
+def _gardner_knopoff_window(derived, bounds, sw_space, sw_time,
+                            fs_time_prop, i):
+    """
+    Return the positions of the events inside both the
+    fore- and aftershock time windows and the distance
+    window of the event i.
+    """
+
+    time_order, lower, upper = bounds
+    year_dec = derived.decimal_year
+    candidates = time_order[lower[i]:upper[i]]
+    dt = year_dec[candidates] - year_dec[i]
+    candidates = candidates[np.logical_and(
+        dt >= (-sw_time[i] * fs_time_prop), dt <= sw_time[i])]
+    # Of those events inside time window, find those inside distance
+    # window
+    return candidates[derived.within_distance(candidates, i, sw_space[i])]
+
+
+def _tile_windows(task):
+    """
+    Search the windows of the core events of a tile, a task is
+    the tuple of the core positions, the derived columns, space
+    windows, time windows (None to search the space windows
+    only) of the tile members and the foreshock time window
+    proportion. Return the windows of the core events as the
+    offsets and positions of their events, positions are
+    among the members.
+    """
+
+    core, derived, sw_space, sw_time, fs_time_prop = task
+    if sw_time is None:
+        index = SphericalGridIndex(derived, np.max(sw_space))
+        windows = [index.query_row(i, sw_space[i]) for i in core]
+    else:
+        bounds = _time_bounds(derived.decimal_year, sw_time, fs_time_prop)
+        windows = [_gardner_knopoff_window(derived, bounds, sw_space,
+            sw_time, fs_time_prop, i) for i in core]
+
+    offsets = np.cumsum([0] + [len(window) for window in windows])
+    return offsets, np.concatenate(windows or [np.zeros(0, dtype=int)])
+
+
+def _tiled_windows(derived, sw_space, sw_time=None, fs_time_prop=0,
+                   tiles=1, workers=None):
+    """
+    Search the windows of all the events in spatial tiles,
+    processed by a pool of workers. Each tile is searched
+    with its halo of the events within the largest space
+    window, so that the windows equal the ones of the serial
+    search. Return the list of the positions of the events
+    inside the time (if sw_time is given) and distance
+    windows of each event.
+    """
+
+    neq = len(sw_space)
+    windows = [None] * neq
+    if not neq:
+        return windows
+    # Columns computed once, then selected for each tile
+    derived.decimal_year
+    derived.unit_xyz
+
+    slabs = slab_tiles(derived.unit_xyz, tiles,
+        np.max(sw_space) + derived.distance_error)
+    tasks = [(np.searchsorted(members, core), derived.subset(members),
+        sw_space[members], None if sw_time is None else sw_time[members],
+        fs_time_prop) for core, members in slabs]
+
+    workers = workers or cpu_count()
+    if len(tasks) < 2 or workers < 2:
+        results = [_tile_windows(task) for task in tasks]
+    else:
+        pool = Pool(min(len(tasks), workers))
+        try:
+            results = pool.map(_tile_windows, tasks)
+        finally:
+            pool.terminate()
+
+    for (core, members), (offsets, positions) in zip(slabs, results):
+        for k, i in enumerate(core):
+            windows[i] = members[positions[offsets[k]:offsets[k + 1]]]
+    return windows
+
+
 def gardner_knopoff_decluster(
-    catalog_matrix, window_opt=TDW_GARDNERKNOPOFF, fs_time_prop=0):
+    catalog_matrix, window_opt=TDW_GARDNERKNOPOFF, fs_time_prop=0,
+    derived=None, tiles=1, workers=None):
     """
     Gardner Knopoff algorithm.
 
@@ -165,6 +285,15 @@ def gardner_knopoff_decluster(
     :keyword fs_time_prop: foreshock time window as a proportion of
                            aftershock time window
     :type fs_time_prop: positive float
+    :keyword derived: derived columns of the catalog matrix rows,
+                      computed from the matrix if not given
+    :type derived: DerivedColumns
+    :keyword tiles: number of spatial tiles whose windows are
+                    searched in parallel, 1 for the serial search
+    :type tiles: positive int
+    :keyword workers: number of worker processes searching
+                      the tiles, the number of cpus if not given
+    :type workers: positive int
     :returns: **vcl vector** indicating cluster number, **vmain_shock catalog**
               containing non-clustered events, **flagvector** indicating
               which eq events belong to a cluster
@@ -174,9 +303,8 @@ def gardner_knopoff_decluster(
     # Get relevent parameters
     m = catalog_matrix[:, 5]
     neq = np.shape(catalog_matrix)[0]  # Number of earthquakes
-    # Get decimal year (needed for time windows)
-    year_dec = decimal_year(
-        catalog_matrix[:, 0], catalog_matrix[:, 1], catalog_matrix[:, 2])
+    if derived is None:
+        derived = DerivedColumns.from_matrix(catalog_matrix)
     # Get space and time windows corresponding to each event
     sw_space, sw_time = time_dist_windows[window_opt].calc(m)
     eqid = np.arange(0, neq, 1)  # Initial Position Identifier
@@ -187,44 +315,46 @@ def gardner_knopoff_decluster(
     # Sort magnitudes into descending order
     id0 = np.flipud(np.argsort(m, kind='heapsort'))
     m = m[id0]
-    catalog_matrix = catalog_matrix[id0, :]
     sw_space = sw_space[id0]
     sw_time = sw_time[id0]
-    year_dec = year_dec[id0]
+    # Decimal year (needed for time windows) and unit sphere
+    # positions are computed once for all the events
+    derived = derived.subset(id0)
+    year_dec = derived.decimal_year
     eqid = eqid[id0]
     flagvector = np.zeros(neq, dtype=int)
+    if tiles > 1:
+        # The windows are searched in parallel, then the clusters
+        # are allocated in order of magnitude as in the serial search
+        windows = _tiled_windows(derived, sw_space, sw_time, fs_time_prop,
+            tiles, workers)
+        window = windows.__getitem__
+    else:
+        bounds = _time_bounds(year_dec, sw_time, fs_time_prop)
+        window = lambda i: _gardner_knopoff_window(derived, bounds,
+            sw_space, sw_time, fs_time_prop, i)
     #Begin cluster identification
     clust_index = 0
     for i in range(0, neq - 1):
         if vcl[i] == 0:
             # Find Events inside both fore- and aftershock time windows
-            dt = year_dec - year_dec[i]
-            vsel = np.logical_and(dt >= (-sw_time[i] * fs_time_prop),
-                                              dt <= sw_time[i],
-                                              flagvector == 0)
-            # Of those events inside time window, find those inside distance
-            # window
-            vsel1 = haversine(
-                catalog_matrix[vsel, 3], catalog_matrix[vsel, 4],
-                catalog_matrix[i, 3], catalog_matrix[i, 4]) <= sw_space[i]
-            vsel[vsel] = vsel1
-            temp_vsel = np.copy(vsel)
-            temp_vsel[i] = False
-            if any(temp_vsel):
+            # and inside distance window
+            vsel = window(i)
+            dt = year_dec[vsel] - year_dec[i]
+            if np.any(vsel != i):
                 # Allocate a cluster number
                 vcl[vsel] = clust_index + 1
                 flagvector[vsel] = 1
                 # For those events in the cluster before the main event,
                 # flagvector is equal to -1
-                temp_vsel[dt >= 0.0] = False
-                flagvector[temp_vsel] = -1
+                flagvector[vsel[dt < 0.0]] = -1
                 flagvector[i] = 0
                 clust_index += 1
 
-    # Re-sort the catalog_matrix into original order
+    # Re-sort the vectors into original order, the catalog_matrix
+    # is left in place
     id1 = np.argsort(eqid, kind='heapsort')
     eqid = eqid[id1]
-    catalog_matrix = catalog_matrix[id1, :]
     vcl = vcl[id1]
     flagvector = flagvector[id1]
     # Now to produce a catalogue with aftershocks purged
@@ -233,44 +363,69 @@ def gardner_knopoff_decluster(
     return vcl, vmain_shock, flagvector
 
 
-def _find_aftershocks(dtime, nval, time_window):
+def _time_window_chain(dtime, time_window, candidates):
+    """
+    Searches for the chain of events within the moving time
+    window, started by the first event: in order, each of the
+    candidates joins the chain when its time follows the last
+    joined event by at most time_window. Each step is a
+    vectorized search of the next joining event.
+    :param dtime: time since main event
+    :type dtime: numpy.ndarray
+    :param time_window: Length (in decimal years) of moving time window
+    :type time_window: positive float
+    :param candidates: ascending positions (> 0) of the candidates
+    :type candidates: numpy.ndarray
+    :returns: **vsel** index vector for the events joining the chain
+    :rtype: numpy.ndarray
+    """
+
+    vsel = np.zeros(len(dtime), dtype=bool)
+    initval = dtime[0]
+    # Events before the start of the chain never join it
+    candidates = candidates[dtime[candidates] >= initval]
+    times = dtime[candidates]
+
+    start = 0
+    while start < len(times):
+        ddt = times[start:] - initval
+        joining = np.flatnonzero(np.logical_and(ddt >= 0.0,
+            ddt <= time_window))
+        if not len(joining):
+            break
+        start += joining[0]
+        vsel[candidates[start]] = True
+        # Reset time window to new event time
+        initval = times[start]
+        start += 1
+    return vsel
+
+
+def _find_aftershocks(dtime, time_window):
     """
     Searches for aftershocks within the moving
     time window
     :param dtime: time since main event
     :type dtime: numpy.ndarray
-    :param nval: number of events in search window
-    :type nval: int
-    :param time_window: Length (in days) of moving time window
+    :param time_window: Length (in decimal years) of moving time window
     :type time_window: positive float
     :returns: **vsel** index vector for aftershocks
     :rtype: numpy.ndarray
     """
 
-    vsel = np.array(np.ones(nval), dtype=bool)
-    initval = dtime[0]  # Start with the mainshock
-
-    j = 1
-    while j < nval:
-        ddt = dtime[j] - initval
-        # Is event after previous event and within time window?
-        vsel[j] = np.logical_and(ddt >= 0.0, ddt <= time_window)
-        if vsel[j]:
-            # Reset time window to new event time
-            initval = dtime[j]
-        j += 1
+    vsel = _time_window_chain(dtime, time_window,
+        np.arange(1, len(dtime)))
+    vsel[0] = True
     return vsel
 
 
-def _find_foreshocks(dtime, nval, time_window, vsel_aftershocks):
+def _find_foreshocks(dtime, time_window, vsel_aftershocks):
     """
     Searches for foreshocks within the moving
-    time window
+    time window, backwards in time
     :param dtime: time since main event
     :type dtime: numpy.ndarray
-    :param nval: number of events in search window
-    :type nval: int
-    :param time_window: Length (in days) of moving time window
+    :param time_window: Length (in decimal years) of moving time window
     :type time_window: positive float
     :param vsel_aftershocks: index vector for aftershocks
     :type vsel_aftershocks: numpy.ndarray
@@ -278,29 +433,26 @@ def _find_foreshocks(dtime, nval, time_window, vsel_aftershocks):
     :rtype: numpy.ndarray
     """
 
-    j = 1
-    vsel = np.array(np.zeros(nval), dtype=bool)
-    initval = dtime[0]
+    # Events already allocated as aftershocks are skipped. The
+    # original search stepped twice past each aftershock it met,
+    # so the event following a run of an odd number of
+    # aftershocks is skipped too
+    positions = np.arange(len(dtime))
+    aftershocks = np.copy(vsel_aftershocks)
+    aftershocks[0] = False
+    last_other = np.maximum.accumulate(np.where(aftershocks, 0, positions))
+    run = np.zeros(len(dtime), dtype=int)
+    run[1:] = positions[:-1] - last_other[:-1]
+    candidates = np.flatnonzero(np.logical_and(~aftershocks, run % 2 == 0))
 
-    while j < nval:
-        if vsel_aftershocks[j]:
-        # Event already allocated as an aftershock - skip
-            j += 1
-        else:
-            ddt = dtime[j] - initval
-            # Is event before previous event and within time window?
-            vsel[j] = np.logical_and(ddt <= 0.0,
-                                      ddt >= -(time_window))
-            if vsel[j]:
-            # Yes, reset time window to new event
-                initval = dtime[j]
-        j += 1
-
-    return vsel
+    # negated times make the chain go backwards
+    return _time_window_chain(-dtime, time_window,
+        candidates[candidates > 0])
 
 
 def afteran_decluster(
-    catalogue_matrix, window_opt=TDW_GARDNERKNOPOFF, time_window=60.):
+    catalogue_matrix, window_opt=TDW_GARDNERKNOPOFF, time_window=60.,
+    derived=None, tiles=1, workers=None):
     '''AFTERAN declustering algorithm.
     ||(Musson, 1999, "Probabilistic Seismic Hazard Maps for the North Balkan
        region", Annali di Geofisica, 42(6), 1109 - 1124) ||
@@ -312,6 +464,15 @@ def afteran_decluster(
     :type window_opt: string
     :keyword time_window: Length (in days) of moving time window
     :type time_window: positive float
+    :keyword derived: derived columns of the catalog matrix rows,
+                      computed from the matrix if not given
+    :type derived: DerivedColumns
+    :keyword tiles: number of spatial tiles whose windows are
+                    searched in parallel, 1 for the serial search
+    :type tiles: positive int
+    :keyword workers: number of worker processes searching
+                      the tiles, the number of cpus if not given
+    :type workers: positive int
     :returns: **vcl vector** indicating cluster number, **vmain_shock catalog**
               containing non-clustered events, **flagvector** indicating
               which eq events belong to a cluster
@@ -326,9 +487,8 @@ def afteran_decluster(
     mag = catalogue_matrix[:, 5]
 
     neq = np.shape(catalogue_matrix)[0]  # Number of earthquakes
-    # Get decimal year (needed for time windows)
-    year_dec = decimal_year(catalogue_matrix[:, 0], catalogue_matrix[:, 1],
-                            catalogue_matrix[:, 2])
+    if derived is None:
+        derived = DerivedColumns.from_matrix(catalogue_matrix)
 
     # Get space windows corresponding to each event
     sw_space = time_dist_windows[window_opt].calc(mag)[0]
@@ -336,60 +496,220 @@ def afteran_decluster(
     eqid = np.arange(0, neq, 1)  # Initial Position Identifier
 
     # Pre-allocate cluster index vectors
-    vcl = np.zeros((neq, 1), dtype=int)
-    flagvector = np.zeros((neq, 1), dtype=int)
+    vcl = np.zeros(neq, dtype=int)
+    flagvector = np.zeros(neq, dtype=int)
     # Sort magnitudes into descending order
     id0 = np.flipud(np.argsort(mag, kind='heapsort'))
     mag = mag[id0]
-    catalogue_matrix = catalogue_matrix[id0, :]
     sw_space = sw_space[id0]
-    year_dec = year_dec[id0]
+    # Decimal year (needed for time windows) and unit sphere
+    # positions are computed once for all the events
+    derived = derived.subset(id0)
+    year_dec = derived.decimal_year
     eqid = eqid[id0]
+    if tiles > 1:
+        # The distance windows are searched in parallel, then the
+        # clusters are allocated in order of magnitude as in the
+        # serial search
+        windows = _tiled_windows(derived, sw_space, tiles=tiles,
+            workers=workers)
+        window = lambda i: windows[i][vcl[windows[i]] == 0]
+    else:
+        # Events not allocated to a cluster, indexed by position
+        index = SphericalGridIndex(derived, np.max(sw_space) if neq else 0.)
+        window = lambda i: index.query_row(i, sw_space[i])
 
-    i = 0
     clust_index = 0
-    while i < neq:
+    for i in range(neq):
         if vcl[i] == 0:
             # Earthquake not allocated to cluster - perform calculation
-            # Perform distance calculation
-            mdist = haversine(catalogue_matrix[:, 3], catalogue_matrix[:, 4],
-                          catalogue_matrix[i, 3], catalogue_matrix[i, 4])
-
             # Select earthquakes inside distance window and not in cluster
-            vsel = np.logical_and(mdist <= sw_space[i], vcl == 0).flatten()
-            dtime = year_dec[vsel] - year_dec[i]
+            rows = window(i)
+            if len(rows) < 2:
+                # No other event can join a cluster
+                continue
+            dtime = year_dec[rows] - year_dec[i]
 
-            nval = np.shape(dtime)[0]  # Number of events inside valid window
-            # Pre-allocate boolean array (all True)
+            vsel1 = _find_aftershocks(dtime, time_window)
+            vsel2 = _find_foreshocks(dtime, time_window, vsel1)
 
-            vsel1 = _find_aftershocks(dtime, nval, time_window)
-            vsel2 = _find_foreshocks(dtime, nval, time_window, vsel1)
-
-            temp_vsel = np.copy(vsel)
-            temp_vsel[vsel] = np.logical_or(vsel1, vsel2)
-            if np.shape(np.nonzero(temp_vsel)[0])[0] > 1:
+            clustered = rows[np.logical_or(vsel1, vsel2)]
+            if len(clustered) > 1:
                 # Contains clustered events - allocate a cluster index
-                vcl[temp_vsel] = clust_index + 1
+                vcl[clustered] = clust_index + 1
+                if tiles <= 1:
+                    index.remove(clustered)
                 # Remove mainshock from cluster
                 vsel1[0] = False
                 # Assign markers to aftershocks and foreshocks
-                temp_vsel = np.copy(vsel)
-                temp_vsel[vsel] = vsel1
-                flagvector[temp_vsel] = 1
-                vsel[vsel] = vsel2
-                flagvector[vsel] = -1
+                flagvector[rows[vsel1]] = 1
+                flagvector[rows[vsel2]] = -1
                 clust_index += 1
-        i += 1
 
-    # Now have events - re-sort array back into chronological order
-    # Re-sort the data into original order
+    # Re-sort the vectors into original order, the catalogue_matrix
+    # is left in place
     id1 = np.argsort(eqid, kind='heapsort')
     eqid = eqid[id1]
-    catalogue_matrix = catalogue_matrix[id1, :]
     vcl = vcl[id1]
     flagvector = flagvector[id1]
 
     # Now to produce a catalogue with aftershocks purged
     vmain_shock = catalogue_matrix[np.nonzero(flagvector == 0)[0], :]
 
-    return vcl.flatten(), vmain_shock, flagvector.flatten()
+    return vcl, vmain_shock, flagvector
+
+
+def reasenberg_decluster(
+    catalog_matrix, rfact=10., xmeff=1.5, xk=0.5, taumin=1., taumax=10.,
+    plev=0.95, derived=None):
+    """
+    Reasenberg algorithm.
+    ||(Reasenberg, 1985, "Second-order moment of central California
+       seismicity, 1969-1982", J. Geophys. Res., 90, 5479 - 5495) ||
+
+    Events are processed in time order, each one links the later
+    events inside its look-ahead time and its interaction zone
+    (the crack radius times rfact around the event and around the
+    largest event of its cluster) into its cluster, merging the
+    clusters already linked. The look-ahead time is taumin for
+    non-clustered events, otherwise the time in which an event
+    above the effective magnitude cut-off is expected with
+    probability plev, following Omori's law, between taumin and
+    taumax. The largest event of each cluster is its mainshock.
+
+    :param catalog_matrix: eq catalog in a matrix format with these columns in
+                            order: `year`, `month`, `day`, `longitude`,
+                            `latitude`, `Mw`
+    :type catalog_matrix: numpy.ndarray
+    :keyword rfact: number of crack radii of the interaction zone
+    :type rfact: positive float
+    :keyword xmeff: effective lower magnitude cut-off for the catalog
+    :type xmeff: float
+    :keyword xk: factor raising the effective cut-off within clusters
+    :type xk: positive float
+    :keyword taumin: look-ahead time (in days) for non-clustered events
+    :type taumin: positive float
+    :keyword taumax: maximum look-ahead time (in days) for clustered events
+    :type taumax: positive float
+    :keyword plev: confidence level of the next event of a cluster
+    :type plev: float in range 0.0 <= plev < 1.0
+    :keyword derived: derived columns of the catalog matrix rows,
+                      computed from the matrix if not given
+    :type derived: DerivedColumns
+    :returns: **vcl vector** indicating cluster number, **vmain_shock catalog**
+              containing non-clustered events, **flagvector** indicating
+              which eq events belong to a cluster
+    :rtype: numpy.ndarray
+    """
+
+    neq = np.shape(catalog_matrix)[0]  # Number of earthquakes
+    if derived is None:
+        derived = DerivedColumns.from_matrix(catalog_matrix)
+
+    # Sort events into time order
+    id0 = np.argsort(derived.epoch_time, kind='mergesort')
+    mag = catalog_matrix[id0, 5]
+    derived = derived.subset(id0)
+    # Epoch time and interaction radius of each event
+    time = derived.epoch_time
+    radius = rfact * CRACK_RADIUS * np.power(10.0, 0.4 * mag)
+    # The look-ahead times are at most taumax days, the events
+    # linked by an event are searched in the bins of its time
+    index = SpaceTimeIndex(derived, time, np.max(radius) if neq else 0.,
+        days_to_epoch(max(taumax, 1.)))
+    confidence = -np.log(1. - plev)
+
+    vcl = np.zeros(neq, dtype=int)
+    # Members and largest event of each cluster
+    members = {}
+    biggest = {}
+    clust_index = 0
+    for i in range(neq):
+        cluster = vcl[i]
+        tau = taumin
+        if cluster:
+            if mag[i] >= mag[biggest[cluster]]:
+                biggest[cluster] = i
+            else:
+                # Look-ahead time from the effective cut-off
+                # raised by the largest event of the cluster
+                big = biggest[cluster]
+                deltam = (1. - xk) * mag[big] - xmeff
+                tau = min(max(confidence * (time[i] - time[big]) /
+                    float(MICROSECONDS_PER_DAY) /
+                    np.power(10.0, (deltam - 1.) * 2. / 3.), taumin), taumax)
+
+        # The events are sorted by time, the later events within
+        # the look-ahead time are the rows up to last
+        end = time[i] + days_to_epoch(tau)
+        last = time_window_rows(time, time[i], end)[1]
+        if last <= i + 1:
+            continue
+        linked = index.query_row(i, radius[i], time[i], end)
+        if cluster and biggest[cluster] != i:
+            big = biggest[cluster]
+            linked = np.union1d(linked,
+                index.query_row(big, radius[big], time[i], end))
+        # Only the later events are linked
+        linked = linked[linked > i]
+        if not len(linked):
+            continue
+
+        clusters = np.unique(vcl[linked])
+        clusters = [other for other in clusters if other and other != cluster]
+        if cluster:
+            clusters.append(cluster)
+        if not clusters:
+            clust_index += 1
+            cluster = vcl[i] = clust_index
+            members[cluster] = [i]
+            biggest[cluster] = i
+        else:
+            # Merge the clusters linked into the largest one
+            clusters.sort(key=lambda other: -len(members[other]))
+            cluster = clusters[0]
+            for other in clusters[1:]:
+                vcl[members[other]] = cluster
+                members[cluster].extend(members.pop(other))
+                # as in the time ordered search, the later of two
+                # equal largest events is the largest one
+                if (mag[biggest[other]], biggest[other]) > \
+                    (mag[biggest[cluster]], biggest[cluster]):
+                    biggest[cluster] = biggest[other]
+                del biggest[other]
+            if not vcl[i]:
+                vcl[i] = cluster
+                members[cluster].append(i)
+        joining = linked[vcl[linked] == 0]
+        vcl[joining] = cluster
+        members[cluster].extend(joining)
+
+    # Number the clusters in order of their first event
+    clustered = np.flatnonzero(vcl)
+    clusters, first = np.unique(vcl[clustered], return_index=True)
+    numbers = np.zeros(clust_index + 1, dtype=int)
+    numbers[clusters[np.argsort(first)]] = np.arange(1, len(clusters) + 1)
+    vcl = numbers[vcl]
+
+    # The mainshock of each cluster is its largest (and
+    # earliest) event, clustered events before it are foreshocks
+    ranking = clustered[np.lexsort(
+        (clustered, -mag[clustered], vcl[clustered]))]
+    leading = np.ones(len(ranking), dtype=bool)
+    leading[1:] = np.diff(vcl[ranking]) != 0
+    mainshock = np.zeros(len(clusters) + 1, dtype=int)
+    mainshock[vcl[ranking[leading]]] = ranking[leading]
+    flagvector = np.zeros(neq, dtype=int)
+    flagvector[clustered] = np.where(
+        clustered < mainshock[vcl[clustered]], -1, 1)
+    flagvector[ranking[leading]] = 0
+
+    # Re-sort the data into original order
+    id1 = np.argsort(id0, kind='heapsort')
+    vcl = vcl[id1]
+    flagvector = flagvector[id1]
+
+    # Now to produce a catalogue with aftershocks purged
+    vmain_shock = catalog_matrix[np.nonzero(flagvector == 0)[0], :]
+
+    return vcl, vmain_shock, flagvector
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The purpose of this module is to provide functions
+which identify the same earthquake reported by
+several agencies in a merged eq catalogue.
+Duplicated events are found by a sweep over the
+events sorted by time, where only events falling
+in the same or in a neighbouring spatial cell
+are compared.
+"""
+
+import itertools
+
+import numpy as np
+
+from mtoolkit.scientific.catalogue_utilities import (DEGREES_TO_RADIANS,
+                                                        EARTH_RADIUS,
+                                                        unit_sphere_xyz)
+
+# Offsets of the neighbouring cells, only one of each pair of
+# opposite offsets is kept, so that each pair of cells is compared once
+NEIGHBOUR_OFFSETS = [offset
+    for offset in itertools.product([-1, 0, 1], repeat=3)
+    if offset > (0, 0, 0)]
+
+
+def find_duplicates(event_time, longitude, latitude, magnitude, agency,
+    agency_priority, time_window, distance_window, magnitude_window,
+    unit_xyz=None):
+    """
+    Find duplicated events, two events reported by different agencies
+    are duplicates when their origin times, epicentres and magnitudes
+    differ less than the given windows.
+    Duplicates are grouped transitively, in each group the solution of
+    the agency with the highest priority is preferred, ties are solved
+    by the catalogue order.
+
+    :param event_time: origin time of the events
+    :type event_time: numpy.ndarray
+    :param longitude: longitude of the events
+    :type longitude: numpy.ndarray
+    :param latitude: latitude of the events
+    :type latitude: numpy.ndarray
+    :param magnitude: magnitude of the events
+    :type magnitude: numpy.ndarray
+    :param agency: agency of the events
+    :type agency: numpy.ndarray
+    :param agency_priority: agencies in order of preference, agencies
+                            not listed have the lowest priority
+    :type agency_priority: list
+    :param time_window: maximum origin time difference, in the
+                        unit of event_time
+    :type time_window: positive float or int
+    :param distance_window: maximum epicentral distance in km
+    :type distance_window: positive float
+    :param magnitude_window: maximum magnitude difference
+    :type magnitude_window: positive float
+    :keyword unit_xyz: positions of the epicentres on the unit sphere,
+                       computed from longitude and latitude if not given
+    :type unit_xyz: numpy.ndarray
+    :returns: **vgroup vector** indicating the duplicates group number
+              (0 for unique events), **flag_vector** indicating the
+              duplicated events which are not the preferred solution
+    :rtype: numpy.ndarray
+    """
+
+    neq = len(event_time)
+    if unit_xyz is None:
+        unit_xyz = unit_sphere_xyz(DEGREES_TO_RADIANS * longitude,
+            DEGREES_TO_RADIANS * latitude)
+    first, second = _candidate_pairs(event_time, unit_xyz, time_window,
+        distance_window)
+
+    # Events of the same agency are distinct events
+    duplicated = np.logical_and(agency[first] != agency[second],
+        np.abs(magnitude[first] - magnitude[second]) <= magnitude_window)
+    first, second = first[duplicated], second[duplicated]
+
+    group = _connected_components(neq, first, second)
+
+    # Rank of each event, the preferred solution has the lowest rank
+    ranks = dict((name, rank) for rank, name in enumerate(agency_priority))
+    agency_rank = np.array([ranks.get(name, len(ranks)) for name in agency],
+        dtype=int)
+    order = np.lexsort((np.arange(neq), agency_rank, group))
+    first_in_group = np.ones(neq, dtype=bool)
+    first_in_group[1:] = group[order][1:] != group[order][:-1]
+    preferred = np.zeros(neq, dtype=bool)
+    preferred[order[first_in_group]] = True
+
+    grouped = np.zeros(neq, dtype=bool)
+    grouped[first] = True
+    grouped[second] = True
+
+    vgroup = np.zeros(neq, dtype=int)
+    vgroup[grouped] = np.unique(group[grouped],
+        return_inverse=True)[1] + 1
+    flag_vector = np.logical_and(grouped, ~preferred).astype(int)
+
+    return vgroup, flag_vector
+
+
+def _candidate_pairs(event_time, xyz, time_window, distance_window):
+    """
+    Return the pairs of events (i, j) with i < j closer than the
+    time and distance windows. Epicentres are placed on the unit
+    sphere and bucketed in cubic cells whose side is the chord of
+    the distance window, so that close events fall in the same
+    or in neighbouring cells.
+    """
+
+    neq = len(event_time)
+    if not neq:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+    chord = 2. * np.sin(min(distance_window / (2. * EARTH_RADIUS),
+        np.pi / 2.))
+    cells = np.floor(xyz / max(chord, 1e-9)).astype(np.int64)
+    cells -= cells.min(axis=0) - 1
+    base = cells.max() + 2
+
+    def encode(cell):
+        """Return a scalar key for each cell"""
+        return (cell[:, 0] * base + cell[:, 1]) * base + cell[:, 2]
+
+    # Each event is placed in its own cell and, as a neighbour,
+    # in the cells preceding its own by one of the offsets
+    home = encode(cells)
+    keys = [home]
+    for offset in NEIGHBOUR_OFFSETS:
+        keys.append(encode(cells - offset))
+    keys = np.concatenate(keys)
+    events = np.tile(np.arange(neq), len(NEIGHBOUR_OFFSETS) + 1)
+    is_home = np.arange(len(keys)) < neq
+
+    # Neighbour records in cells without home records are useless
+    useful = np.in1d(keys, home)
+    keys, events, is_home = keys[useful], events[useful], is_home[useful]
+
+    order = np.lexsort((event_time[events], keys))
+    keys, events, is_home = keys[order], events[order], is_home[order]
+    times = event_time[events]
+
+    first, second = [], []
+    active = np.arange(len(keys))
+    step = 1
+    while len(active):
+        active = active[active + step < len(keys)]
+        following = active + step
+        # Records are sorted by time in each cell, when a record is too
+        # far from the following one it is far from all the next ones
+        close = np.logical_and(keys[following] == keys[active],
+            times[following] - times[active] <= time_window)
+        active, following = active[close], following[close]
+
+        # Pairs of neighbour records are compared in their own cells
+        compared = np.logical_or(is_home[active], is_home[following])
+        first.append(events[active[compared]])
+        second.append(events[following[compared]])
+        step += 1
+
+    first = np.concatenate(first) if first else np.zeros(0, dtype=int)
+    second = np.concatenate(second) if second else np.zeros(0, dtype=int)
+    pairs = np.column_stack((np.minimum(first, second),
+        np.maximum(first, second)))
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+
+    # The chord is monotonic with the great circle distance
+    close = np.sum((xyz[pairs[:, 0]] - xyz[pairs[:, 1]]) ** 2, axis=1) <= \
+        chord ** 2
+    close = np.logical_and(close,
+        np.abs(event_time[pairs[:, 0]] - event_time[pairs[:, 1]]) <=
+        time_window)
+    return pairs[close, 0], pairs[close, 1]
+
+
+def _connected_components(neq, first, second):
+    """
+    Return the label of the connected component of each
+    event in the graph whose edges are the given pairs,
+    the label is the lowest event index in the component.
+    """
+
+    label = np.arange(neq)
+    changed = len(first) > 0
+    while changed:
+        previous = label.copy()
+        lowest = np.minimum(label[first], label[second])
+        np.minimum.at(label, first, lowest)
+        np.minimum.at(label, second, lowest)
+        # Pointer jumping
+        label = label[label]
+        changed = np.any(label != previous)
+    return label
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+The purpose of this module is to provide a spatial
+index of catalogue events, answering the queries of
+the events within a radius from a location (and
+within a time interval) without scanning the whole
+catalogue.
+"""
+
+import numpy as np
+
+from mtoolkit.scientific.catalogue_utilities import (EARTH_RADIUS,
+                                                        DerivedColumns)
+
+# Smallest side (unit sphere) of the cells, it bounds
+# the number of cells along each axis
+MIN_CELL_SIZE = 1e-5
+
+# Relative and absolute widening of the chord of a radius,
+# larger than the rounding errors of the unit sphere positions
+CHORD_SLACK = 1e-9
+
+
+def chord(distance):
+    """
+    Return the chord on the unit sphere of a great
+    circle distance in km, the diameter beyond half
+    the circumference.
+    """
+
+    return 2. * np.sin(np.minimum(np.asarray(distance, dtype=float) /
+        (2. * EARTH_RADIUS), np.pi / 2.))
+
+
+class SphericalGridIndex(object):
+    """
+    SphericalGridIndex buckets the unit sphere positions
+    of the events in cubic cells, whose side is the chord
+    of cell_size km (e.g. the largest space window), so
+    that the events within a radius are searched only in
+    the cells around the location. Results equal the
+    haversine comparison. Events can be removed from the
+    index, removed events are never returned.
+    """
+
+    def __init__(self, derived, cell_size):
+        """
+        Constructor
+        :param derived: derived columns of the events
+        :type derived: DerivedColumns
+        :param cell_size: size of the cells in km
+        :type cell_size: positive float
+        """
+
+        self.derived = derived
+        self.cell = max(chord(cell_size), MIN_CELL_SIZE)
+
+        xyz = derived.unit_xyz
+        self.active = np.ones(len(xyz), dtype=bool)
+        if len(xyz):
+            cells = np.floor(xyz / self.cell).astype(np.int64)
+            self.origin = cells.min(axis=0)
+            self.shape = cells.max(axis=0) - self.origin + 1
+        else:
+            cells = np.zeros((0, 3), dtype=np.int64)
+            self.origin = np.zeros(3, dtype=np.int64)
+            self.shape = np.zeros(3, dtype=np.int64)
+
+        keys = self._keys(cells - self.origin)
+        self.order = np.argsort(keys, kind='mergesort')
+        self.sorted_keys = keys[self.order]
+
+    @classmethod
+    def from_locations(cls, longitude, latitude, cell_size):
+        """
+        Create the index of locations given by
+        longitude and latitude.
+        """
+
+        return cls(DerivedColumns.from_locations(longitude, latitude),
+            cell_size)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.active))
+
+    def _keys(self, cells):
+        """Return the scalar key of each cell"""
+
+        return (cells[..., 0] * self.shape[1] + cells[..., 1]) * \
+            self.shape[2] + cells[..., 2]
+
+    def remove(self, rows):
+        """
+        Remove the events of the given rows (boolean
+        mask or index vector) from the index.
+        """
+
+        self.active[rows] = False
+
+    def column_ranges(self, xyz0, radius):
+        """
+        Return the first and last keys of the (x, y) columns
+        of cells closer than radius km to a unit sphere
+        position, the cells of each column are consecutive
+        keys.
+        """
+
+        reach = chord(radius) * (1. + CHORD_SLACK) + CHORD_SLACK
+        low = np.maximum(np.floor((xyz0 - reach) / self.cell).astype(
+            np.int64) - self.origin, 0)
+        high = np.minimum(np.floor((xyz0 + reach) / self.cell).astype(
+            np.int64) - self.origin, self.shape - 1)
+        if np.any(low > high):
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+
+        columns = (np.arange(low[0], high[0] + 1)[:, np.newaxis] *
+            self.shape[1] + np.arange(low[1], high[1] + 1)).ravel()
+        first_keys = columns * self.shape[2] + low[2]
+        return first_keys, first_keys + (high[2] - low[2])
+
+    def candidates(self, xyz0, radius):
+        """
+        Return the active events in the cells closer
+        than radius km to a unit sphere position, a
+        superset of the events within the radius.
+        """
+
+        first_keys, last_keys = self.column_ranges(xyz0, radius)
+        first = np.searchsorted(self.sorted_keys, first_keys, side='left')
+        last = np.searchsorted(self.sorted_keys, last_keys, side='right')
+        rows = _slices(self.order, first, last)
+        return np.sort(rows[self.active[rows]])
+
+    def query_row(self, i, radius, mask=None):
+        """
+        Return the sorted rows of the active events within
+        radius km from the event i, and selected by mask
+        (boolean vector over the events) if given.
+        """
+
+        return self._query(self.derived, i, radius, mask)
+
+    def query_point(self, longitude, latitude, radius, mask=None):
+        """
+        Return the sorted rows of the active events within
+        radius km from a location, and selected by mask
+        (boolean vector over the events) if given.
+        """
+
+        return self._query(DerivedColumns.from_locations(longitude,
+            latitude), 0, radius, mask)
+
+    def query_rows(self, rows, radius, mask=None):
+        """
+        Batched query_row, radius is a single one or one
+        for each row, return the list of the results.
+        """
+
+        radius = np.broadcast_to(radius, np.shape(rows))
+        return [self.query_row(i, r, mask) for i, r in zip(rows, radius)]
+
+    def query_points(self, longitude, latitude, radius, mask=None):
+        """
+        Batched query_point, radius is a single one or one
+        for each location, return the list of the results.
+        """
+
+        points = DerivedColumns.from_locations(longitude, latitude)
+        radius = np.broadcast_to(radius, np.shape(points.longitude))
+        return [self._query(points, i, r, mask)
+            for i, r in enumerate(radius)]
+
+    def _query(self, points, i, radius, mask):
+        """
+        Return the sorted rows of the active events within
+        radius km from the location i of points.
+        """
+
+        # planar distance checks may select events up to
+        # distance_error farther than the radius
+        rows = self.candidates(points.unit_xyz[i],
+            radius + self.derived.distance_error)
+        if mask is not None:
+            rows = rows[mask[rows]]
+        return rows[self.derived.within_distance(rows, i, radius, points)]
+
+
+class SpaceTimeIndex(object):
+    """
+    SpaceTimeIndex buckets the events of a SphericalGridIndex
+    in bins of their times too, so that the events within a
+    radius from a location and within a time interval are
+    searched only in the cells around the location and the
+    bins overlapping the interval.
+    """
+
+    def __init__(self, derived, time, cell_size, time_bin):
+        """
+        Constructor
+        :param derived: derived columns of the events
+        :type derived: DerivedColumns
+        :param time: times of the events, int64 epoch times are
+                     binned and compared exactly
+        :type time: numpy.ndarray
+        :param cell_size: size of the cells in km
+        :type cell_size: positive float
+        :param time_bin: length of the time bins, in the unit of time
+        :type time_bin: positive float or int
+        """
+
+        self.grid = SphericalGridIndex(derived, cell_size)
+        self.time = np.asarray(time)
+        self.time_bin = time_bin
+        self.time_origin = self.time.min() if len(self.time) else 0
+
+        # Cells holding events are numbered in key order, so
+        # that each column of cells is a range of numbers
+        keys = np.empty_like(self.grid.sorted_keys)
+        keys[self.grid.order] = self.grid.sorted_keys
+        self.cell_keys = np.unique(keys)
+        bins = self._bins(self.time)
+        self.bins = bins.max() + 1 if len(bins) else 0
+        keys = bins * len(self.cell_keys) + np.searchsorted(
+            self.cell_keys, keys)
+        self.order = np.argsort(keys, kind='mergesort')
+        self.sorted_keys = keys[self.order]
+
+    def __len__(self):
+        return len(self.time)
+
+    def _bins(self, time):
+        """Return the time bin of each time"""
+
+        return ((np.asarray(time) - self.time_origin) //
+            self.time_bin).astype(np.int64)
+
+    def candidates(self, xyz0, radius, start, end):
+        """
+        Return the events in the cells closer than radius
+        km to a unit sphere position and in the bins
+        overlapping the start, end time interval, a superset
+        of the events within the radius and the interval.
+        """
+
+        first_keys, last_keys = self.grid.column_ranges(xyz0, radius)
+        first_cells = np.searchsorted(self.cell_keys, first_keys, side='left')
+        last_cells = np.searchsorted(self.cell_keys, last_keys, side='right')
+        bins = np.arange(max(self._bins(start), 0),
+            min(self._bins(end), self.bins - 1) + 1)[:, np.newaxis]
+
+        first = np.searchsorted(self.sorted_keys,
+            (bins * len(self.cell_keys) + first_cells).ravel(), side='left')
+        last = np.searchsorted(self.sorted_keys,
+            (bins * len(self.cell_keys) + last_cells).ravel(), side='left')
+        return np.sort(_slices(self.order, first, last))
+
+    def query_row(self, i, radius, start, end):
+        """
+        Return the sorted rows of the events within radius km
+        from the event i and whose times are within the start,
+        end time interval (bounds included).
+        """
+
+        rows = self.candidates(self.grid.derived.unit_xyz[i],
+            radius + self.grid.derived.distance_error, start, end)
+        time = self.time[rows]
+        rows = rows[np.logical_and(time >= start, time <= end)]
+        return rows[self.grid.derived.within_distance(rows, i, radius)]
+
+
+def _slices(order, first, last):
+    """
+    Return the concatenation of the slices of order
+    between the first and last bounds.
+    """
+
+    return np.concatenate([order[start:stop]
+        for start, stop in zip(first, last) if stop > start] or
+        [np.zeros(0, dtype=int)])
+
+
+def slab_tiles(xyz, count, radius):
+    """
+    Split the events in count slabs of about equal numbers
+    of events, along the axis of the widest extent of their
+    unit sphere positions. Return the list of the (core,
+    members) sorted rows of each slab, members being the core
+    events and the halo of the events closer than radius km
+    to the slab, so that the events within radius from a core
+    event are always members.
+    """
+
+    xyz = np.asarray(xyz, dtype=float)
+    if not len(xyz):
+        return []
+    axis = np.argmax(np.ptp(xyz, axis=0))
+    coordinate = xyz[:, axis]
+    order = np.argsort(coordinate, kind='mergesort')
+    reach = chord(radius) * (1. + CHORD_SLACK) + CHORD_SLACK
+
+    tiles = []
+    for core in np.array_split(order, max(min(count, len(xyz)), 1)):
+        members = np.flatnonzero(np.logical_and(
+            coordinate >= coordinate[core].min() - reach,
+            coordinate <= coordinate[core].max() + reach))
+        tiles.append((np.sort(core), members))
+    return tiles
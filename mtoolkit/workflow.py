@@ -25,9 +25,10 @@ order. The order is determined by the queue of jobs.
 import abc
 
 import yaml
+import numpy as np
 
-from mtoolkit.jobs import (gardner_knopoff, afteran,
-                            stepp, recurrence,
+from mtoolkit.jobs import (deduplication, gardner_knopoff, afteran,
+                            reasenberg, stepp, recurrence,
                             read_eq_catalog, read_source_model,
                             create_default_source_model,
                             create_catalog_matrix,
@@ -41,8 +42,11 @@ from mtoolkit.jobs import (gardner_knopoff, afteran,
 from mtoolkit.scientific.completeness import (stepp_analysis,
                                                 selected_eq_flag_vector)
 
+from mtoolkit.scientific.deduplication import find_duplicates
+
 from mtoolkit.scientific.declustering import (gardner_knopoff_decluster,
-                                                afteran_decluster)
+                                                afteran_decluster,
+                                                reasenberg_decluster)
 
 from mtoolkit.scientific.recurrence import recurrence_analysis
 
@@ -106,8 +110,10 @@ class PipeLineBuilder(object):
     __metaclass__ = abc.ABCMeta
 
     def __init__(self):
-        self.map_job_callable = {'GardnerKnopoff': gardner_knopoff,
+        self.map_job_callable = {'Deduplication': deduplication,
+                                 'GardnerKnopoff': gardner_knopoff,
                                  'Afteran': afteran,
+                                 'Reasenberg': reasenberg,
                                  'Stepp': stepp,
                                  'Recurrence': recurrence,
                                  'Create_eq_vector':
@@ -164,9 +170,16 @@ class PreprocessingBuilder(PipeLineBuilder):
         else:
             source_model_creation = create_default_source_model
 
-        # Add compulsory jobs to the pipeline'])
-        pipeline = PipeLine([read_eq_catalog, source_model_creation,
-                    create_catalog_matrix, create_default_values])
+        # Add compulsory jobs to the pipeline, source models
+        # bound the eq entries read from the eq catalog
+        # if they are read before it
+        if (config.get('catalog_source_model_bbox') and
+            config['source_model_file']):
+            pipeline = PipeLine([source_model_creation, read_eq_catalog,
+                        create_catalog_matrix, create_default_values])
+        else:
+            pipeline = PipeLine([read_eq_catalog, source_model_creation,
+                        create_catalog_matrix, create_default_values])
 
         # Add preprocessing jobs
         if config[PreprocessingBuilder.PREPROCESSING_JOBS_KEY]:
@@ -214,8 +227,10 @@ class Context(object):
 
     def __init__(self, config_filename=None):
         self.config = dict()
-        self.map_sc = {'gardner_knopoff': gardner_knopoff_decluster,
+        self.map_sc = {'deduplication': find_duplicates,
+                        'gardner_knopoff': gardner_knopoff_decluster,
                         'afteran': afteran_decluster,
+                        'reasenberg': reasenberg_decluster,
                         'stepp': stepp_analysis,
                         'recurrence': recurrence_analysis,
                         'select_eq_vector': selected_eq_flag_vector,
@@ -228,9 +243,191 @@ class Context(object):
         self.eq_catalog = None
         self.sm_definitions = None
         self.catalog_matrix = None
-        self.working_catalog = None
+        self._working_index = None
+        self._working_catalog = None
+        self._working_derived = None
+        self._current_index = None
+        self._current_filtered_eq = None
+        self.vcl = None
+        self.flag_vector = None
         self.completeness_table = None
 
+    @property
+    def working_index(self):
+        """
+        Return the index vector of the catalog matrix
+        rows in the working catalog, None means all
+        the rows.
+        """
+
+        return self._working_index
+
+    @working_index.setter
+    def working_index(self, rows):
+        """Replace the rows in the working catalog"""
+
+        self._working_index = rows
+        self._working_catalog = None
+        self._working_derived = None
+
+    @property
+    def working_catalog(self):
+        """
+        Return the rows of the catalog matrix selected
+        by the preprocessing jobs, denoted by working_index.
+        The selected rows are copied only when the working
+        catalog is used.
+        """
+
+        if self._working_catalog is not None:
+            return self._working_catalog
+        if self.working_index is None:
+            return self.catalog_matrix
+
+        self._working_catalog = self.catalog_matrix[self.working_index]
+        return self._working_catalog
+
+    @working_catalog.setter
+    def working_catalog(self, matrix):
+        """Replace the working catalog with the given matrix"""
+
+        self._working_catalog = matrix
+        # the derived columns of a replaced working
+        # catalog are computed by the scientific functions
+        self._working_derived = False
+
+    @property
+    def working_derived(self):
+        """
+        Return the DerivedColumns of the working catalog
+        rows, selected from the ones of the eq catalog,
+        None if they aren't available.
+        """
+
+        if self._working_derived is False or self.eq_catalog is None:
+            return None
+        if self._working_derived is None:
+            derived = self.eq_catalog.derived
+            if self.working_index is not None:
+                derived = derived.subset(self.working_index)
+            self._working_derived = derived
+        return self._working_derived
+
+    def working_column(self, column):
+        """
+        Return a column of the working catalog, only the
+        column is selected from the catalog matrix.
+        """
+
+        if self._working_catalog is not None or self.working_index is None:
+            return self.working_catalog[:, column]
+        return self.catalog_matrix[self.working_index, column]
+
+    def working_rows(self, selected):
+        """
+        Return the index vector of the catalog matrix
+        rows denoted by a boolean vector over the current
+        working catalog.
+        """
+
+        rows = np.flatnonzero(np.asarray(selected))
+        if self.working_index is not None:
+            rows = self.working_index[rows]
+        return rows
+
+    def select_working_rows(self, selected):
+        """
+        Restrict the working catalog to the selected
+        rows, denoted by a boolean vector over the
+        current working catalog.
+        """
+
+        self.working_index = self.working_rows(selected)
+
+    @property
+    def current_index(self):
+        """
+        Return the index vector of the catalog matrix
+        rows of the eq events in the current source
+        model, None means the working catalog.
+        """
+
+        return self._current_index
+
+    @current_index.setter
+    def current_index(self, rows):
+        """Replace the rows of the current source model"""
+
+        self._current_index = rows
+        self._current_filtered_eq = None
+
+    @property
+    def current_filtered_eq(self):
+        """
+        Return the rows of the catalog matrix in the
+        current source model, denoted by current_index.
+        The rows are copied only when the whole matrix is
+        used, jobs needing a few columns use current_column.
+        """
+
+        if self._current_filtered_eq is not None:
+            return self._current_filtered_eq
+        if self.current_index is None:
+            return self.working_catalog
+
+        self._current_filtered_eq = self.catalog_matrix[self.current_index]
+        return self._current_filtered_eq
+
+    @current_filtered_eq.setter
+    def current_filtered_eq(self, matrix):
+        """Replace the eq events in the current source model"""
+
+        self._current_filtered_eq = matrix
+
+    def current_column(self, column):
+        """
+        Return a column of the eq events in the current
+        source model, only the column is selected from
+        the catalog matrix.
+        """
+
+        if self._current_filtered_eq is not None or \
+            self.current_index is None:
+            return self.current_filtered_eq[:, column]
+        return self.catalog_matrix[self.current_index, column]
+
+    def flag_working_rows(self, flag_vector, vcl=None):
+        """
+        Flag the rows of the working catalog removed by
+        a preprocessing job (non zero flags) and restrict
+        the working catalog to the remaining rows. The
+        flag vector (and the cluster vector vcl, if given)
+        of the context refer to the catalog matrix rows.
+        """
+
+        self.flag_vector = self._catalog_vector(flag_vector,
+            self.flag_vector)
+        if vcl is not None:
+            self.vcl = self._catalog_vector(vcl, self.vcl)
+
+        self.select_working_rows(np.equal(flag_vector, 0))
+
+    def _catalog_vector(self, vector, catalog_vector):
+        """
+        Return a vector over the catalog matrix rows
+        from a vector over the working catalog rows.
+        """
+
+        if self.working_index is None:
+            return vector
+
+        if catalog_vector is None:
+            catalog_vector = np.zeros(len(self.catalog_matrix),
+                dtype=np.asarray(vector).dtype)
+        catalog_vector = np.array(catalog_vector)
+        catalog_vector[self.working_index] = vector
+        return catalog_vector
+
 
 class Workflow(object):
     """
@@ -249,9 +446,11 @@ class Workflow(object):
         """
         self.preprocessing_pipeline.run(context)
         if context.config['apply_processing_jobs']:
-            for sm, filtered_eq in catalog_filter.filter_eqs(
+            # the eq events of each source model are denoted by an
+            # index over the catalog matrix, not copied
+            for sm, selected in catalog_filter.select_eqs(
                     context.sm_definitions, context.working_catalog):
 
                 context.cur_sm = sm
-                context.current_filtered_eq = filtered_eq
+                context.current_index = context.working_rows(selected)
                 self.processing_pipeline.run(context)
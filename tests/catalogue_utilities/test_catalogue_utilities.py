@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+import numpy as np
+
+from mtoolkit.scientific.catalogue_utilities import (DerivedColumns,
+    LocalProjection, FLOAT32_DISTANCE_ERROR, decimal_year, haversine,
+    haversine_blocks, haversine_to_point, within_distance, hypocentre_xyz,
+    within_hypocentral_distance, epoch_time, days_to_epoch, seconds_to_epoch,
+    time_window_rows, points_in_polygon)
+
+from tests.declustering.data._declustering_test_data import (
+    CATALOG_MATRIX_NO_CLUSTERS)
+
+
+class DerivedColumnsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog_matrix = np.array(CATALOG_MATRIX_NO_CLUSTERS)
+        self.derived = DerivedColumns.from_matrix(self.catalog_matrix)
+
+    def test_derived_columns(self):
+        self.assertTrue(np.array_equal(decimal_year(
+            self.catalog_matrix[:, 0], self.catalog_matrix[:, 1],
+            self.catalog_matrix[:, 2]), self.derived.decimal_year))
+
+        self.assertTrue(np.allclose(np.radians(self.catalog_matrix[:, 4]),
+            self.derived.latitude_radians))
+
+        self.assertTrue(np.allclose(1., np.sum(self.derived.unit_xyz ** 2,
+            axis=1)))
+
+        # the columns are computed once
+        self.assertTrue(self.derived.unit_xyz is self.derived.unit_xyz)
+
+    def test_epoch_time(self):
+        time = epoch_time(np.array([1970., 2000., 2000., 1900.]),
+            np.array([1, 2, 3, 3]), np.array([1, 29, 1, 1]),
+            np.array([0, 23, 0, 0]), np.array([0, 59, 0, 0]),
+            np.array([0.5, 59.25, np.nan, 0.]))
+
+        self.assertEqual(np.int64, time.dtype)
+        self.assertEqual(500000, time[0])
+        # 29 February 2000 is followed by 1 March
+        self.assertEqual(seconds_to_epoch(0.75), time[2] - time[1])
+        self.assertEqual(-days_to_epoch(25508), time[3])
+
+    def test_time_window_rows(self):
+        sorted_time = np.array([0, 10, 10, 20, 30])
+
+        first, last = time_window_rows(sorted_time, np.array([10, 11]),
+            np.array([20, 19]))
+
+        self.assertTrue(np.array_equal([1, 3], first))
+        self.assertTrue(np.array_equal([4, 3], last))
+
+    def test_subset_selects_computed_columns(self):
+        cos_latitude = self.derived.cos_latitude
+        subset = self.derived.subset([3, 1])
+
+        self.assertEqual(['cos_latitude', 'latitude_radians'],
+            sorted(subset._columns))
+        self.assertTrue(np.array_equal(cos_latitude[[3, 1]],
+            subset.cos_latitude))
+        self.assertTrue(np.array_equal(self.catalog_matrix[[3, 1], 0],
+            subset.year))
+
+    def test_haversine_with_precomputed_columns(self):
+        lon, lat = self.catalog_matrix[:, 3], self.catalog_matrix[:, 4]
+
+        self.assertTrue(np.allclose(haversine(lon, lat, lon[0], lat[0]),
+            haversine(self.derived.longitude_radians,
+                self.derived.latitude_radians,
+                self.derived.longitude_radians[0],
+                self.derived.latitude_radians[0], radians=True,
+                cos_lat1=self.derived.cos_latitude,
+                cos_lat2=self.derived.cos_latitude[0])))
+
+    def test_projected_distance_checks(self):
+        rng = np.random.RandomState(0)
+        catalog_matrix = np.zeros((200, 7))
+        catalog_matrix[:, 0] = 2000
+        catalog_matrix[:, 3] = lon = rng.uniform(19., 24., 200)
+        catalog_matrix[:, 4] = lat = rng.uniform(36., 40., 200)
+        derived = DerivedColumns.from_matrix(catalog_matrix)
+        projected = derived.projected(5.)
+        distance = haversine(lon, lat, lon[0], lat[0])[:, 0]
+        rows = np.arange(len(lon))
+
+        self.assertTrue(projected.projection is not None)
+        self.assertTrue(0. < projected.distance_error <= 5.)
+        self.assertTrue(derived.projection is None)
+        # the subsets keep the projection
+        self.assertTrue(projected.subset(rows).projection is not None)
+
+        for radius in [50., 100., 200.]:
+            within = projected.within_distance(rows, 0, radius)
+            far = distance > radius + projected.distance_error
+            near = distance <= radius - projected.distance_error
+            self.assertFalse(np.any(within[far]))
+            self.assertTrue(np.all(within[near]))
+
+    def test_projected_above_tolerance(self):
+        # the epicentres span more than 250 degrees of longitude
+        self.assertTrue(self.derived.projected(100.) is self.derived)
+
+class HaversineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        catalog_matrix = np.array(CATALOG_MATRIX_NO_CLUSTERS)
+        self.lon, self.lat = catalog_matrix[:, 3], catalog_matrix[:, 4]
+        self.distance = haversine(self.lon, self.lat, self.lon[:5],
+            self.lat[:5])
+
+    def test_haversine(self):
+        self.assertEqual((20, 5), self.distance.shape)
+        self.assertTrue(np.allclose(0., np.diag(self.distance)))
+        # a degree of the equator
+        self.assertAlmostEqual(111.199, haversine(0., 0., 1., 0.)[0, 0], 3)
+
+    def test_haversine_out(self):
+        out = np.zeros((20, 5))
+
+        self.assertTrue(out is haversine(self.lon, self.lat, self.lon[:5],
+            self.lat[:5], out=out))
+        self.assertTrue(np.array_equal(self.distance, out))
+
+    def test_haversine_blocks(self):
+        distance = np.zeros((20, 5))
+        starts = []
+        for start, block in haversine_blocks(self.lon, self.lat,
+            self.lon[:5], self.lat[:5], block_size=15):
+            starts.append(start)
+            distance[start:start + len(block)] = block
+
+        # blocks of 3 rows
+        self.assertEqual(range(0, 20, 3), starts)
+        self.assertTrue(np.array_equal(self.distance, distance))
+
+    def test_haversine_to_point(self):
+        self.assertTrue(np.array_equal(self.distance[:, 2],
+            haversine_to_point(self.lon, self.lat, self.lon[2],
+                self.lat[2])))
+
+    def test_haversine_float32(self):
+        distance = haversine(self.lon, self.lat, self.lon[:5], self.lat[:5],
+            dtype=np.float32)
+
+        self.assertEqual(np.float32, distance.dtype)
+        self.assertTrue(np.all(np.abs(distance - self.distance) <
+            FLOAT32_DISTANCE_ERROR))
+
+    def test_haversine_float32_near_antipodes(self):
+        rng = np.random.RandomState(0)
+        lon = self.lon + 180. + rng.uniform(-0.5, 0.5, len(self.lon))
+        lat = -self.lat + rng.uniform(-0.5, 0.5, len(self.lat))
+        distance = haversine(self.lon, self.lat, lon, lat)
+
+        self.assertTrue(np.all(np.abs(haversine(self.lon, self.lat, lon,
+            lat, dtype=np.float32) - distance) < FLOAT32_DISTANCE_ERROR))
+        self.assertTrue(np.all(np.abs(haversine_to_point(lon, lat,
+            self.lon[0], self.lat[0], dtype=np.float32) - distance[0]) <
+            FLOAT32_DISTANCE_ERROR))
+
+    def test_within_distance(self):
+        xyz = DerivedColumns(None, None, None, self.lon, self.lat).unit_xyz
+        for distance in [50., 250., 1000., 30000.]:
+            self.assertTrue(np.array_equal(self.distance[:, 2] <= distance,
+                within_distance(xyz, xyz[2], distance)))
+
+        # distances of a location from itself are at the threshold
+        within, unsure = within_distance(xyz, xyz[2], 0., margin=True)
+        self.assertTrue(unsure[2])
+
+    def test_within_hypocentral_distance(self):
+        xyz = DerivedColumns(None, None, None, self.lon, self.lat).unit_xyz
+        hxyz = hypocentre_xyz(xyz[:2], [10., np.nan])
+
+        self.assertTrue(np.array_equal([True, False],
+            within_hypocentral_distance(hxyz, hypocentre_xyz(xyz[:1],
+                [20.])[0], 10. + 1e-9)))
+        self.assertFalse(within_hypocentral_distance(hxyz[:1],
+            hypocentre_xyz(xyz[:1], [20.])[0], 9.99)[0])
+
+
+class LocalProjectionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.polygon_lon = np.array([94.0, 106.0, 106.0, 94.0])
+        self.polygon_lat = np.array([-7.0, -7.0, 7.0, 7.0])
+        self.projection = LocalProjection.from_points(self.polygon_lon,
+            self.polygon_lat)
+
+    def test_points_in_polygon(self):
+        inside, unsure = points_in_polygon([0.5, 1.0, 1.5, 0.5],
+            [0.5, 0.5, 0.5, 1e-12], [0.0, 1.0, 1.0, 0.0],
+            [0.0, 0.0, 1.0, 1.0], margin=True)
+
+        self.assertTrue(np.array_equal([True, False, False, True], inside))
+        self.assertTrue(np.array_equal([False, True, False, True], unsure))
+
+    def test_projection_centre(self):
+        self.assertAlmostEqual(100.0, self.projection.lon0)
+        self.assertAlmostEqual(0.0, self.projection.lat0)
+
+        x, y = self.projection.project([100.0, 101.0], [0.0, 0.0])
+        self.assertTrue(np.allclose([0.0, 0.0], [x[0], y[0]]))
+        self.assertAlmostEqual(haversine(100.0, 0.0, 101.0, 0.0)[0, 0],
+            LocalProjection.distance(x[1], y[1], x[0], y[0]), 1)
+
+    def test_max_distance_error(self):
+        error = self.projection.max_distance_error(self.polygon_lon,
+            self.polygon_lat)
+
+        # the error of a regional extent is a few km
+        self.assertTrue(0. < error < 10.)
+        self.assertTrue(self.projection.max_distance_error(
+            [99.5, 100.5], [-0.5, 0.5]) < 0.01)
+
+    def test_max_distance_error_bounds_the_errors(self):
+        rng = np.random.RandomState(0)
+        for width, height in [(12., 14.), (50., 40.)]:
+            lon = 100. + rng.uniform(-width / 2., width / 2., 400)
+            lat = 30. + rng.uniform(-height / 2., height / 2., 400)
+            projection = LocalProjection.from_points(lon, lat)
+            x, y = projection.project(lon, lat)
+
+            planar = np.hypot(x[:, np.newaxis] - x, y[:, np.newaxis] - y)
+            self.assertTrue(np.abs(planar - haversine(lon, lat, lon,
+                lat)).max() <= projection.max_distance_error(lon, lat))
+
+        # no bound for extents wider than a hemisphere
+        self.assertEqual(np.inf, self.projection.max_distance_error(
+            [0., 100., 200.], [0., 0., 0.]))
+
+    def test_projected_queries(self):
+        x, y = self.projection.project([100.0, 100.0, 110.0],
+            [0.0, 1.0, 0.0])
+
+        self.assertTrue(np.array_equal([True, True, False],
+            LocalProjection.within_distance(x, y, x[0], y[0], 112.)))
+        self.assertTrue(np.array_equal([True, True, False],
+            self.projection.contains([100.0, 100.0, 110.0], [0.0, 1.0, 0.0],
+                self.polygon_lon, self.polygon_lat)))
@@ -19,8 +19,10 @@
 import unittest
 import numpy as np
 
+from mtoolkit.scientific.catalogue_utilities import DerivedColumns
 from mtoolkit.scientific.declustering import (TDW_GARDNERKNOPOFF,
-    TDW_GRUENTHAL, TDW_UHRHAMMER, gardner_knopoff_decluster, afteran_decluster)
+    TDW_GRUENTHAL, TDW_UHRHAMMER, gardner_knopoff_decluster, afteran_decluster,
+    reasenberg_decluster)
 
 from tests.declustering.data._declustering_test_data import (
     CATALOG_MATRIX_ALL_IN_A_CLUSTER, CATALOG_MATRIX_NO_CLUSTERS)
@@ -122,3 +124,155 @@ class DeclusteringTestCase(unittest.TestCase):
 
         self.evaluate_results_afteran(self.catalog_matrix_no_clusters,
                 expected_vcl, expected_vmain_shock, expected_flag_vector)
+
+    def test_gardner_knopoff_time_windows(self):
+        # mainshock, aftershock, foreshock and a later event
+        catalog_matrix = np.array([
+            [2000., 6., 1., 20.0, 38.0, 6.0, 0.1],
+            [2000., 6., 10., 20.1, 38.0, 4.0, 0.1],
+            [2000., 5., 25., 20.0, 38.1, 4.0, 0.1],
+            [2005., 6., 1., 20.0, 38.0, 4.0, 0.1]])
+
+        vcl, vmain_shock, flag_vector = gardner_knopoff_decluster(
+            catalog_matrix, TDW_GARDNERKNOPOFF, 1.0)
+
+        self.assertTrue(np.array_equal([1, 1, 1, 0], vcl))
+        self.assertTrue(np.array_equal([0, 1, -1, 0], flag_vector))
+        self.assertTrue(np.array_equal(catalog_matrix[[0, 3]], vmain_shock))
+
+    def test_afteran_moving_time_window(self):
+        # aftershocks 30, 49 and 50 days apart, the last
+        # event follows the previous one by 120 days, the
+        # chain is searched in descending magnitude
+        catalog_matrix = np.array([
+            [2000., 1., 1., 20.0, 38.0, 6.0, 0.1],
+            [2000., 1., 31., 20.1, 38.0, 4.5, 0.1],
+            [2000., 3., 21., 20.0, 38.1, 4.4, 0.1],
+            [2000., 5., 10., 20.1, 38.1, 4.2, 0.1],
+            [2000., 9., 7., 20.0, 38.0, 4.1, 0.1]])
+
+        vcl, vmain_shock, flag_vector = afteran_decluster(
+            catalog_matrix, TDW_GARDNERKNOPOFF, 60.)
+
+        self.assertTrue(np.array_equal([1, 1, 1, 1, 0], vcl))
+        self.assertTrue(np.array_equal([0, 1, 1, 1, 0], flag_vector))
+        self.assertTrue(np.array_equal(catalog_matrix[[0, 4]], vmain_shock))
+
+    def test_reasenberg_clusters(self):
+        # a foreshock, a mainshock and two aftershocks, the last one
+        # linked within the interaction zone of the mainshock and
+        # the look-ahead time of the first aftershock, an event too
+        # far and a later sequence
+        catalog_matrix = np.array([
+            [2000., 6., 1., 20.0, 38.0, 4.0, 0.1],
+            [2000., 6., 2., 20.03, 38.0, 6.0, 0.1],
+            [2000., 6., 3., 20.0, 38.05, 4.5, 0.1],
+            [2000., 6., 4., 20.2, 38.0, 3.0, 0.1],
+            [2000., 6., 3., 25.0, 38.0, 4.0, 0.1],
+            [2001., 1., 1., 20.0, 38.0, 3.0, 0.1],
+            [2001., 1., 1., 20.005, 38.0, 3.5, 0.1]])
+
+        vcl, vmain_shock, flag_vector = reasenberg_decluster(catalog_matrix)
+
+        self.assertTrue(np.array_equal([1, 1, 1, 1, 0, 2, 2], vcl))
+        self.assertTrue(np.array_equal([-1, 0, 1, 1, 0, -1, 0], flag_vector))
+        self.assertTrue(np.array_equal(catalog_matrix[[1, 4, 6]],
+            vmain_shock))
+
+        # smaller interaction zones don't link the foreshock
+        # and the last aftershock
+        vcl, _, flag_vector = reasenberg_decluster(catalog_matrix, rfact=5.)
+
+        self.assertTrue(np.array_equal([0, 1, 1, 0], vcl[:4]))
+        self.assertTrue(np.array_equal([0, 0, 1, 0], flag_vector[:4]))
+
+    def test_reasenberg_look_ahead_time_bound(self):
+        # the second event follows the first one by exactly the
+        # look-ahead time (taumin), the third one a second later
+        catalog_matrix = np.array([
+            [2000., 6., 1., 20.0, 38.0, 4.0, 0.1],
+            [2000., 6., 2., 20.0, 38.0, 4.0, 0.1],
+            [2000., 6., 3., 20.0, 38.0, 4.0, 0.1]])
+        derived = DerivedColumns(catalog_matrix[:, 0], catalog_matrix[:, 1],
+            catalog_matrix[:, 2], catalog_matrix[:, 3], catalog_matrix[:, 4],
+            np.array([12, 12, 12]), np.array([0, 0, 0]),
+            np.array([30.25, 30.25, 31.25]))
+
+        vcl, _, _ = reasenberg_decluster(catalog_matrix, taumin=1.,
+            derived=derived)
+
+        self.assertTrue(np.array_equal([1, 1, 0], vcl))
+
+    def test_reasenberg_no_events_within_a_cluster(self):
+        vcl, vmain_shock, flag_vector = reasenberg_decluster(
+            self.catalog_matrix_no_clusters)
+
+        self.assertFalse(np.any(vcl))
+        self.assertFalse(np.any(flag_vector))
+        self.assertTrue(np.array_equal(self.catalog_matrix_no_clusters,
+            vmain_shock))
+
+    def test_tiled_declustering_equals_serial(self):
+        rng = np.random.RandomState(0)
+        neq = 400
+        catalog_matrix = np.zeros((neq, 7))
+        catalog_matrix[:, 0] = rng.randint(1990, 1995, neq)
+        catalog_matrix[:, 1] = rng.randint(1, 13, neq)
+        catalog_matrix[:, 2] = rng.randint(1, 29, neq)
+        catalog_matrix[:, 3] = rng.uniform(19., 24., neq)
+        catalog_matrix[:, 4] = rng.uniform(36., 40., neq)
+        catalog_matrix[:, 5] = rng.uniform(3., 7., neq)
+
+        for decluster, parameter in [(gardner_knopoff_decluster, 0.5),
+                                     (afteran_decluster, 60.)]:
+            serial = decluster(catalog_matrix, TDW_GARDNERKNOPOFF, parameter)
+            for tiles, workers in [(4, 1), (3, 2)]:
+                tiled = decluster(catalog_matrix, TDW_GARDNERKNOPOFF,
+                    parameter, tiles=tiles, workers=workers)
+                for expected, result in zip(serial, tiled):
+                    self.assertTrue(np.array_equal(expected, result))
+
+    def test_projected_declustering_equals_great_circle(self):
+        rng = np.random.RandomState(0)
+        neq = 400
+        catalog_matrix = np.zeros((neq, 7))
+        catalog_matrix[:, 0] = rng.randint(1990, 1995, neq)
+        catalog_matrix[:, 1] = rng.randint(1, 13, neq)
+        catalog_matrix[:, 2] = rng.randint(1, 29, neq)
+        catalog_matrix[:, 3] = rng.uniform(19., 24., neq)
+        catalog_matrix[:, 4] = rng.uniform(36., 40., neq)
+        catalog_matrix[:, 5] = rng.uniform(3., 7., neq)
+        projected = DerivedColumns.from_matrix(catalog_matrix).projected(5.)
+
+        self.assertTrue(projected.projection is not None)
+        for decluster, parameters in [
+                (gardner_knopoff_decluster, (TDW_GARDNERKNOPOFF, 0.5)),
+                (afteran_decluster, (TDW_GARDNERKNOPOFF, 60.)),
+                (reasenberg_decluster, (10., 1.5, 0.5, 1., 10., 0.95))]:
+            expected = decluster(catalog_matrix, *parameters)
+            result = decluster(catalog_matrix, *(parameters + (projected,)))
+            for expected, result in zip(expected, result):
+                self.assertTrue(np.array_equal(expected, result))
+
+        tiled = gardner_knopoff_decluster(catalog_matrix, TDW_GARDNERKNOPOFF,
+            0.5, projected, tiles=3, workers=1)
+        for expected, result in zip(gardner_knopoff_decluster(catalog_matrix,
+                TDW_GARDNERKNOPOFF, 0.5), tiled):
+            self.assertTrue(np.array_equal(expected, result))
+
+    def test_declustering_with_given_derived_columns(self):
+        derived = DerivedColumns.from_matrix(self.catalog_matrix_all_cluster)
+
+        self.assertTrue(all(np.array_equal(expected, result)
+            for expected, result in zip(
+                gardner_knopoff_decluster(self.catalog_matrix_all_cluster,
+                    TDW_GARDNERKNOPOFF, 0.1),
+                gardner_knopoff_decluster(self.catalog_matrix_all_cluster,
+                    TDW_GARDNERKNOPOFF, 0.1, derived))))
+
+        self.assertTrue(all(np.array_equal(expected, result)
+            for expected, result in zip(
+                afteran_decluster(self.catalog_matrix_all_cluster,
+                    TDW_GARDNERKNOPOFF, 60),
+                afteran_decluster(self.catalog_matrix_all_cluster,
+                    TDW_GARDNERKNOPOFF, 60, derived))))
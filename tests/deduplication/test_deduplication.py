@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+import numpy as np
+
+from mtoolkit.scientific.catalogue_utilities import haversine
+from mtoolkit.scientific.deduplication import find_duplicates
+
+
+class DeduplicationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.event_time = np.array([0., 5., 100., 104., 2000.])
+        self.longitude = np.array([10., 10.1, 30., 30., 10.])
+        self.latitude = np.array([45., 45., -20., -20.2, 45.])
+        self.magnitude = np.array([5.0, 5.2, 4.0, 4.1, 5.0])
+        self.agency = np.array(['AAA', 'BBB', 'AAA', 'BBB', 'AAA'])
+
+    def find_duplicates(self, agency_priority, time_window=16.,
+        distance_window=50., magnitude_window=0.5):
+
+        return find_duplicates(self.event_time, self.longitude,
+            self.latitude, self.magnitude, self.agency, agency_priority,
+            time_window, distance_window, magnitude_window)
+
+    def test_preferred_solution_by_agency_priority(self):
+        vgroup, flag_vector = self.find_duplicates(['AAA', 'BBB'])
+
+        self.assertTrue(np.array_equal([1, 1, 2, 2, 0], vgroup))
+        self.assertTrue(np.array_equal([0, 1, 0, 1, 0], flag_vector))
+
+        vgroup, flag_vector = self.find_duplicates(['BBB'])
+
+        self.assertTrue(np.array_equal([1, 0, 1, 0, 0], flag_vector))
+
+    def test_unlisted_agencies_keep_catalog_order(self):
+        _, flag_vector = self.find_duplicates([])
+
+        self.assertTrue(np.array_equal([0, 1, 0, 1, 0], flag_vector))
+
+    def test_windows(self):
+        _, flag_vector = self.find_duplicates(['AAA'], time_window=4.5)
+        self.assertTrue(np.array_equal([0, 0, 0, 1, 0], flag_vector))
+
+        _, flag_vector = self.find_duplicates(['AAA'], distance_window=20.)
+        self.assertTrue(np.array_equal([0, 1, 0, 0, 0], flag_vector))
+
+        _, flag_vector = self.find_duplicates(['AAA'], magnitude_window=0.15)
+        self.assertTrue(np.array_equal([0, 0, 0, 1, 0], flag_vector))
+
+    def test_duplicates_are_grouped_transitively(self):
+        self.event_time[4] = 15.
+        self.longitude[4] = 10.5
+        _, flag_vector = self.find_duplicates(['BBB'])
+
+        self.assertTrue(np.array_equal([1, 0, 1, 0, 1], flag_vector))
+
+    def test_events_of_the_same_agency_are_not_duplicates(self):
+        vgroup, flag_vector = find_duplicates(np.array([0., 5., 10.]),
+            np.array([100., 100.1, 100.2]), np.array([0., 0., 0.]),
+            np.array([5.0, 5.2, 5.1]), np.array(['ISC', 'ISC', 'ISC']),
+            ['ISC'], 16., 100., 0.5)
+
+        self.assertTrue(np.array_equal([0, 0, 0], vgroup))
+        self.assertTrue(np.array_equal([0, 0, 0], flag_vector))
+
+    def test_empty_catalog(self):
+        vgroup, flag_vector = find_duplicates(np.array([]), np.array([]),
+            np.array([]), np.array([]), np.array([]), [], 16., 50., 0.5)
+
+        self.assertEqual(0, len(vgroup))
+        self.assertEqual(0, len(flag_vector))
+
+    def test_same_duplicates_of_all_pairs_comparison(self):
+        random = np.random.RandomState(37)
+        neq = 400
+        event_time = np.sort(random.uniform(0., 3600., neq))
+        longitude = random.uniform(-180., 180., neq)
+        latitude = random.uniform(-90., 90., neq)
+        magnitude = random.uniform(4., 5., neq)
+        agency = random.choice(['AAA', 'BBB', 'CCC'], neq)
+
+        vgroup, _ = find_duplicates(event_time, longitude, latitude,
+            magnitude, agency, [], 60., 2000., 0.5)
+
+        duplicated = np.logical_and(np.logical_and(
+            haversine(longitude, latitude, longitude, latitude) <= 2000.,
+            np.abs(event_time[:, None] - event_time[None, :]) <= 60.),
+            np.abs(magnitude[:, None] - magnitude[None, :]) <= 0.5)
+        duplicated = np.logical_and(duplicated,
+            agency[:, None] != agency[None, :])
+        np.fill_diagonal(duplicated, False)
+
+        self.assertTrue(np.array_equal(np.any(duplicated, axis=1),
+            vgroup > 0))
+        first, second = np.nonzero(duplicated)
+        self.assertTrue(np.array_equal(vgroup[first], vgroup[second]))
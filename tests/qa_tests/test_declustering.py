@@ -76,3 +76,19 @@ class DeclusteringTestCase(unittest.TestCase):
 
         self.assertTrue(np.array_equal(self.expected_flag_vector,
                 context.flag_vector))
+
+    def test_afteran_tiled(self):
+        context = create_context('config_afteran_tiled.yml')
+        workflow = create_workflow(context.config)
+        run(workflow, context)
+
+        expected_vcl = np.array([0, 0, 0, 2, 2, 0, 0, 0, 0, 1, 1, 0, 0, 0, 0,
+            0, 0, 0, 3, 3])
+
+        self.assertTrue(np.array_equal(self.expected_vmain_shock,
+                context.working_catalog))
+
+        self.assertTrue(np.array_equal(expected_vcl, context.vcl))
+
+        self.assertTrue(np.array_equal(self.expected_flag_vector,
+                context.flag_vector))
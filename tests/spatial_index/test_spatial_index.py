@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+import numpy as np
+
+from mtoolkit.scientific.catalogue_utilities import haversine, days_to_epoch
+from mtoolkit.scientific.spatial_index import (SphericalGridIndex,
+    SpaceTimeIndex, slab_tiles)
+
+
+class SphericalGridIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.longitude = np.concatenate((rng.uniform(9., 11., 300),
+            rng.uniform(-180., 180., 200), [179.9, -179.9, 0., 0.]))
+        self.latitude = np.concatenate((rng.uniform(44., 46., 300),
+            rng.uniform(-90., 90., 200), [0., 0., 90., 89.99]))
+        self.distance = haversine(self.longitude, self.latitude,
+            self.longitude, self.latitude)
+        self.index = SphericalGridIndex.from_locations(self.longitude,
+            self.latitude, 50.)
+
+    def test_query_rows_equal_haversine_scan(self):
+        rows = [0, 10, 400, 500, 502]
+        for radius in [0., 20., 50., 300.]:
+            for i, result in zip(rows, self.index.query_rows(rows, radius)):
+                self.assertTrue(np.array_equal(
+                    np.flatnonzero(self.distance[:, i] <= radius), result))
+
+    def test_query_across_the_antimeridian_and_the_pole(self):
+        self.assertTrue(np.array_equal([500, 501],
+            self.index.query_row(500, 30.)))
+        result = self.index.query_row(502, 5.)
+        self.assertTrue(503 in result)
+        self.assertTrue(np.array_equal(
+            np.flatnonzero(self.distance[:, 502] <= 5.), result))
+
+    def test_query_points(self):
+        radius = np.array([100., 0.])
+        results = self.index.query_points([10., 50.], [45., 0.], radius)
+
+        self.assertTrue(np.array_equal(np.flatnonzero(haversine(
+            self.longitude, self.latitude, 10., 45.)[:, 0] <= 100.),
+            results[0]))
+        self.assertEqual(0, len(results[1]))
+
+    def test_mask_and_removal(self):
+        mask = np.arange(len(self.longitude)) % 2 == 0
+        expected = np.flatnonzero(self.distance[:, 0] <= 50.)
+
+        self.assertTrue(np.array_equal(expected[mask[expected]],
+            self.index.query_row(0, 50., mask)))
+
+        self.index.remove(expected[:10])
+
+        self.assertEqual(len(self.longitude) - 10, len(self.index))
+        self.assertTrue(np.array_equal(expected[10:],
+            self.index.query_row(0, 50.)))
+
+    def test_space_time_query_equals_scan(self):
+        days = np.random.RandomState(1).uniform(0., 100., len(self.longitude))
+
+        # float times in days and int64 epoch times
+        for time, unit in [(days, 1.), (days_to_epoch(days),
+                                        days_to_epoch(1.))]:
+            index = SpaceTimeIndex(self.index.derived, time, 50., 10 * unit)
+            for i in [0, 10, 400, 500, 502]:
+                for radius, start, end in [
+                        (20., 0, 100 * unit), (100., 5 * unit, 25 * unit),
+                        (300., time[i], time[i] + 3 * unit)]:
+                    expected = np.flatnonzero(np.logical_and(
+                        self.distance[:, i] <= radius,
+                        np.logical_and(time >= start, time <= end)))
+                    self.assertTrue(np.array_equal(expected,
+                        index.query_row(i, radius, start, end)))
+
+    def test_slab_tiles_halo(self):
+        tiles = slab_tiles(self.index.derived.unit_xyz, 4, 300.)
+
+        self.assertEqual(4, len(tiles))
+        self.assertTrue(np.array_equal(np.arange(len(self.longitude)),
+            np.sort(np.concatenate([core for core, _ in tiles]))))
+        for core, members in tiles:
+            within = np.flatnonzero(np.any(
+                self.distance[:, core] <= 300., axis=1))
+            self.assertTrue(np.all(np.in1d(within, members)))
+
+    def test_empty_index(self):
+        index = SphericalGridIndex.from_locations([], [], 50.)
+
+        self.assertEqual(0, len(index.query_point(10., 45., 100.)))
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from mtoolkit.bulletin import (BulletinReader, QuakeMLReader, ISFReader,
+                              _ellipse_scale, _hashed_id)
+from mtoolkit.eqcatalog import (EqEntryValidationError, EqRowPredicates,
+                                catalog_format)
+from mtoolkit.jobs import read_eq_catalog
+
+from tests.helper import create_context
+
+from nrml.nrml_xml import get_data_path, DATA_DIR
+
+
+class BulletinReaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.quakeml_filename = get_data_path('bulletin_quakeml.xml',
+            DATA_DIR)
+        self.isf_filename = get_data_path('bulletin_ims.isf', DATA_DIR)
+
+    def read_catalog(self, reader_class, filename, chunk_size=None,
+        predicates=None):
+        with open(filename) as bulletin:
+            return list(reader_class(bulletin,
+                predicates=predicates).read_catalog(chunk_size))
+
+    def test_bulletin_format(self):
+        self.assertEqual('quakeml', catalog_format(self.quakeml_filename))
+        self.assertEqual('isf', catalog_format(self.isf_filename))
+        self.assertEqual('csv', catalog_format(get_data_path(
+            'ISC_small_data.csv', DATA_DIR)))
+
+    def test_quakeml_preferred_origin_and_magnitudes(self):
+        first_event, second_event = self.read_catalog(QuakeMLReader,
+            self.quakeml_filename)
+
+        self.assertEqual(600516598, first_event['eventID'])
+        self.assertEqual(1234567, first_event['Identifier'])
+        self.assertEqual('ISC', first_event['Agency'])
+        self.assertEqual((2008, 1, 1, 10, 10, 11.25), tuple(first_event[field]
+            for field in ['year', 'month', 'day', 'hour', 'minute',
+                'second']))
+        # depths and error ellipses are converted to km
+        self.assertEqual((33.0, 5.0, 10.1, 8.2), tuple(first_event[field]
+            for field in ['depth', 'depthError', 'SemiMajor90',
+                'SemiMinor90']))
+        # magnitudes of the preferred origin come first
+        self.assertEqual((5.3, 4.8, 5.1, 0.1, ''), tuple(first_event[field]
+            for field in ['Mw', 'Ms', 'mb', 'sigmamb', 'ML']))
+        self.assertEqual((7.6, 7.0, 0.3), tuple(second_event[field]
+            for field in ['Mw', 'ML', 'sigmaML']))
+
+    def test_isf_matches_quakeml(self):
+        quakeml_catalog = self.read_catalog(QuakeMLReader,
+            self.quakeml_filename)
+
+        self.assertEqual(quakeml_catalog, self.read_catalog(ISFReader,
+            self.isf_filename))
+        self.assertEqual(quakeml_catalog, self.read_catalog(ISFReader,
+            self.isf_filename, chunk_size=1))
+        with open(self.isf_filename) as bulletin:
+            self.assertEqual(quakeml_catalog,
+                ISFReader(bulletin).read_eq_catalog())
+
+    def test_bulletin_predicates(self):
+        predicates = EqRowPredicates(min_mw=6.0)
+        for reader_class, filename in [
+            (QuakeMLReader, self.quakeml_filename),
+            (ISFReader, self.isf_filename)]:
+
+            self.assertEqual([600516599], [eq_entry['eventID']
+                for eq_entry in self.read_catalog(reader_class, filename,
+                    chunk_size=1, predicates=predicates)])
+
+    def test_errors_report_event_line(self):
+        lines = open(self.isf_filename).readlines()
+        lines[19] = lines[19].replace(' -0.7200', '-99.7200')
+
+        try:
+            ISFReader(StringIO(''.join(lines))).read_catalog(1)
+        except EqEntryValidationError as exc:
+            # line of the second event
+            self.assertEqual(('latitude', 17), (exc.field, exc.line_number))
+        else:
+            self.fail('EqEntryValidationError not raised')
+
+    def test_quakeml_event_without_numeric_id(self):
+        public_ids = ['quakeml:earthquake.usgs.gov/fdsnws/event/1/query?'
+            'eventid=us7000abcd&amp;format=quakeml',
+            'smi:org.gfz-potsdam.de/geofon/gfz2012abcd']
+        lines = open(self.quakeml_filename).readlines()
+        lines[3] = lines[3].replace('smi:ISC/evid=600516598', public_ids[0])
+        lines[47] = lines[47].replace('smi:ISC/evid=600516599',
+            public_ids[1])
+
+        for _ in range(2):
+            event_ids = [eq_entry['eventID'] for eq_entry in
+                QuakeMLReader(StringIO(''.join(lines))).read_catalog(1)]
+            # the eventIDs are the hashed publicIDs
+            self.assertEqual([int(_hashed_id(public_ids[0].replace('&amp;',
+                '&'))), int(_hashed_id(public_ids[1]))], event_ids)
+
+    def test_quakeml_event_id_collision(self):
+        # the numeric id of the second event is the one of the first
+        lines = open(self.quakeml_filename).readlines()
+        lines[47] = lines[47].replace('smi:ISC/evid=600516599',
+            'smi:EMSC/600516598')
+
+        self.assertEqual([600516598], [eq_entry['eventID'] for eq_entry in
+            QuakeMLReader(StringIO(''.join(lines))).read_catalog(1)])
+
+    def test_bulletin_reader_is_abstract(self):
+        self.assertRaises(TypeError, BulletinReader, StringIO(''))
+
+    def test_error_ellipse_scale(self):
+        self.assertEqual(1., _ellipse_scale(''))
+        self.assertAlmostEqual(1., _ellipse_scale('90'))
+        # one sigma (39.35%) ellipse
+        self.assertAlmostEqual(2.146, _ellipse_scale('39.35'), places=3)
+
+    def test_read_eq_catalog_from_bulletin(self):
+        context = create_context('config_jobs.yml')
+        catalog_dir = tempfile.mkdtemp()
+        try:
+            filenames = [os.path.join(catalog_dir, name)
+                for name in ['catalog.xml', 'catalog.isf']]
+            shutil.copy(self.quakeml_filename, filenames[0])
+            shutil.copy(self.isf_filename, filenames[1])
+
+            for filename in filenames:
+                context.config['eq_catalog_file'] = filename
+                read_eq_catalog(context)
+                self.assertEqual(self.read_catalog(ISFReader,
+                    self.isf_filename), list(context.eq_catalog))
+        finally:
+            shutil.rmtree(catalog_dir)
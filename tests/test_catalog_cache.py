@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from mtoolkit.catalog_cache import (EqCatalogCache, create_checkpoint,
+                                    appended_offset)
+from mtoolkit.eqcatalog import (EqEntryReader, EqEntryValidationError,
+                                MATRIX_FIELDNAMES)
+from mtoolkit.jobs import read_eq_catalog
+
+from tests.helper import create_context
+
+from nrml.nrml_xml import get_data_path, DATA_DIR
+
+
+class EqCatalogCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = EqCatalogCache(self.cache_dir)
+        self.catalog_filename = get_data_path('ISC_small_data.csv', DATA_DIR)
+
+        with open(self.catalog_filename) as eq_catalog:
+            self.eq_catalog = EqEntryReader(eq_catalog).read_catalog()
+
+        self.last_row = open(self.catalog_filename).readlines()[-1]
+        self.catalog_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+        shutil.rmtree(self.catalog_dir)
+
+    def copy_catalog(self):
+        copied_filename = os.path.join(self.catalog_dir, 'catalog.csv')
+        shutil.copy(self.catalog_filename, copied_filename)
+        return copied_filename
+
+    def test_missing_catalog_returns_none(self):
+        key = self.cache.key(self.catalog_filename)
+
+        self.assertEqual(None, self.cache.load(key))
+
+    def test_stored_catalog_is_loaded(self):
+        key = self.cache.key(self.catalog_filename)
+        checkpoint = create_checkpoint(self.catalog_filename,
+            os.path.getsize(self.catalog_filename), 12)
+        self.cache.store(key, self.eq_catalog, checkpoint)
+        cached_catalog, cached_checkpoint = self.cache.load(key)
+
+        self.assertEqual(list(self.eq_catalog), list(cached_catalog))
+        self.assertTrue(isinstance(cached_catalog.column('Mw'), np.memmap))
+        self.assertEqual(checkpoint, cached_checkpoint)
+
+    def test_key_depends_on_fields(self):
+        self.assertNotEqual(self.cache.key(self.catalog_filename),
+            self.cache.key(self.catalog_filename, MATRIX_FIELDNAMES))
+
+    def test_appended_offset(self):
+        copied_filename = self.copy_catalog()
+        size = os.path.getsize(copied_filename)
+        checkpoint = create_checkpoint(copied_filename, size, 12)
+
+        self.assertEqual(size, appended_offset(copied_filename, checkpoint))
+
+        with open(copied_filename, 'a') as copied_file:
+            copied_file.write(self.last_row)
+
+        self.assertEqual(size, appended_offset(copied_filename, checkpoint))
+
+    def test_changed_rows_have_no_appended_offset(self):
+        copied_filename = self.copy_catalog()
+        checkpoint = create_checkpoint(copied_filename,
+            os.path.getsize(copied_filename), 12)
+
+        with open(copied_filename, 'r+') as copied_file:
+            copied_file.seek(len(self.last_row))
+            copied_file.write('9')
+
+        self.assertEqual(None, appended_offset(copied_filename, checkpoint))
+
+        copied_filename = self.copy_catalog()
+        with open(copied_filename, 'a') as copied_file:
+            copied_file.write(self.last_row.strip())
+        checkpoint = create_checkpoint(copied_filename,
+            os.path.getsize(copied_filename), 13)
+
+        with open(copied_filename, 'a') as copied_file:
+            copied_file.write('\r\n')
+
+        self.assertEqual(None, appended_offset(copied_filename, checkpoint))
+
+    def test_compressed_catalog_is_parsed_again(self):
+        compressed_filename = os.path.join(self.catalog_dir, 'catalog.gz')
+        with gzip.open(compressed_filename, 'wb') as compressed_file:
+            compressed_file.write(open(self.catalog_filename).read())
+
+        context = create_context('config_jobs.yml')
+        context.config['cache_dir'] = self.cache_dir
+        context.config['eq_catalog_file'] = compressed_filename
+        read_eq_catalog(context)
+        self.assertEqual(list(self.eq_catalog), list(context.eq_catalog))
+
+        with gzip.open(compressed_filename, 'ab') as compressed_file:
+            compressed_file.write(self.last_row.replace('10,FFG', '11,FFG'))
+        read_eq_catalog(context)
+
+        self.assertEqual(len(self.eq_catalog) + 1, len(context.eq_catalog))
+        self.assertEqual(list(self.eq_catalog),
+            list(context.eq_catalog.entries(range(len(self.eq_catalog)))))
+
+    def test_appended_rows_are_parsed(self):
+        context = create_context('config_jobs.yml')
+        context.config['cache_dir'] = self.cache_dir
+        context.config['eq_catalog_file'] = self.copy_catalog()
+        read_eq_catalog(context)
+
+        with open(context.config['eq_catalog_file'], 'a') as copied_file:
+            copied_file.write(self.last_row.replace('10,FFG', '11,FFG'))
+        read_eq_catalog(context)
+
+        with open(context.config['eq_catalog_file']) as eq_catalog:
+            expected_catalog = EqEntryReader(eq_catalog).read_eq_catalog()
+        self.assertEqual(expected_catalog, list(context.eq_catalog))
+
+        with open(context.config['eq_catalog_file'], 'a') as copied_file:
+            copied_file.write(self.last_row.replace(',2000,', ',3000,'))
+        try:
+            read_eq_catalog(context)
+        except EqEntryValidationError as exc:
+            self.assertEqual(13, exc.line_number)
+        else:
+            self.fail('EqEntryValidationError not raised')
+
+    def test_read_eq_catalog_job_uses_cache(self):
+        context = create_context('config_jobs.yml')
+        context.config['cache_dir'] = self.cache_dir
+        read_eq_catalog(context)
+        parsed_catalog = context.eq_catalog
+
+        read_eq_catalog(context)
+
+        self.assertEqual(list(parsed_catalog), list(context.eq_catalog))
+        self.assertTrue(isinstance(context.eq_catalog.column('Mw'),
+            np.memmap))
@@ -22,7 +22,8 @@ import numpy as np
 
 from mtoolkit.catalog_filter import (SourceModelCatalogFilter,
                                      CatalogFilter,
-                                     NullCatalogFilter)
+                                     NullCatalogFilter,
+                                     source_model_bbox)
 
 from mtoolkit.source_model import AreaSource, AREA_BOUNDARY, POINT
 
@@ -64,6 +65,22 @@ class SourceModelCatalogFilterTestCase(unittest.TestCase):
         self.assertTrue(np.array_equal(expected_catalog,
                 sm_filter.filter_eqs(self.sm_geometry, eq_catalog)))
 
+    def test_selecting_eq_catalog(self):
+        eq_catalog = np.array([[2000, 1, 2, -0.25, 0.25],
+            [2000, 1, 2, -0.5, 0.25], [2000, 1, 2, 0.5, 0.25]])
+
+        sm_filter = SourceModelCatalogFilter()
+
+        self.assertTrue(np.array_equal([True, False, False],
+                sm_filter.select_eqs(self.sm_geometry, eq_catalog)))
+
+    def test_source_model_bbox(self):
+        sm_geometries = [self.sm_geometry,
+            build_geometry([1.0, -1.0, 1.5, -1.0, 1.5, 0.0])]
+
+        self.assertEqual((-0.5, -1.0, 1.5, 0.5),
+            source_model_bbox(sm_geometries))
+
     def test_a_bad_polygon_raises_exception(self):
         self.sm_geometry = build_geometry([1, 1, 1, 2, 2, 1, 2, 2])
         sm_filter = SourceModelCatalogFilter()
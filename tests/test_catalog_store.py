@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2010-2012, GEM Foundation.
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from mtoolkit.catalog_store import PartitionedCatalogStore, convert_catalog
+from mtoolkit.eqcatalog import EqEntryReader, EqCatalog, EqRowPredicates
+from mtoolkit.jobs import read_eq_catalog
+
+from tests.helper import create_context
+
+from nrml.nrml_xml import get_data_path, DATA_DIR
+
+
+class PartitionedCatalogStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog_filename = get_data_path(
+            'gcmt_Indonesia_mtk_format1.csv', DATA_DIR)
+        with open(self.catalog_filename) as eq_catalog:
+            self.eq_catalog = EqCatalog.merge(
+                [EqEntryReader(eq_catalog).read_catalog()])
+
+        self.store_dir = os.path.join(tempfile.mkdtemp(), 'store')
+        self.store = convert_catalog(self.catalog_filename, self.store_dir)
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.store_dir))
+
+    def test_stored_catalog_is_time_sorted(self):
+        self.assertEqual(list(self.eq_catalog), list(self.store.read()))
+
+    def test_partitions_span_year_ranges(self):
+        self.assertEqual(['years_1970_1979.npy', 'years_1980_1989.npy',
+            'years_1990_1999.npy', 'years_2000_2009.npy',
+            'years_2010_2019.npy'],
+            [partition['file'] for partition in self.store.partitions])
+        self.assertEqual(len(self.eq_catalog),
+            sum(partition['rows'] for partition in self.store.partitions))
+
+        stats = self.store.partitions[0]['stats']
+        self.assertEqual([1976, 1979], stats['year'])
+        self.assertEqual(self.store.partitions,
+            PartitionedCatalogStore(self.store_dir).partitions)
+
+    def test_partitions_are_pruned(self):
+        predicates = EqRowPredicates(years=(1985, 1995))
+        self.assertEqual(['years_1980_1989.npy', 'years_1990_1999.npy'],
+            [partition['file'] for partition in
+                self.store.select_partitions(predicates)])
+
+        predicates = EqRowPredicates(min_mw=8.5)
+        max_mw = [partition['stats']['Mw'][1]
+            for partition in self.store.select_partitions(predicates)]
+        self.assertTrue(all(mw >= 8.5 for mw in max_mw))
+        self.assertTrue(len(max_mw) < len(self.store.partitions))
+
+    def test_read_selected_eq_entries(self):
+        for predicates in [EqRowPredicates(years=(1985, 1995)),
+            EqRowPredicates(bbox=(100.0, -5.0, 120.0, 5.0), min_mw=6.0),
+            EqRowPredicates(years=(1900, 1950))]:
+
+            selected = predicates.select_store(self.eq_catalog.data)
+            self.assertEqual(
+                list(EqCatalog(self.eq_catalog.data[selected])),
+                list(self.store.read(predicates)))
+
+    def test_partitions_are_memory_mapped(self):
+        store = PartitionedCatalogStore.write(self.store_dir,
+            self.eq_catalog, partition_years=100)
+
+        self.assertEqual(['years_1900_1999.npy', 'years_2000_2099.npy'],
+            [partition['file'] for partition in store.partitions])
+        eq_catalog = store.read(EqRowPredicates(years=(2000, 2020)))
+        self.assertEqual(store.partitions[1]['rows'], len(eq_catalog))
+        self.assertTrue(isinstance(store.read().column('Mw'), np.ndarray))
+
+        store = PartitionedCatalogStore.write(self.store_dir,
+            self.eq_catalog, partition_years=5000)
+        self.assertTrue(isinstance(store.read().column('Mw'), np.memmap))
+
+    def test_read_eq_catalog_from_store(self):
+        context = create_context('config_jobs.yml')
+        context.config['catalog_store'] = self.store_dir
+        context.config['catalog_year_range'] = [1990, 1999]
+        read_eq_catalog(context)
+
+        self.assertEqual(list(self.store.read(EqRowPredicates(
+            years=(1990, 1999)))), list(context.eq_catalog))
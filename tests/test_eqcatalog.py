@@ -16,12 +16,25 @@
 # along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
 
 
+import os
+import csv
+import bz2
+import gzip
+import pickle
+import shutil
+import tempfile
 import unittest
 import filecmp
 from StringIO import StringIO
 
-from mtoolkit.eqcatalog import (EqEntryReader, EqEntryWriter,
-                                MalformedCatalogError, EqEntryValidationError)
+import numpy as np
+
+from mtoolkit.eqcatalog import (EqEntryReader, EqEntryWriter, EqCatalog,
+                                MalformedCatalogError, EqEntryValidationError,
+                                MATRIX_FIELDNAMES, INT_FIELDNAMES,
+                                FLOAT_FIELDNAMES, catalog_compression,
+                                open_catalog, lzma, EqRowPredicates,
+                                catalog_byte_ranges)
 
 from nrml.nrml_xml import get_data_path, DATA_DIR
 
@@ -206,6 +219,326 @@ class EqEntryReaderTestCase(unittest.TestCase):
         self.assertEqual(0.0, eq_entry[field_name])
 
 
+class EqEntryReaderColumnsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.header = ','.join(FIELDNAMES)
+
+        self.valid_row = ('1,AAA,20000102034913,2000,01,02,03,49,13,0.02,'
+            '7.282,44.368,2.43,1.01,298,9.3,0.5,1.71,0.355,,,,,1.7,0.1')
+
+    def read_columns(self, rows, fields=None):
+        return EqEntryReader(StringIO('\n'.join([self.header] + rows)),
+            fields).read_columns()
+
+    def test_columns_equal_to_eq_entries(self):
+        for filename in ['ISC_small_data.csv', 'ISC_correct.csv',
+                         'gcmt_Indonesia_mtk_format1.csv']:
+            eq_entries = EqEntryReader(open(get_data_path(filename,
+                DATA_DIR))).read_eq_catalog()
+            eq_catalog = EqCatalog.from_columns(EqEntryReader(open(
+                get_data_path(filename, DATA_DIR))).read_columns())
+
+            self.assertEqual(len(eq_entries), len(eq_catalog))
+            self.assertEqual(eq_entries, list(eq_catalog))
+
+    def test_columns_types(self):
+        columns = self.read_columns([self.valid_row])
+
+        self.assertEqual(np.int64, columns['year'].dtype)
+        self.assertEqual(np.float64, columns['Mw'].dtype)
+        self.assertTrue(np.isnan(columns['Ms'][0]))
+        self.assertEqual('AAA', columns['Agency'][0])
+
+    def test_invalid_non_compulsory_values_are_blanked(self):
+        row = self.valid_row.split(',')
+        row[8] = '61'
+        row[18] = ''
+        row[20] = '-0.1'
+        columns = self.read_columns([','.join(row)])
+
+        self.assertTrue(np.isnan(columns['second'][0]))
+        self.assertEqual(0.0, columns['sigmaMw'][0])
+        self.assertTrue(np.isnan(columns['sigmaMs'][0]))
+
+    def test_invalid_compulsory_value_raise_exception(self):
+        invalid_year = self.valid_row.replace(',2000,', ',22015,')
+        invalid_depth = self.valid_row.replace(',9.3,', ',,')
+
+        for invalid_row in [invalid_year, invalid_depth]:
+            rows = [self.valid_row, self.valid_row, invalid_row]
+            self.assertRaises(EqEntryValidationError,
+                self.read_columns, rows)
+
+    def test_row_with_extra_fields_raise_exception(self):
+        rows = [self.valid_row, self.valid_row + ',1.0']
+
+        try:
+            self.read_columns(rows)
+        except EqEntryValidationError as exc:
+            self.assertEqual(None, exc.field)
+            self.assertEqual(['1.0'], exc.value)
+            self.assertEqual(3, exc.line_number)
+        else:
+            self.fail('EqEntryValidationError not raised')
+
+    def test_overflowing_event_id_raise_exception(self):
+        rows = [self.valid_row, '12345678901234567890' + self.valid_row[1:]]
+
+        try:
+            self.read_columns(rows)
+        except EqEntryValidationError as exc:
+            self.assertEqual('eventID', exc.field)
+            self.assertEqual('12345678901234567890', exc.value)
+            self.assertEqual(3, exc.line_number)
+        else:
+            self.fail('EqEntryValidationError not raised')
+
+    def test_projected_columns(self):
+        columns = self.read_columns([self.valid_row], MATRIX_FIELDNAMES)
+        all_columns = self.read_columns([self.valid_row])
+
+        for field in MATRIX_FIELDNAMES + ['depth', 'Identifier']:
+            self.assertTrue(np.array_equal(all_columns[field],
+                columns[field]))
+        for field in ['second', 'SemiMajor90', 'ErrorStrike', 'ML']:
+            self.assertTrue(np.isnan(columns[field][0]))
+        self.assertEqual('', columns['Agency'][0])
+
+        columns = self.read_columns([self.valid_row], ['SemiMinor90'])
+        for field in ['SemiMajor90', 'SemiMinor90', 'ErrorStrike']:
+            self.assertEqual(all_columns[field][0], columns[field][0])
+
+    def test_projection_validates_compulsory_fields(self):
+        invalid_depth = self.valid_row.replace(',9.3,', ',,')
+
+        self.assertRaises(EqEntryValidationError, self.read_columns,
+            [self.valid_row, invalid_depth], ['Mw'])
+
+    def test_predicates_skip_rows(self):
+        rows = [self.valid_row,
+            self.valid_row.replace(',7.282,', ',17.282,'),
+            self.valid_row.replace(',2000,', ',1990,'),
+            self.valid_row.replace(',1.71,', ',0.71,'),
+            self.valid_row.replace('1,AAA', '5,AAA')]
+        predicates = EqRowPredicates((5.0, 40.0, 10.0, 50.0), (1995, 2005),
+            1.0)
+        reader = EqEntryReader(StringIO('\n'.join([self.header] + rows)),
+            predicates=predicates)
+        columns = reader.read_columns()
+
+        self.assertTrue(np.array_equal([1, 5], columns['eventID']))
+        self.assertEqual(5, reader.read_rows)
+        self.assertEqual(3, reader.skipped_rows)
+
+    def test_predicates_keep_line_numbers(self):
+        rows = [self.valid_row.replace(',2000,', ',1990,'),
+            self.valid_row, self.valid_row.replace(',01,', ',13,', 1)]
+        predicates = EqRowPredicates(years=(1995, 2005))
+        reader = EqEntryReader(StringIO('\n'.join([self.header] + rows)),
+            predicates=predicates)
+
+        try:
+            reader.read_columns(chunk_size=2)
+        except EqEntryValidationError as exc:
+            self.assertEqual(4, exc.line_number)
+        else:
+            self.fail('EqEntryValidationError not raised')
+
+    def test_predicates_keep_invalid_rows(self):
+        invalid_longitude = self.valid_row.replace(',7.282,', ',abc,')
+        reader = EqEntryReader(StringIO('\n'.join([self.header,
+            invalid_longitude])), predicates=EqRowPredicates(
+            (5.0, 40.0, 10.0, 50.0)))
+
+        self.assertRaises(EqEntryValidationError, reader.read_columns)
+
+    def test_exception_reports_first_invalid_line(self):
+        invalid_month = self.valid_row.replace(',01,', ',13,')
+        invalid_eventid = 'a' + self.valid_row
+        rows = [self.valid_row, invalid_month, invalid_eventid]
+
+        try:
+            self.read_columns(rows)
+        except EqEntryValidationError as exc:
+            self.assertEqual('month', exc.args[0])
+            self.assertTrue(exc.args[1].endswith('line number: 3'))
+        else:
+            self.fail('EqEntryValidationError not raised')
+
+    def test_chunked_columns_equal_to_columns(self):
+        filename = get_data_path('gcmt_Indonesia_mtk_format1.csv', DATA_DIR)
+        columns = EqEntryReader(open(filename)).read_columns()
+
+        for chunk_size in [1, 1000, 10000]:
+            chunked_columns = EqEntryReader(open(filename)).read_columns(
+                chunk_size)
+
+            for field in FIELDNAMES:
+                self.assertTrue(np.array_equal(columns[field],
+                    chunked_columns[field]) or np.allclose(columns[field],
+                    chunked_columns[field], equal_nan=True))
+
+    def test_exception_can_be_pickled(self):
+        exc = pickle.loads(pickle.dumps(
+            EqEntryValidationError('year', -1, 3, 'catalog.csv')))
+
+        self.assertEqual(('year', -1, 3, 'catalog.csv'),
+            (exc.field, exc.value, exc.line_number, exc.filename))
+        self.assertTrue(exc.args[1].endswith(
+            'line number: 3 of file: catalog.csv'))
+
+    def test_chunked_exception_reports_line(self):
+        invalid_latitude = self.valid_row.replace(',44.368,', ',91,')
+        rows = [self.valid_row] * 4 + [invalid_latitude]
+        reader = EqEntryReader(StringIO('\n'.join([self.header] + rows)))
+
+        try:
+            reader.read_columns(chunk_size=2)
+        except EqEntryValidationError as exc:
+            self.assertEqual('latitude', exc.args[0])
+            self.assertTrue(exc.args[1].endswith('line number: 6'))
+        else:
+            self.fail('EqEntryValidationError not raised')
+
+    def test_empty_catalog_columns(self):
+        for chunk_size in [None, 10]:
+            reader = EqEntryReader(StringIO(self.header))
+            columns = reader.read_columns(chunk_size)
+
+            self.assertEqual(0, len(columns['Mw']))
+
+
+class OpenCatalogTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog_filename = get_data_path(
+            'gcmt_Indonesia_mtk_format1.csv', DATA_DIR)
+        self.catalog_dir = tempfile.mkdtemp()
+
+        with open(self.catalog_filename) as eq_catalog:
+            self.eq_catalog = EqEntryReader(eq_catalog).read_catalog()
+
+    def tearDown(self):
+        shutil.rmtree(self.catalog_dir)
+
+    def compress(self, open_compressed, extension):
+        compressed_filename = os.path.join(self.catalog_dir,
+            'catalog.csv.%s' % extension)
+        compressed_file = open_compressed(compressed_filename, 'wb')
+        compressed_file.write(open(self.catalog_filename, 'rb').read())
+        compressed_file.close()
+        return compressed_filename
+
+    def test_plain_catalog(self):
+        self.assertEqual(None, catalog_compression(self.catalog_filename))
+
+    def test_compressed_catalogs_are_decompressed(self):
+        for open_compressed, extension, compression in [
+            (gzip.open, 'gz', 'gzip'), (bz2.BZ2File, 'bz2', 'bz2')]:
+
+            compressed_filename = self.compress(open_compressed, extension)
+            self.assertEqual(compression,
+                catalog_compression(compressed_filename))
+
+            with open_catalog(compressed_filename) as eq_catalog:
+                self.assertEqual(list(self.eq_catalog),
+                    list(EqEntryReader(eq_catalog).read_catalog(1000)))
+
+    def test_xz_catalog(self):
+        xz_filename = os.path.join(self.catalog_dir, 'catalog.csv.xz')
+        with open(xz_filename, 'wb') as xz_file:
+            xz_file.write('\xfd7zXZ\x00')
+
+        self.assertEqual('xz', catalog_compression(xz_filename))
+        if lzma is None:
+            self.assertRaises(IOError, open_catalog, xz_filename)
+        else:
+            xz_filename = self.compress(lzma.open, 'xz')
+            with open_catalog(xz_filename) as eq_catalog:
+                self.assertEqual(list(self.eq_catalog),
+                    list(EqEntryReader(eq_catalog).read_catalog()))
+
+
+    def test_byte_ranges(self):
+        size = os.path.getsize(self.catalog_filename)
+        ranges = catalog_byte_ranges(self.catalog_filename, 0, size, 7)
+        self.assertEqual(7, len(ranges))
+        self.assertEqual(size, ranges[-1][1])
+
+        eq_catalogs = []
+        for start, end in ranges:
+            with open(self.catalog_filename) as eq_catalog:
+                reader = EqEntryReader(eq_catalog)
+                reader.select_range(start, end)
+                eq_catalogs.append(reader.read_catalog())
+                # ranges begin at the start of a line
+                eq_catalog.seek(start - 1)
+                self.assertEqual('\n', eq_catalog.read(1))
+
+        self.assertEqual(list(self.eq_catalog),
+            list(EqCatalog.concatenate(eq_catalogs)))
+
+
+class EqCatalogTestCase(unittest.TestCase):
+
+    def setUp(self):
+        with open(get_data_path('ISC_small_data.csv', DATA_DIR)) as catalog:
+            self.eq_entries = EqEntryReader(catalog).read_eq_catalog()
+
+        with open(get_data_path('ISC_small_data.csv', DATA_DIR)) as catalog:
+            self.eq_catalog = EqEntryReader(catalog).read_catalog()
+
+    def test_eq_entries_from_store(self):
+        self.assertEqual(len(self.eq_entries), len(self.eq_catalog))
+        self.assertEqual(self.eq_entries, list(self.eq_catalog))
+        self.assertEqual(self.eq_entries[3:6],
+            list(self.eq_catalog.entries([3, 4, 5])))
+
+    def test_matrix_is_a_view_over_the_store(self):
+        matrix = self.eq_catalog.matrix
+        expected_matrix = np.array([[eq_entry[field]
+            for field in MATRIX_FIELDNAMES] for eq_entry in self.eq_entries])
+
+        self.assertTrue(np.array_equal(expected_matrix, matrix))
+        self.assertTrue(np.may_share_memory(matrix, self.eq_catalog.data))
+
+    def test_merged_catalogs_are_time_sorted(self):
+        first_catalog = EqCatalog(self.eq_catalog.data[[4, 0, 2]])
+        second_catalog = EqCatalog(self.eq_catalog.data[[3, 1]])
+        merged_catalog = EqCatalog.merge([first_catalog, second_catalog])
+
+        self.assertEqual(list(self.eq_catalog.entries(range(5))),
+            list(merged_catalog))
+
+    def test_column_is_a_view_over_the_store(self):
+        mw = self.eq_catalog.column('Mw')
+
+        self.assertEqual([eq_entry['Mw'] for eq_entry in self.eq_entries],
+            list(mw))
+        self.assertTrue(np.may_share_memory(mw, self.eq_catalog.data))
+
+    def test_lookup_by_event_id(self):
+        event_ids = [self.eq_entries[row]['eventID'] for row in [7, 2, 5]]
+
+        self.assertEqual(self.eq_entries[7], self.eq_catalog.event(
+            event_ids[0]))
+        self.assertEqual([7, 2, 5], list(self.eq_catalog.rows(event_ids)))
+        self.assertRaises(KeyError, self.eq_catalog.event, -1)
+
+    def test_duplicate_event_ids(self):
+        self.assertEqual(0, len(self.eq_catalog.duplicate_event_ids()))
+
+        eq_catalog = EqCatalog.concatenate([self.eq_catalog,
+            EqCatalog(self.eq_catalog.data[[3, 1]])])
+        self.assertEqual(sorted([self.eq_entries[1]['eventID'],
+            self.eq_entries[3]['eventID']]),
+            list(eq_catalog.duplicate_event_ids()))
+        # duplicated eventIDs are looked up in their first row
+        self.assertEqual([3, 1], list(eq_catalog.rows(
+            [self.eq_entries[3]['eventID'], self.eq_entries[1]['eventID']])))
+
+
 class EqEntryWriterTestCase(unittest.TestCase):
 
     def setUp(self):
@@ -250,3 +583,47 @@ class EqEntryWriterTestCase(unittest.TestCase):
 
         self.assertTrue(filecmp.cmp(self.expected_csv,
             self.pprocessing_result_filename))
+
+    def _eq_catalog(self, rows):
+        columns = dict((field, np.array([row[field] for row in rows]))
+            for field in INT_FIELDNAMES + ['Agency'])
+        for field in FLOAT_FIELDNAMES:
+            columns[field] = np.array([row[field] if row[field] != ''
+                else np.nan for row in rows], dtype=float)
+        return EqCatalog.from_columns(columns)
+
+    def test_write_catalog_as_write_rows(self):
+        eq_catalog = self._eq_catalog(
+            [self.first_data_row, self.second_data_row])
+        self.writer.write_catalog(eq_catalog)
+
+        self.assertTrue(filecmp.cmp(self.expected_csv,
+            self.pprocessing_result_filename))
+
+    def test_write_catalog_selected_rows(self):
+        eq_catalog = self._eq_catalog(
+            [self.second_data_row, self.first_data_row])
+        self.writer.write_catalog(eq_catalog, np.array([1, 0]))
+
+        self.assertTrue(filecmp.cmp(self.expected_csv,
+            self.pprocessing_result_filename))
+
+    def test_write_catalog_quotes_strings(self):
+        self.first_data_row['Agency'] = 'A,"B"'
+        self.writer.write_catalog(self._eq_catalog([self.first_data_row]))
+
+        written_rows = list(csv.DictReader(
+            open(self.pprocessing_result_filename)))
+        self.assertEqual('A,"B"', written_rows[0]['Agency'])
+
+    def test_write_catalog_extra_columns(self):
+        eq_catalog = self._eq_catalog(
+            [self.first_data_row, self.second_data_row])
+        self.writer.write_catalog(eq_catalog, extra_columns=[
+            ('vcl', np.array([0, 1])), ('flag_vector', np.array([0, -1]))])
+
+        output = open(self.pprocessing_result_filename).read().splitlines()
+        self.assertEqual(FIELDNAMES + ['vcl', 'flag_vector'],
+            output[0].split(','))
+        self.assertTrue(output[1].endswith(',1.7,0.1,0,0'))
+        self.assertTrue(output[2].endswith(',,,1,-1'))
@@ -17,11 +17,14 @@
 # version 3 along with MToolkit. If not, see
 # <http://www.gnu.org/licenses/lgpl-3.0.txt> for a copy of the LGPLv3 License.
 
-from mock import Mock
+from mock import Mock, patch
 
 import numpy as np
 
+import os
+import shutil
 import filecmp
+import tempfile
 
 import unittest
 
@@ -35,7 +38,9 @@ from mtoolkit.source_model import (AreaSource, AREA_BOUNDARY, POINT,
                                     default_area_source)
 
 from mtoolkit.jobs import (read_eq_catalog, read_source_model,
-                           gardner_knopoff, afteran, stepp,
+                           create_catalog_matrix, deduplication,
+                           catalog_projection, catalog_predicates,
+                           gardner_knopoff, afteran, reasenberg, stepp,
                            store_preprocessed_catalog,
                            store_completeness_table,
                            retrieve_completeness_table,
@@ -43,11 +48,22 @@ from mtoolkit.jobs import (read_eq_catalog, read_source_model,
                            create_default_source_model,
                            maximum_magnitude)
 
+from mtoolkit.eqcatalog import (EqEntryReader, EqEntryValidationError,
+                                FIELDNAMES, MATRIX_FIELDNAMES,
+                                TIME_FIELDNAMES)
+
+from mtoolkit.scientific.catalogue_utilities import epoch_time
+
 from nrml.nrml_xml import get_data_path, DATA_DIR
 
 RUPTURE_KEY = 'rupture_rate_model'
 
 
+def read_eq_catalog_entries(filename):
+    with open(filename) as eq_catalog:
+        return EqEntryReader(eq_catalog).read_eq_catalog()
+
+
 class JobsTestCase(unittest.TestCase):
 
     def setUp(self):
@@ -76,6 +92,86 @@ class JobsTestCase(unittest.TestCase):
         self.assertEqual(expected_first_eq_entry,
                 self.context_jobs.eq_catalog[0])
 
+    def _split_catalog_by_agency(self, catalog_dir):
+        lines = open(self.context_jobs.config['eq_catalog_file']).readlines()
+        for agency in ['AAA', 'FFG']:
+            with open(os.path.join(catalog_dir, '%s.csv' % agency), 'w') \
+                as agency_file:
+                agency_file.write(lines[0])
+                agency_file.writelines(line for line in lines[1:]
+                    if line.split(',')[1] == agency)
+
+    def test_read_multiple_eq_catalogs(self):
+        expected_catalog = read_eq_catalog_entries(
+            self.context_jobs.config['eq_catalog_file'])
+
+        catalog_dir = tempfile.mkdtemp()
+        try:
+            self._split_catalog_by_agency(catalog_dir)
+            self.context_jobs.config['eq_catalog_file'] = [
+                os.path.join(catalog_dir, 'FFG.csv'),
+                os.path.join(catalog_dir, 'A*.csv')]
+            read_eq_catalog(self.context_jobs)
+        finally:
+            shutil.rmtree(catalog_dir)
+
+        self.assertEqual(expected_catalog, list(self.context_jobs.eq_catalog))
+
+    def test_multiple_eq_catalogs_errors_report_file(self):
+        catalog_dir = tempfile.mkdtemp()
+        try:
+            self._split_catalog_by_agency(catalog_dir)
+            invalid_filename = os.path.join(catalog_dir, 'FFG.csv')
+            lines = open(invalid_filename).readlines()
+            lines[2] = lines[2].replace(',2000,', ',3000,')
+            open(invalid_filename, 'w').writelines(lines)
+
+            self.context_jobs.config['eq_catalog_file'] = os.path.join(
+                catalog_dir, '*.csv')
+            read_eq_catalog(self.context_jobs)
+        except EqEntryValidationError as exc:
+            self.assertTrue(exc.args[1].endswith(
+                'line number: 3 of file: %s' % invalid_filename))
+        else:
+            self.fail('EqEntryValidationError not raised')
+        finally:
+            shutil.rmtree(catalog_dir)
+
+    def test_read_eq_catalog_byte_ranges(self):
+        filename = get_data_path('gcmt_Indonesia_mtk_format1.csv', DATA_DIR)
+        expected_catalog = read_eq_catalog_entries(filename)
+
+        self.context_jobs.config['eq_catalog_file'] = filename
+        self.context_jobs.config['catalog_workers'] = 3
+        with patch('mtoolkit.jobs.MIN_RANGE_SIZE', 1024):
+            read_eq_catalog(self.context_jobs)
+
+        self.assertEqual(expected_catalog, list(self.context_jobs.eq_catalog))
+
+    def test_byte_ranges_errors_report_line_number(self):
+        catalog_dir = tempfile.mkdtemp()
+        try:
+            invalid_filename = os.path.join(catalog_dir, 'catalog.csv')
+            lines = open(get_data_path('gcmt_Indonesia_mtk_format1.csv',
+                DATA_DIR)).readlines()
+            invalid_line = len(lines) - 10
+            lines[invalid_line - 1] = '-1' + lines[invalid_line - 1][
+                lines[invalid_line - 1].index(','):]
+            open(invalid_filename, 'w').writelines(lines)
+
+            self.context_jobs.config['eq_catalog_file'] = invalid_filename
+            self.context_jobs.config['catalog_workers'] = 3
+            with patch('mtoolkit.jobs.MIN_RANGE_SIZE', 1024):
+                read_eq_catalog(self.context_jobs)
+        except EqEntryValidationError as exc:
+            self.assertTrue(exc.args[1].endswith(
+                'line number: %s of file: %s' % (invalid_line,
+                invalid_filename)))
+        else:
+            self.fail('EqEntryValidationError not raised')
+        finally:
+            shutil.rmtree(catalog_dir)
+
     def test_read_smodel(self):
         asource = AreaSource()
         asource.nrml_id = "n1"
@@ -114,6 +210,100 @@ class JobsTestCase(unittest.TestCase):
 
         self.assertEqual(default_as, self.context_jobs.sm_definitions)
 
+    def test_catalog_projection(self):
+        self.assertEqual(None, catalog_projection(self.context_jobs.config))
+
+        self.context_jobs.config['pprocessing_result_file'] = None
+        self.assertEqual(MATRIX_FIELDNAMES, [field for field in FIELDNAMES
+            if field in catalog_projection(self.context_jobs.config)])
+
+        self.context_jobs.config['preprocessing_jobs'] = ['Deduplication']
+        self.assertEqual(set(MATRIX_FIELDNAMES + TIME_FIELDNAMES +
+            ['Agency']), set(catalog_projection(self.context_jobs.config)))
+
+        self.context_jobs.config['preprocessing_jobs'] = ['Reasenberg']
+        self.assertEqual(set(MATRIX_FIELDNAMES + TIME_FIELDNAMES),
+            set(catalog_projection(self.context_jobs.config)))
+
+    def test_read_eq_catalog_with_predicates(self):
+        self.context_jobs.config['catalog_year_range'] = [2000, 2000]
+        self.context_jobs.config['catalog_min_mw'] = 3.0
+        read_eq_catalog(self.context_jobs)
+
+        self.assertTrue(np.all(self.context_jobs.eq_catalog.column('Mw') >=
+            3.0))
+        self.assertEqual(4, len(self.context_jobs.eq_catalog))
+
+    def test_catalog_predicates(self):
+        self.assertEqual(None, catalog_predicates(self.context_jobs))
+
+        self.context_jobs.config['catalog_source_model_bbox'] = True
+        read_source_model(self.context_jobs)
+        predicates = catalog_predicates(self.context_jobs)
+
+        self.assertEqual((-122.5, 37.5, -121.5, 38.5), predicates.bbox)
+        self.assertEqual(None, predicates.years)
+
+    def test_deduplication(self):
+        read_eq_catalog(self.context_jobs)
+        create_catalog_matrix(self.context_jobs)
+        mocked_func = Mock(return_value=(
+            np.array([1, 1, 0, 0, 0, 0, 0, 0, 0, 0]),
+            np.array([0, 1, 0, 0, 0, 0, 0, 0, 0, 0])))
+        self.context_jobs.map_sc['deduplication'] = mocked_func
+        deduplication(self.context_jobs)
+
+        self.assertTrue(mocked_func.called)
+        self.assertEqual((['FFG', 'AAA'], 16000000, 100.0, 0.5),
+            mocked_func.call_args[0][5:])
+        self.assertTrue(np.array_equal([0, 2, 3, 4, 5, 6, 7, 8, 9],
+            self.context_jobs.working_index))
+        self.assertTrue(np.array_equal([0, 1, 0, 0, 0, 0, 0, 0, 0, 0],
+            self.context_jobs.flag_vector))
+
+    def test_deduplication_and_afteran_pipeline(self):
+        read_eq_catalog(self.context_jobs)
+        create_catalog_matrix(self.context_jobs)
+        self.context_jobs.map_sc['deduplication'] = Mock(return_value=(
+            np.array([1, 1, 0, 0, 0, 0, 0, 0, 0, 0]),
+            np.array([0, 1, 0, 0, 0, 0, 0, 0, 0, 0])))
+        self.context_jobs.map_sc['afteran'] = Mock(
+            wraps=self.context_jobs.map_sc['afteran'])
+        deduplication(self.context_jobs)
+        afteran(self.context_jobs)
+
+        # Afteran runs on the events left by Deduplication
+        self.assertTrue(np.array_equal(self.context_jobs.catalog_matrix[
+            [0, 2, 3, 4, 5, 6, 7, 8, 9]],
+            self.context_jobs.map_sc['afteran'].call_args[0][0]))
+        self.assertEqual(1, self.context_jobs.flag_vector[1])
+        self.assertEqual(0, self.context_jobs.vcl[1])
+        self.assertFalse(1 in self.context_jobs.working_index)
+
+    def test_store_clusters_after_deduplication(self):
+        self.context_jobs.config['pprocessing_result_clusters'] = True
+        read_eq_catalog(self.context_jobs)
+        create_catalog_matrix(self.context_jobs)
+        self.context_jobs.map_sc['deduplication'] = Mock(return_value=(
+            np.array([1, 1, 0, 0, 0, 0, 0, 0, 0, 0]),
+            np.array([0, 1, 0, 0, 0, 0, 0, 0, 0, 0])))
+        deduplication(self.context_jobs)
+        gardner_knopoff(self.context_jobs)
+        self.context_jobs.selected_eq_vector = np.zeros(10)
+        store_preprocessed_catalog(self.context_jobs)
+
+        with open(self.context_jobs.config['pprocessing_result_file']) as \
+            stored:
+            lines = stored.read().splitlines()
+
+        self.assertTrue(lines[0].endswith(',vcl,flag_vector'))
+        self.assertEqual(11, len(lines))
+        for line in lines[1:]:
+            vcl, flag = line.split(',')[-2:]
+            self.assertEqual(str(int(vcl)), vcl)
+            self.assertEqual(str(int(flag)), flag)
+        self.assertTrue(lines[2].endswith(',0,1'))
+
     def test_parameters_gardner_knopoff(self):
         mocked_func = Mock(return_value=([], [], []))
         self.context_jobs.map_sc['gardner_knopoff'] = mocked_func
@@ -121,7 +311,7 @@ class JobsTestCase(unittest.TestCase):
 
         self.assertTrue(mocked_func.called)
 
-        mocked_func.assert_called_with(None, 'GardnerKnopoff', 0.5)
+        mocked_func.assert_called_with(None, 'GardnerKnopoff', 0.5, None)
 
     def test_parameters_afteran(self):
         mocked_func = Mock(return_value=([], [], []))
@@ -130,7 +320,61 @@ class JobsTestCase(unittest.TestCase):
 
         self.assertTrue(mocked_func.called)
 
-        mocked_func.assert_called_with(None, 'Uhrhammer', 150.8)
+        mocked_func.assert_called_with(None, 'Uhrhammer', 150.8, None)
+
+    def test_parameters_afteran_tiled(self):
+        context = create_context('config_afteran_tiled.yml')
+        mocked_func = Mock(return_value=([], [], []))
+        context.map_sc['afteran'] = mocked_func
+        afteran(context)
+
+        mocked_func.assert_called_with(None, 'Uhrhammer', 150.8, None,
+            tiles=4, workers=2)
+
+    def test_afteran_projected_distances(self):
+        read_eq_catalog(self.context_jobs)
+        create_catalog_matrix(self.context_jobs)
+        self.context_jobs.map_sc['afteran'] = Mock(
+            wraps=self.context_jobs.map_sc['afteran'])
+        self.context_jobs.config['Afteran']['projection_tolerance'] = 1e4
+        afteran(self.context_jobs)
+
+        derived = self.context_jobs.map_sc['afteran'].call_args[0][3]
+        self.assertTrue(derived.projection is not None)
+        self.assertTrue(self.context_jobs.working_derived.projection is None)
+
+        # the catalogue extent exceeds a zero tolerance
+        self.context_jobs.config['Afteran']['projection_tolerance'] = 0.
+        afteran(self.context_jobs)
+
+        derived = self.context_jobs.map_sc['afteran'].call_args[0][3]
+        self.assertTrue(derived.projection is None)
+
+    def test_parameters_reasenberg(self):
+        mocked_func = Mock(return_value=([], [], []))
+        self.context_jobs.map_sc['reasenberg'] = mocked_func
+        reasenberg(self.context_jobs)
+
+        self.assertTrue(mocked_func.called)
+
+        mocked_func.assert_called_with(None, 12.0, 2.0, 0.5, 1.0, 10.0,
+            0.95, None)
+
+    def test_reasenberg_epoch_time_with_seconds(self):
+        # the catalog fields are projected on the used ones
+        self.context_jobs.config['pprocessing_result_file'] = None
+        self.context_jobs.config['preprocessing_jobs'] = ['Reasenberg']
+        read_eq_catalog(self.context_jobs)
+        create_catalog_matrix(self.context_jobs)
+        self.context_jobs.map_sc['reasenberg'] = Mock(return_value=(
+            np.zeros(10, dtype=int), np.zeros(10), np.zeros(10, dtype=int)))
+        reasenberg(self.context_jobs)
+
+        derived = self.context_jobs.map_sc['reasenberg'].call_args[0][7]
+        # 2000-01-02 03:49:13
+        self.assertEqual(epoch_time(np.array([2000.]), np.array([1]),
+            np.array([2]), np.array([3]), np.array([49]),
+            np.array([13.]))[0], derived.epoch_time[0])
 
     def test_parameters_stepp(self):
         self.context_jobs.working_catalog = np.array([[1, 2, 3, 4, 5, 6]])
@@ -17,6 +17,7 @@
 
 
 import unittest
+import numpy as np
 from mock import Mock, MagicMock
 
 from mtoolkit.workflow import (PipeLine, PreprocessingBuilder,
@@ -24,6 +25,8 @@ from mtoolkit.workflow import (PipeLine, PreprocessingBuilder,
 
 from mtoolkit.workflow import Workflow
 
+from mtoolkit.eqcatalog import EqCatalog, EqEntryReader
+
 from mtoolkit.jobs import (read_eq_catalog, create_catalog_matrix,
                             gardner_knopoff, stepp, recurrence,
                             read_source_model, create_default_source_model,
@@ -61,6 +64,75 @@ class ContextTestCase(unittest.TestCase):
         self.assertEqual(expected_config_dict,
             self.context_preprocessing.config)
 
+    def test_select_working_rows(self):
+        context = Context()
+        context.catalog_matrix = np.arange(10).reshape((5, 2))
+
+        self.assertTrue(context.working_catalog is context.catalog_matrix)
+
+        context.select_working_rows(np.array([True, False, True, True, True]))
+        context.select_working_rows(np.array([False, True, True, False]))
+
+        self.assertTrue(np.array_equal([2, 3], context.working_index))
+        self.assertTrue(np.array_equal(context.catalog_matrix[[2, 3]],
+            context.working_catalog))
+
+        context.working_index = None
+
+        self.assertTrue(context.working_catalog is context.catalog_matrix)
+
+    def test_working_derived(self):
+        context = Context()
+
+        self.assertEqual(None, context.working_derived)
+
+        context.eq_catalog = EqCatalog.from_columns(EqEntryReader(open(
+            get_data_path('ISC_small_data.csv', DATA_DIR))).read_columns())
+
+        self.assertTrue(context.working_derived is context.eq_catalog.derived)
+
+        context.working_index = np.array([2, 0])
+
+        self.assertTrue(np.array_equal(
+            context.eq_catalog.data['latitude'][[2, 0]],
+            context.working_derived.latitude))
+
+        context.working_catalog = np.zeros((2, 7))
+
+        self.assertEqual(None, context.working_derived)
+
+    def test_current_filtered_eq_index(self):
+        context = Context()
+        context.catalog_matrix = np.arange(12.).reshape(4, 3)
+        context.working_index = np.array([1, 2, 3])
+
+        self.assertTrue(context.current_filtered_eq is
+            context.working_catalog)
+
+        context.current_index = context.working_rows([True, False, True])
+
+        self.assertTrue(np.array_equal([1, 3], context.current_index))
+        self.assertTrue(np.array_equal([4., 10.], context.current_column(1)))
+        self.assertTrue(np.array_equal(context.catalog_matrix[[1, 3]],
+            context.current_filtered_eq))
+
+        context.current_filtered_eq = np.zeros((1, 3))
+
+        self.assertTrue(np.array_equal([0.], context.current_column(1)))
+
+    def test_working_column(self):
+        context = Context()
+        context.catalog_matrix = np.arange(12.).reshape(4, 3)
+        context.working_index = np.array([1, 3])
+
+        self.assertTrue(np.array_equal([4., 10.], context.working_column(1)))
+        # the working catalog isn't copied for a column
+        self.assertTrue(context._working_catalog is None)
+
+        context.working_catalog = np.zeros((1, 3))
+
+        self.assertTrue(np.array_equal([0.], context.working_column(1)))
+
 
 class PipeLineTestCase(unittest.TestCase):
 
@@ -163,6 +235,14 @@ class PipeLineBuilderTestCase(unittest.TestCase):
         self.assertEqual(expected_preprocessing_pipeline,
             pprocessing_built_pipeline)
 
+    def test_build_pipeline_source_model_bbox(self):
+        self.context_preprocessing.config['catalog_source_model_bbox'] = True
+        pprocessing_built_pipeline = self.preprocessing_builder.build(
+            self.context_preprocessing.config)
+
+        self.assertEqual([read_source_model, read_eq_catalog],
+            pprocessing_built_pipeline.jobs[:2])
+
     def test_build_pipeline_preprocessing_jobs_undefined(self):
         self.context_preprocessing.config['preprocessing_jobs'] = None
         expected_preprocessing_pipeline = PipeLine()
@@ -204,12 +284,13 @@ class PipeLineBuilderTestCase(unittest.TestCase):
 
         # Mocking a generator method
         sm_filter = MagicMock()
-        sm_filter.filter_eqs.return_value.__iter__.return_value = \
-            iter([(dict(a=1), [1]), ((dict(b=2), [2]))])
+        sm_filter.select_eqs.return_value.__iter__.return_value = \
+            iter([(dict(a=1), [True]), ((dict(b=2), [False]))])
 
         workflow.start(context, sm_filter)
 
         self.assertTrue(workflow.preprocessing_pipeline.run.called)
-        self.assertTrue(sm_filter.filter_eqs.called)
+        self.assertTrue(sm_filter.select_eqs.called)
         self.assertTrue(pipeline_processing.run.called)
         self.assertEqual(2, pipeline_processing.run.call_count)
+        self.assertEqual(0, len(context.current_index))